@@ -0,0 +1,225 @@
+import json
+import pickle as pkl
+import time
+import numpy as np
+from os import listdir, makedirs, remove, stat
+from os.path import exists
+
+ARTIFACT_VERSION = 1
+PICKLE_PATH = "../pkl_files/"
+SOURCES = ("dictionary", "sequences", "w2v_vocab")
+
+
+class ArtifactStore:
+    """
+    ArtifactStore keeps the dictionary, corpus sequences and w2v vocabulary as flat numpy arrays.
+
+    Dictionary tokens get consecutive indices and their coords are stored as one dense array.
+    Sequences are stored as a flat array of token indices (and a parallel array of note offsets)
+    together with an index of where every sequence starts, so a single sequence is a slice of
+    memory-mapped files that can be read without loading the rest of the corpus.
+    A JSON manifest describes version, counts and files of the store. A store converted from pickled artifacts
+    also records their modification times and sizes, so a store outdated by regenerated pickles is detected.
+    """
+    def __init__(self, store_path: str = "../pkl_files/artifacts/"):
+        self.__store_path = store_path
+        self.manifest = None
+        self.load_time = None
+
+    def write(self, master_dict: dict, sequence_dict: dict = None, w2v_vocab: dict = None, sources: dict = None):
+        """
+        Write artifacts to the store, replacing its previous content.
+
+        :param master_dict: Dictionary of tokens, every entry has its "coords".
+        :param sequence_dict: Dictionary with "sequences" of tokens and their note "offsets".
+        :param w2v_vocab: Vocabulary with "coords" of the word2vec model.
+        :param sources: Modification times and sizes of pickled artifacts the store was converted from.
+        :return:
+        """
+        makedirs(self.__store_path, exist_ok=True)
+        self.clear()
+
+        tokens = list(master_dict.keys())
+        token_index = {token: index for index, token in enumerate(tokens)}
+        with open(self.__store_path + "tokens.pkl", "wb") as f:
+            pkl.dump(tokens, f)
+        np.save(self.__store_path + "token_coords.npy",
+                np.asarray([master_dict[token]["coords"] for token in tokens], dtype=np.float64))
+
+        self.manifest = {"version": ARTIFACT_VERSION,
+                         "tokens": len(tokens),
+                         "sequences": 0,
+                         "notes": 0,
+                         "vocab": False,
+                         "sources": sources or {}}
+
+        if sequence_dict is not None:
+            sequences = sequence_dict["sequences"]
+            splits = np.zeros(len(sequences) + 1, dtype=np.int64)
+            splits[1:] = np.cumsum([len(sequence) for sequence in sequences])
+            values = np.fromiter((token_index[token] for sequence in sequences for token in sequence),
+                                 dtype=np.int32, count=int(splits[-1]))
+            offsets = np.fromiter((offset for sequence in sequence_dict["offsets"] for offset in sequence),
+                                  dtype=np.float64, count=int(splits[-1]))
+            np.save(self.__store_path + "sequence_splits.npy", splits)
+            np.save(self.__store_path + "sequence_tokens.npy", values)
+            np.save(self.__store_path + "sequence_offsets.npy", offsets)
+            self.manifest["sequences"] = len(sequences)
+            self.manifest["notes"] = int(splits[-1])
+
+        if w2v_vocab is not None:
+            np.save(self.__store_path + "vocab_coords.npy", np.asarray(w2v_vocab["coords"], dtype=np.float64))
+            self.manifest["vocab"] = True
+
+        with open(self.__store_path + "manifest.json", "w") as f:
+            json.dump(self.manifest, f, indent=1)
+
+    def convert(self):
+        """
+        Write the store from pickled artifacts found in ../pkl_files/.
+
+        :return:
+        """
+        from file import load_file, file_exists
+
+        # sources are recorded before loading, a pickle rewritten meanwhile makes the store outdated
+        sources = source_info()
+        self.write(load_file("dictionary"),
+                   load_file("sequences") if file_exists("sequences") else None,
+                   load_file("w2v_vocab") if file_exists("w2v_vocab") else None,
+                   sources)
+
+    def is_current(self):
+        """
+        Check that pickled artifacts did not change since the store was converted from them.
+
+        A store written directly by write() has no recorded sources and is always current.
+
+        :return: True if every recorded pickle still has the same modification time and size
+        and no pickle appeared or disappeared.
+        """
+        if self.manifest is None:
+            self.open()
+        recorded = self.manifest.get("sources", {})
+        return not recorded or recorded == source_info()
+
+    def open(self):
+        """
+        Open the store for reading, arrays are memory-mapped and read only when they are accessed.
+
+        :return:
+        """
+        start = time.perf_counter()
+        with open(self.__store_path + "manifest.json", "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != ARTIFACT_VERSION:
+            raise ValueError("Unsupported artifact store version: " + str(self.manifest["version"]))
+        self.load_time = time.perf_counter() - start
+
+    def close(self):
+        # memory-mapped arrays returned before stay valid until they are released
+        self.manifest = None
+        self.load_time = None
+
+    def token_coords(self):
+        return self.__load("token_coords.npy")
+
+    def vocab_coords(self):
+        if not self.manifest["vocab"]:
+            return None
+        return self.__load("vocab_coords.npy")
+
+    def tokens(self):
+        with open(self.__store_path + "tokens.pkl", "rb") as f:
+            return pkl.load(f)
+
+    def sequences(self):
+        """
+        Map corpus sequences.
+
+        :return: Tuple of RaggedArray objects with token indices and note offsets of every sequence,
+        None if the store has no sequences.
+        """
+        if self.manifest["sequences"] == 0:
+            return None
+        splits = self.__load("sequence_splits.npy")
+        return RaggedArray(self.__load("sequence_tokens.npy"), splits), \
+            RaggedArray(self.__load("sequence_offsets.npy"), splits)
+
+    def stats(self):
+        size = sum(stat(self.__store_path + file).st_size for file in listdir(self.__store_path))
+        return {"tokens": self.manifest["tokens"],
+                "sequences": self.manifest["sequences"],
+                "notes": self.manifest["notes"],
+                "size": size,
+                "load_time": self.load_time}
+
+    def status(self):
+        stats = self.stats()
+        print("Artifact store in: " + self.__store_path + " - (" + str(stats["tokens"]) + " tokens, " +
+              str(stats["sequences"]) + " sequences, " + str(stats["notes"]) + " notes, " +
+              str(stats["size"]) + " bytes, opened in " + "{0:.4f}".format(stats["load_time"] or 0.0) + " s)")
+
+    def exists(self):
+        return exists(self.__store_path + "manifest.json")
+
+    def clear(self):
+        if not exists(self.__store_path):
+            return
+        for file in listdir(self.__store_path):
+            if file.endswith(".npy") or file in ("tokens.pkl", "manifest.json"):
+                remove(self.__store_path + file)
+        self.manifest = None
+
+    def __load(self, file_name: str):
+        start = time.perf_counter()
+        array = np.load(self.__store_path + file_name, mmap_mode="r")
+        self.load_time = (self.load_time or 0.0) + time.perf_counter() - start
+        return array
+
+
+def source_info():
+    """
+    :return: Dictionary with modification time and size of every existing pickled artifact.
+    """
+    info = {}
+    for name in SOURCES:
+        path = PICKLE_PATH + name + ".pkl"
+        if exists(path):
+            status = stat(path)
+            info[name] = {"mtime": status.st_mtime, "size": status.st_size}
+    return info
+
+
+class RaggedArray:
+    """
+    Read-only list of variable-length rows stored as one flat array and row boundaries.
+
+    Indexing returns a view of the flat array, so a row of a memory-mapped array is read
+    without touching the others.
+    """
+    def __init__(self, values, splits):
+        self.values = values
+        self.splits = splits
+
+    def __len__(self):
+        return len(self.splits) - 1
+
+    def __getitem__(self, index: int):
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Index " + str(index) + " is out of bounds for RaggedArray of length " + str(len(self)))
+        return self.values[self.splits[index]:self.splits[index + 1]]
+
+    def lengths(self):
+        return np.diff(self.splits)
+
+
+if __name__ == "__main__":
+    # pickled artifacts are converted into the store
+    store = ArtifactStore()
+    store.convert()
+    store.open()
+    store.status()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+from os import stat
+from os.path import exists
+
+MANIFEST_VERSION = 1
+
+
+class CorpusManifest:
+    """
+    CorpusManifest records what was prepared from every input file of the corpus.
+
+    For each input file it keeps modification time, size and content hash, names of the parts
+    created from it and ranges of encoded data these parts produced, together with the settings
+    used for the preparation. Comparing the manifest with the input directory tells which files
+    have to be added, prepared again or dropped.
+    """
+    def __init__(self, manifest_path: str = "../pkl_files/manifest.json"):
+        self.__manifest_path = manifest_path
+        self.settings = {}
+        self.files = {}
+
+    def load(self):
+        """
+        Load the manifest, an empty one is used if it does not exist or has another version.
+
+        :return: Whether a manifest was loaded.
+        """
+        self.settings = {}
+        self.files = {}
+        if not exists(self.__manifest_path):
+            return False
+        with open(self.__manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return False
+        self.settings = manifest["settings"]
+        self.files = manifest["files"]
+        return True
+
+    def save(self):
+        with open(self.__manifest_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "files": self.files}, f, indent=1)
+
+    def compare(self, input_path: str, input_files: list, settings: dict):
+        """
+        Compare recorded files with the content of the input directory.
+
+        Files whose modification time and size did not change are considered unchanged without reading them,
+        other files are hashed, so files that were only touched are not prepared again.
+        If settings differ from the recorded ones, every file is considered changed.
+
+        :param input_path: Path to the input directory.
+        :param input_files: Names of files currently found in the input directory.
+        :param settings: Settings of the current preparation.
+        :return: Tuple of lists of added, changed, removed and unchanged file names.
+        """
+        added = []
+        changed = []
+        unchanged = []
+        same_settings = settings == self.settings
+
+        for file in input_files:
+            entry = self.files.get(file)
+            if entry is None:
+                added.append(file)
+                continue
+            if not same_settings:
+                changed.append(file)
+                continue
+            info = stat(input_path + file)
+            if info.st_mtime == entry["mtime"] and info.st_size == entry["size"]:
+                unchanged.append(file)
+            elif file_hash(input_path + file) == entry["hash"]:
+                entry["mtime"] = info.st_mtime
+                unchanged.append(file)
+            else:
+                changed.append(file)
+
+        removed = [file for file in self.files if file not in set(input_files)]
+        return added, changed, removed, unchanged
+
+    def update_file(self, input_path: str, file_name: str, parts: list):
+        info = stat(input_path + file_name)
+        self.files[file_name] = {"mtime": info.st_mtime,
+                                 "size": info.st_size,
+                                 "hash": file_hash(input_path + file_name),
+                                 "parts": list(parts),
+                                 "ranges": []}
+
+    def remove_file(self, file_name: str):
+        self.files.pop(file_name, None)
+
+    def get_parts(self, file_names: list):
+        return [part for file in file_names if file in self.files for part in self.files[file]["parts"]]
+
+    def record_ranges(self, ranges: list):
+        """
+        Record ranges of encoded data produced by parts of every input file.
+
+        :param ranges: List of (part name, start, stop) ranges, as returned by StreamHandler.get_ranges().
+        :return:
+        """
+        owners = {part: file for file, entry in self.files.items() for part in entry["parts"]}
+        for entry in self.files.values():
+            entry["ranges"] = []
+        for part, start, stop in ranges:
+            if part in owners:
+                self.files[owners[part]]["ranges"].append([part, int(start), int(stop)])
+
+
+def file_hash(file_path: str):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
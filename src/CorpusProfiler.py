@@ -0,0 +1,251 @@
+import json
+import sys
+import time
+from collections import Counter
+from os import listdir
+
+from Instrumentation import Instrumentation, ConsoleSink
+from MidiHandler import MidiSplitter
+from NoteEvents import NoteEvents
+from StreamHandler import is_pretty
+from encoding import TAG_LINE_LEN, NOTE_LINE_LEN, QUANTIZE_DIVISORS, notes_per_measure
+from file import directory_path
+from workers import ordered_map
+
+TRUNCATION_RATE = 0.01
+
+
+class CorpusProfile:
+    """
+    CorpusProfile holds histograms describing a corpus, collected without encoding it.
+
+    Histograms count notes of every non-empty measure, pitches of every note (chord sizes),
+    time signatures of every part and tempo changes of every input file (or of every part added on its own).
+    Profiles of different files are merged, so files can be profiled by separate processes.
+    """
+    def __init__(self):
+        self.notes_per_measure = Counter()
+        self.chord_sizes = Counter()
+        self.time_signatures = Counter()
+        self.tempo_changes = Counter()
+        self.files = 0
+        self.parts = 0
+        self.failures = []
+        self.wall = 0.0
+
+    def add_part(self, sequence, count_tempo: bool = True):
+        """
+        Add a single part to the profile.
+
+        :param sequence: NoteEvents, music21.stream with a single part or pretty_midi.PrettyMIDI
+        with a single instrument.
+        :param count_tempo: Whether tempo changes of the part are counted, parts of a profiled file
+        share the tempo map of the file that is counted once instead.
+        :return:
+        """
+        if not isinstance(sequence, NoteEvents):
+            sequence = NoteEvents.from_pretty(sequence) if is_pretty(sequence) else NoteEvents.from_stream(sequence)
+        self.notes_per_measure.update(notes_per_measure(sequence.notes["onset"], sequence.time_signatures).tolist())
+        self.chord_sizes.update(sequence.notes["count"].tolist())
+        signatures = sequence.time_signatures or [(0.0, 4, 4)]
+        self.time_signatures.update(str(numerator) + "/" + str(denominator) for _, numerator, denominator in signatures)
+        if count_tempo:
+            self.tempo_changes[len(sequence.tempo_changes[0]) - 1] += 1
+        self.parts += 1
+
+    def merge(self, other):
+        self.notes_per_measure.update(other.notes_per_measure)
+        self.chord_sizes.update(other.chord_sizes)
+        self.time_signatures.update(other.time_signatures)
+        self.tempo_changes.update(other.tempo_changes)
+        self.files += other.files
+        self.parts += other.parts
+        self.failures.extend(other.failures)
+
+    def recommend(self, truncation: float = TRUNCATION_RATE):
+        """
+        Recommend the smallest dimensions that keep truncation within a target rate.
+
+        Length truncation is the fraction of measures with more notes than subsequence_length,
+        width truncation is the fraction of notes with more pitches than fit into subsequence_width.
+
+        :param truncation: Highest accepted fraction of truncated measures and notes.
+        :return: Dictionary with recommended subsequence_length and subsequence_width
+        and truncation rates they result in.
+        """
+        length = bound(self.notes_per_measure, truncation)
+        width = max(TAG_LINE_LEN, NOTE_LINE_LEN + bound(self.chord_sizes, truncation))
+        return {"subsequence_length": length,
+                "subsequence_width": width,
+                "length_truncation": self.length_truncation(length),
+                "width_truncation": self.width_truncation(width)}
+
+    def length_truncation(self, subsequence_length: int):
+        return exceeding(self.notes_per_measure, subsequence_length)
+
+    def width_truncation(self, subsequence_width: int):
+        return exceeding(self.chord_sizes, subsequence_width - NOTE_LINE_LEN)
+
+    def to_dict(self, truncation: float = TRUNCATION_RATE):
+        return {"files": self.files,
+                "parts": self.parts,
+                "measures": sum(self.notes_per_measure.values()),
+                "notes": sum(self.chord_sizes.values()),
+                "wall": self.wall,
+                "notes_per_measure": sorted(self.notes_per_measure.items()),
+                "chord_sizes": sorted(self.chord_sizes.items()),
+                "time_signatures": self.time_signatures.most_common(),
+                "tempo_changes": sorted(self.tempo_changes.items()),
+                "recommendation": self.recommend(truncation),
+                "failures": self.failures}
+
+    def print_summary(self, truncation: float = TRUNCATION_RATE):
+        summary = self.to_dict(truncation)
+        recommendation = summary["recommendation"]
+        print("Profiled " + str(summary["files"]) + " files, " + str(summary["parts"]) + " parts, " +
+              str(summary["measures"]) + " measures and " + str(summary["notes"]) + " notes in " +
+              "{0:.2f}".format(summary["wall"]) + " s (" + str(len(summary["failures"])) + " failures)")
+        print("Notes per measure: " + format_histogram(summary["notes_per_measure"]))
+        print("Chord sizes: " + format_histogram(summary["chord_sizes"]))
+        print("Time signatures: " + format_histogram(summary["time_signatures"]))
+        print("Tempo changes: " + format_histogram(summary["tempo_changes"]))
+        print("Recommended for " + "{0:.2%}".format(truncation) + " truncation: subsequence_length " +
+              str(recommendation["subsequence_length"]) + " (" +
+              "{0:.2%}".format(recommendation["length_truncation"]) + " of measures truncated), " +
+              "subsequence_width " + str(recommendation["subsequence_width"]) + " (" +
+              "{0:.2%}".format(recommendation["width_truncation"]) + " of notes truncated)")
+
+
+class CorpusProfiler:
+    """
+    CorpusProfiler profiles input MIDI files before any training data is built.
+
+    Files are split into parts in memory by MidiSplitter and quantized notes are read
+    straight from pretty_midi data, no music21 stream is parsed and nothing is encoded or written,
+    so the pass takes a fraction of the time of preparing the data. The resulting CorpusProfile
+    recommends subsequence_length and subsequence_width for StreamHandler.prepare_data().
+    """
+    def __init__(self, input_path: str, extract_drums: bool = True, uniform_tempo: bool = True,
+                 divisors: tuple = QUANTIZE_DIVISORS, instrumentation: Instrumentation = None):
+        self.__splitter = MidiSplitter(input_path, "", extract_drums=extract_drums, uniform_tempo=uniform_tempo,
+                                       in_memory=True)
+        self.__input_path = input_path
+        self.divisors = divisors
+        self.__instrumentation = instrumentation if instrumentation is not None else Instrumentation(ConsoleSink())
+
+    def profile(self, input_files: list = None, workers: int = 1):
+        """
+        Profile input files.
+
+        :param input_files: Names of files in the input path, all files are profiled if not given.
+        :param workers: Number of worker processes, files are profiled in this process if it is 1.
+        :return: CorpusProfile of all files.
+        """
+        input_files = list(input_files if input_files is not None else listdir(self.__input_path))
+        profile = CorpusProfile()
+        wall = time.perf_counter()
+
+        tasks = [(self.__splitter, self.__input_path, file, self.divisors) for file in input_files]
+        with self.__instrumentation.stage("Profiling input files", len(input_files)) as stage:
+            for file, (result, error) in zip(input_files, ordered_map(profile_file, tasks, workers)):
+                file_profile, metrics = result if error is None else (CorpusProfile(), {})
+                if error is not None:
+                    file_profile.failures.append((file, error))
+                profile.merge(file_profile)
+                stage.add(file, parts=file_profile.parts, **metrics)
+
+        profile.wall = time.perf_counter() - wall
+        return profile
+
+
+def profile_file(splitter: MidiSplitter, input_path: str, file_name: str, divisors: tuple = QUANTIZE_DIVISORS):
+    """
+    Profile parts of a single input file.
+
+    Tempo changes are counted from the original file, so they are profiled even when the splitter
+    gives parts only the initial tempo.
+    Any exception raised while profiling the file is recorded as a failure of the profile.
+
+    :param splitter: MidiSplitter with in-memory splitting enabled.
+    :param input_path: Input path of the splitter.
+    :param file_name: Name of the file found in the input path.
+    :param divisors: Subdivisions of a quarter note used for quantization.
+    :return: Tuple of CorpusProfile of the file and a dictionary with wall time, CPU time and number of notes.
+    """
+    profile = CorpusProfile()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        import pretty_midi as pm
+
+        pretty = pm.PrettyMIDI(input_path + file_name)
+        profile.tempo_changes[len(pretty.get_tempo_changes()[0]) - 1] += 1
+        for part_name, part, _ in splitter.split_pretty(file_name, pretty):
+            profile.add_part(NoteEvents.from_pretty(part, part_name, divisors), count_tempo=False)
+        profile.files = 1
+    except Exception as e:
+        profile.failures.append((file_name, repr(e)))
+    return profile, {"wall": time.perf_counter() - wall,
+                     "cpu": time.process_time() - cpu,
+                     "notes": sum(profile.chord_sizes.values()),
+                     "measures": sum(profile.notes_per_measure.values())}
+
+
+def bound(histogram: Counter, truncation: float):
+    """
+    Find the smallest value such that only the given fraction of counted items exceeds it.
+
+    :param histogram: Counter of values.
+    :param truncation: Highest accepted fraction of items above the value.
+    :return: The value, 0 for an empty histogram.
+    """
+    total = sum(histogram.values())
+    above = total
+    for value in sorted(histogram):
+        above -= histogram[value]
+        if above <= truncation * total:
+            return int(value)
+    return 0
+
+
+def exceeding(histogram: Counter, limit: int):
+    """
+    :return: Fraction of counted items whose value is higher than limit.
+    """
+    total = sum(histogram.values())
+    if total == 0:
+        return 0.0
+    return sum(count for value, count in histogram.items() if value > limit) / total
+
+
+def format_histogram(items: list):
+    return ", ".join(str(value) + ": " + str(count) for value, count in items)
+
+
+def main(arguments: list):
+    """
+    Command line interface of the profiler.
+
+    usage: python CorpusProfiler.py input_path [--truncation 0.01] [--workers 4] [--output profile.json]
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile MIDI files and recommend encoding dimensions.")
+    parser.add_argument("input")
+    parser.add_argument("--truncation", type=float, default=TRUNCATION_RATE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--exact-tempo", action="store_true")
+    args = parser.parse_args(arguments)
+
+    profiler = CorpusProfiler(directory_path(args.input), uniform_tempo=not args.exact_tempo)
+    profile = profiler.profile(workers=args.workers)
+    profile.print_summary(args.truncation)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(profile.to_dict(args.truncation), f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
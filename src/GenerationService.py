@@ -0,0 +1,310 @@
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from Rectifier import Rectifier
+from SeedGenerator import SeedGenerator
+from decoding import decode_to_pretty, pretty_to_bytes
+
+MAX_BATCH_SIZE = 32
+MAX_LATENCY = 0.05
+METRICS_WINDOW = 1024
+SEED_KINDS = ("partial", "noise", "zero")
+W2V_WIDTH = 3
+STOPPED_MESSAGE = "Generation service was stopped."
+
+
+class GenerationRequest:
+    def __init__(self, seed: str, time_steps: int, length: int, offset: int):
+        self.seed = seed
+        self.time_steps = time_steps
+        self.length = length
+        self.offset = offset
+        self.created = time.perf_counter()
+        self.future = Future()
+
+    def batch_key(self):
+        # only requests for seeds of the same kind and shape can share a batch
+        return self.seed, self.time_steps, self.length, self.offset
+
+
+class ServiceStopped(Exception):
+    pass
+
+
+class GenerationService:
+    """
+    GenerationService keeps everything needed for generation loaded and serves requests in micro-batches.
+
+    Seed artifacts, vocabulary coords and the model are loaded once, artifacts and coords are read
+    by the seed generator, from the artifact store when it is current. Concurrent requests are put
+    into a queue, a single batching thread takes the first waiting request and collects compatible requests
+    until the batch is full or the oldest request waited for the maximum latency. The whole batch is then
+    seeded, predicted, rectified and decoded at once and every request receives its own MIDI bytes.
+
+    The model is any callable that maps a batch of seed vectors of shape [batch, time_steps, 3]
+    to a batch of encoded measures of shape [batch, measures, subsequence_length + 1, subsequence_width],
+    e.g. a loaded tensorflow.keras model, whose predictions are decoded by decode_to_pretty().
+    A model that predicts w2v vectors of shape [batch, time_steps, 3] instead needs a decoder of rectified
+    vectors into pretty_midi objects. Only such vectors are rectified, encoded measures are decoded as they are.
+    """
+    def __init__(self, model, max_batch_size: int = MAX_BATCH_SIZE, max_latency: float = MAX_LATENCY,
+                 rectify: bool = True, seed: int = None, decoder=None):
+        self.__model = model
+        self.__decoder = decoder if decoder is not None else decode_to_pretty
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.__seed_generator = SeedGenerator(seed)
+        self.__rectify = rectify
+        self.__rectifier = None
+        self.__requests = queue.Queue()
+        self.__stopped = threading.Event()
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.metrics = ServiceMetrics()
+
+    def start(self):
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__serve_batches, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop serving requests, requests that were not served yet fail with ServiceStopped.
+
+        :return:
+        """
+        with self.__lock:
+            self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        # no request is queued after the service was stopped, so the queue is drained for good
+        while True:
+            try:
+                self.__requests.get_nowait().future.set_exception(ServiceStopped(STOPPED_MESSAGE))
+            except queue.Empty:
+                break
+
+    def submit(self, seed: str = "partial", time_steps: int = 128, length: int = 128, offset: int = 0):
+        """
+        Queue a generation request.
+
+        :param seed: Kind of the seed vector, one of "partial", "noise" and "zero".
+        :param time_steps: Number of time steps of the seed vector.
+        :param length: Number of seeded time steps (not used by zero seeds).
+        :param offset: Number of empty time steps before the seeded ones (not used by zero seeds).
+        :return: concurrent.futures.Future that resolves to MIDI bytes.
+        :raises ServiceStopped: If the service was stopped.
+        """
+        if seed not in SEED_KINDS:
+            raise ValueError("Unknown seed \"" + str(seed) + "\", expected one of " + ", ".join(SEED_KINDS) + ".")
+        if seed != "zero" and time_steps - length - offset < 0:
+            raise ValueError("Length and offset exceed time steps.")
+        request = GenerationRequest(seed, time_steps, length, offset)
+        with self.__lock:
+            if self.__stopped.is_set():
+                raise ServiceStopped(STOPPED_MESSAGE)
+            self.__requests.put(request)
+        self.metrics.queued(self.__requests.qsize())
+        return request.future
+
+    def generate(self, seed: str = "partial", time_steps: int = 128, length: int = 128, offset: int = 0):
+        return self.submit(seed, time_steps, length, offset).result()
+
+    def __serve_batches(self):
+        pending = deque()
+        while not self.__stopped.is_set():
+            if not pending:
+                try:
+                    pending.append(self.__requests.get(timeout=0.1))
+                except queue.Empty:
+                    continue
+
+            # requests are collected until the batch is full or the oldest request waited long enough
+            first = pending[0]
+            deadline = first.created + self.max_latency
+            batch = [request for request in pending if request.batch_key() == first.batch_key()]
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.__requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(request)
+                if request.batch_key() == first.batch_key():
+                    batch.append(request)
+
+            batch = batch[:self.max_batch_size]
+            for request in batch:
+                pending.remove(request)
+            self.__run_batch(batch)
+
+        # requests already taken from the queue are not served any more
+        for request in pending:
+            request.future.set_exception(ServiceStopped(STOPPED_MESSAGE))
+
+    def __run_batch(self, batch: list):
+        started = time.perf_counter()
+        try:
+            first = batch[0]
+            if first.seed == "partial":
+                seeds = self.__seed_generator.partial(len(batch), first.time_steps, first.length, first.offset)
+            elif first.seed == "noise":
+                seeds = self.__seed_generator.noise(len(batch), first.time_steps, first.length, first.offset)
+            else:
+                seeds = self.__seed_generator.zero(len(batch), first.time_steps)
+
+            predictions = np.asarray(self.__model(seeds))
+            if self.__rectify and predictions.shape[-1] == W2V_WIDTH:
+                # generated w2v coordinates are snapped onto the vocabulary before decoding
+                if self.__rectifier is None:
+                    self.__rectifier = Rectifier(self.__seed_generator.vocab_coords().T)
+                predictions = self.__rectifier.rectify(predictions)
+            results = [pretty_to_bytes(self.__decoder(prediction)) for prediction in predictions]
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            self.metrics.batch(len(batch), [time.perf_counter() - request.created for request in batch],
+                               time.perf_counter() - started, failed=True)
+            return
+
+        finished = time.perf_counter()
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
+        self.metrics.batch(len(batch), [finished - request.created for request in batch], finished - started)
+
+    def queue_depth(self):
+        return self.__requests.qsize()
+
+
+class ServiceMetrics:
+    """
+    ServiceMetrics keeps counters and recent values of queue depth, batch sizes and latencies.
+    """
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.__lock = threading.Lock()
+        self.requests = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.__batch_sizes = deque(maxlen=window)
+        self.__latencies = deque(maxlen=window)
+        self.__batch_times = deque(maxlen=window)
+
+    def queued(self, depth: int):
+        with self.__lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def batch(self, size: int, latencies: list, batch_time: float, failed: bool = False):
+        with self.__lock:
+            self.requests += size
+            self.batches += 1
+            if failed:
+                self.failed += size
+            self.__batch_sizes.append(size)
+            self.__latencies.extend(latencies)
+            self.__batch_times.append(batch_time)
+
+    def snapshot(self, queue_depth: int = 0):
+        with self.__lock:
+            latencies = np.array(self.__latencies)
+            sizes = np.array(self.__batch_sizes)
+            batch_times = np.array(self.__batch_times)
+            return {"queue_depth": queue_depth,
+                    "max_queue_depth": self.max_queue_depth,
+                    "requests": self.requests,
+                    "failed": self.failed,
+                    "batches": self.batches,
+                    "batch_size": {"mean": float(sizes.mean()) if len(sizes) else None,
+                                   "max": int(sizes.max()) if len(sizes) else None},
+                    "latency": {"p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                                "p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+                                "max": float(latencies.max()) if len(latencies) else None},
+                    "batch_time": {"mean": float(batch_times.mean()) if len(batch_times) else None}}
+
+
+def make_handler(service: GenerationService):
+    """
+    Create HTTP request handler class bound to a service.
+
+    POST /generate with a JSON body of submit() parameters returns MIDI bytes,
+    GET /metrics returns metrics as JSON.
+    """
+    class GenerationHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            self.__reply(200, "application/json",
+                         json.dumps(service.metrics.snapshot(service.queue_depth())).encode("utf-8"))
+
+        def do_POST(self):
+            if self.path != "/generate":
+                self.send_error(404)
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                parameters = json.loads(self.rfile.read(length) or b"{}")
+                future = service.submit(**parameters)
+            except (ValueError, TypeError) as e:
+                self.__reply(400, "text/plain", str(e).encode("utf-8"))
+                return
+            except ServiceStopped as e:
+                self.__reply(503, "text/plain", str(e).encode("utf-8"))
+                return
+            try:
+                self.__reply(200, "audio/midi", future.result())
+            except Exception as e:
+                self.__reply(500, "text/plain", repr(e).encode("utf-8"))
+
+        def log_message(self, format, *args):
+            # requests are counted by metrics instead of being logged one by one
+            pass
+
+        def __reply(self, code: int, content_type: str, body: bytes):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return GenerationHandler
+
+
+def serve(service: GenerationService, host: str = "127.0.0.1", port: int = 8765):
+    """
+    Serve generation requests over HTTP until interrupted.
+
+    :param service: GenerationService used for generation.
+    :param host: Address the server listens on, only local connections are accepted by default.
+    :param port: Port the server listens on.
+    :return:
+    """
+    service.start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print("Generation service listening on http://" + host + ":" + str(port) + "/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    import tensorflow as tf
+
+    # usage: python GenerationService.py model_path [port]
+    loaded_model = tf.keras.models.load_model(sys.argv[1])
+    serve(GenerationService(lambda seeds: loaded_model.predict(seeds, batch_size=len(seeds))),
+          port=int(sys.argv[2]) if len(sys.argv) > 2 else 8765)
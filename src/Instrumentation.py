@@ -0,0 +1,297 @@
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # resource module is not available on Windows, peak memory is not reported there
+    resource = None
+
+SLOWEST_ITEMS = 5
+
+
+class Instrumentation:
+    """
+    Instrumentation records timing and throughput of processing stages and passes it to a sink.
+
+    A stage (e.g. splitting of input files) consists of items (e.g. single files). For every item
+    wall and CPU time are measured, for every stage also throughput, processed notes and measures and
+    peak memory of the process. With the default NullSink nothing is measured at all.
+    """
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else NullSink()
+
+    def stage(self, name: str, total: int = 0):
+        """
+        Start a stage, to be used as a context manager.
+
+        :param name: Name of the stage.
+        :param total: Number of items the stage is expected to process.
+        :return: Stage that records its items.
+        """
+        if not self.sink.enabled:
+            return NULL_STAGE
+        return Stage(self.sink, name, total)
+
+    def close(self):
+        self.sink.close()
+
+
+class Stage:
+    """
+    Stage collects records of its items and reports them to a sink.
+
+    Items are either measured by item() context manager, or their measurements are added by add()
+    (e.g. when an item was processed by another process).
+    """
+    def __init__(self, sink, name: str, total: int):
+        self.__sink = sink
+        self.name = name
+        self.total = total
+        self.items = 0
+        self.notes = 0
+        self.measures = 0
+        self.records = []
+        self.__wall = None
+        self.__cpu = None
+
+    def __enter__(self):
+        self.__wall = time.perf_counter()
+        self.__cpu = time.process_time()
+        self.__sink.start_stage(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.__wall
+        cpu = time.process_time() - self.__cpu
+        slowest = sorted(self.records, key=lambda record: record["wall"], reverse=True)[:SLOWEST_ITEMS]
+        self.__sink.end_stage(self, {"stage": self.name,
+                                     "items": self.items,
+                                     "wall": wall,
+                                     "cpu": cpu,
+                                     "items_per_second": self.items / wall if wall > 0 else None,
+                                     "notes": self.notes,
+                                     "measures": self.measures,
+                                     "peak_memory": peak_memory(),
+                                     "slowest": [(record["item"], record["wall"]) for record in slowest],
+                                     "completed": exc_type is None})
+        return False
+
+    def item(self, name: str):
+        return Item(self, name)
+
+    def add(self, name: str, wall: float = 0.0, cpu: float = 0.0, notes: int = 0, measures: int = 0, **extra):
+        """
+        Record a processed item.
+
+        :param name: Name of the item, e.g. a file name.
+        :param wall: Wall time spent on the item in seconds.
+        :param cpu: CPU time spent on the item in seconds.
+        :param notes: Number of notes processed.
+        :param measures: Number of measures processed.
+        :param extra: Other values stored in the record.
+        :return:
+        """
+        self.items += 1
+        self.notes += notes
+        self.measures += measures
+        record = dict(extra, stage=self.name, item=name, wall=wall, cpu=cpu, notes=notes, measures=measures)
+        self.records.append(record)
+        self.__sink.end_item(self, record)
+
+
+class Item:
+    """
+    Context manager that measures a single item of a stage.
+
+    Notes and measures are counted by count() while the item is processed.
+    """
+    def __init__(self, stage: Stage, name: str):
+        self.__stage = stage
+        self.__name = name
+        self.__wall = None
+        self.__cpu = None
+        self.notes = 0
+        self.measures = 0
+        self.extra = {}
+
+    def __enter__(self):
+        self.__wall = time.perf_counter()
+        self.__cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.extra["error"] = repr(exc_value)
+        self.__stage.add(self.__name, time.perf_counter() - self.__wall, time.process_time() - self.__cpu,
+                         self.notes, self.measures, **self.extra)
+        return False
+
+    def count(self, notes: int = 0, measures: int = 0, **extra):
+        self.notes += notes
+        self.measures += measures
+        self.extra.update(extra)
+
+
+class NullStage:
+    """
+    Stage of the NullSink, every call does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def item(self, name: str):
+        return self
+
+    def add(self, name: str, wall: float = 0.0, cpu: float = 0.0, notes: int = 0, measures: int = 0, **extra):
+        pass
+
+    def count(self, notes: int = 0, measures: int = 0, **extra):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class NullSink:
+    """
+    Sink that ignores everything, stages of an Instrumentation using it measure nothing.
+    """
+    enabled = False
+
+    def start_stage(self, stage: Stage):
+        pass
+
+    def end_item(self, stage: Stage, record: dict):
+        pass
+
+    def end_stage(self, stage: Stage, summary: dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class ConsoleSink(NullSink):
+    """
+    Sink that renders a progress bar of the running stage and prints a summary of every finished stage.
+
+    The progress bar is redrawn at most once per interval, so rendering does not slow down stages
+    with many fast items.
+    """
+    enabled = True
+
+    def __init__(self, interval: float = 0.1, length: int = 50, fill: str = '█'):
+        self.interval = interval
+        self.length = length
+        self.fill = fill
+        self.__last_render = 0.0
+
+    def start_stage(self, stage: Stage):
+        self.__last_render = 0.0
+        self.__render(stage, "")
+
+    def end_item(self, stage: Stage, record: dict):
+        now = time.perf_counter()
+        if now - self.__last_render >= self.interval:
+            self.__last_render = now
+            self.__render(stage, "Processing: " + record["item"])
+
+    def end_stage(self, stage: Stage, summary: dict):
+        self.__render(stage, "All completed." if summary["completed"] else "Interrupted.")
+        print()
+        rate = summary["items_per_second"]
+        print(stage.name + ": " + str(summary["items"]) + " items in " +
+              "{0:.2f}".format(summary["wall"]) + " s (CPU " + "{0:.2f}".format(summary["cpu"]) + " s, " +
+              ("{0:.1f}".format(rate) if rate is not None else "-") + " items/s" +
+              (", " + str(summary["notes"]) + " notes" if summary["notes"] else "") +
+              (", " + str(summary["measures"]) + " measures" if summary["measures"] else "") +
+              (", peak memory " + "{0:.1f}".format(summary["peak_memory"] / 1024 ** 2) + " MiB"
+               if summary["peak_memory"] is not None else "") + ")")
+        if summary["slowest"] and summary["items"] > 1:
+            print("Slowest items: " + ", ".join(item + " (" + "{0:.2f}".format(wall) + " s)"
+                                                for item, wall in summary["slowest"]))
+
+    def __render(self, stage: Stage, suffix: str):
+        if stage.total <= 0:
+            # stages of unknown size only count their items
+            print(f'\r{stage.name} | {stage.items} items | {suffix}', end="")
+            sys.stdout.flush()
+            return
+        total = stage.total
+        filled = int(self.length * min(stage.items, total) // total)
+        bar = self.fill * filled + '-' * (self.length - filled)
+        percent = "{0:.1f}".format(100 * min(stage.items, total) / total)
+        print(f'\r{stage.name} |{bar}| {percent}% ({stage.items}/{stage.total}) | {suffix}', end="")
+        sys.stdout.flush()
+
+
+class JsonLinesSink(NullSink):
+    """
+    Sink that writes a JSON object for every item and every stage into a log file, one object per line.
+    """
+    enabled = True
+
+    def __init__(self, log_path: str, items: bool = True):
+        self.items = items
+        self.__file = open(log_path, "a", buffering=1024 * 1024)
+
+    def start_stage(self, stage: Stage):
+        self.__write({"event": "stage_start", "stage": stage.name, "total": stage.total, "time": time.time()})
+
+    def end_item(self, stage: Stage, record: dict):
+        if self.items:
+            self.__write(dict(record, event="item"))
+
+    def end_stage(self, stage: Stage, summary: dict):
+        self.__write(dict(summary, event="stage_end", time=time.time()))
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+    def __write(self, record: dict):
+        self.__file.write(json.dumps(record) + "\n")
+
+
+class MultiSink(NullSink):
+    """
+    Sink that passes everything to multiple sinks, e.g. to the console and to a log file.
+    """
+    enabled = True
+
+    def __init__(self, *sinks):
+        self.sinks = [sink for sink in sinks if sink.enabled]
+
+    def start_stage(self, stage: Stage):
+        for sink in self.sinks:
+            sink.start_stage(stage)
+
+    def end_item(self, stage: Stage, record: dict):
+        for sink in self.sinks:
+            sink.end_item(stage, record)
+
+    def end_stage(self, stage: Stage, summary: dict):
+        for sink in self.sinks:
+            sink.end_stage(stage, summary)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def peak_memory():
+    """
+    Peak resident memory of the process.
+
+    :return: Peak memory in bytes, None if it cannot be measured on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
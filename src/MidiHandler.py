@@ -1,9 +1,15 @@
-import music21 as mu
-import pretty_midi as pm
+import time
+from io import BytesIO
 from os import listdir, remove
-from copy import deepcopy
-from utilities import print_progress
-from file import stream_to_file, save_file, load_file
+from copy import copy
+from Instrumentation import Instrumentation, ConsoleSink
+from file import stream_to_file, save_file, load_file, file_exists
+from SequenceCache import SequenceCache
+from CorpusManifest import CorpusManifest
+from StreamHandler import is_pretty, source_name
+from NoteEvents import NoteEvents
+from encoding import QUANTIZE_DIVISORS
+from workers import ordered_map
 
 
 class MidiHandler:
@@ -14,16 +20,35 @@ class MidiHandler:
     """
     def __init__(self):
         self.__sequences = []
+        self.__sources = []
+        self.__stale_parts = []
+        self.__failures = []
         self.__input_path = "..\\MIDIs\\input\\"
         self.__split_path = "..\\MIDIs\\parts\\"
         self.__regen_path = "..\\MIDIs\\regen\\"
+        self.__cache_path = "../cache/sequences/"
+        self.__cache = None
+        self.__fast_encoding = False
+        self.__compact = False
+        self.__fast_quantize = False
+        self.__manifest = CorpusManifest("../pkl_files/manifest.json")
+        self.__instrumentation = Instrumentation(ConsoleSink())
         self.__splitter = MidiSplitter(self.__input_path, self.__split_path)
 
     def backup(self):
         save_file("mh_seq", self.__sequences)
+        save_file("mh_src", self.__sources)
 
     def rollback(self):
         self.__sequences = load_file("mh_seq")
+        if file_exists("mh_src"):
+            self.__sources = load_file("mh_src")
+        else:
+            # pretty_midi parts have no id, they are named the same way as by StreamHandler
+            self.__sources = [source_name(sequence, index) for index, sequence in enumerate(self.__sequences)]
+
+    def has_backup(self):
+        return file_exists("mh_seq")
 
     def status(self):
         print("Input files found in: " + self.__input_path + " - (" +
@@ -32,6 +57,14 @@ class MidiHandler:
               str(len(listdir(self.__split_path))) + " files found)")
         print("Drum splitting is " + self.__splitter.drum_splitter_status() + ".")
         print("Uniform tempo is " + self.__splitter.uniform_tempo_status() + ".")
+        print("In-memory splitting is " + self.__splitter.in_memory_status() + ".")
+        print("Fast encoding is " + ("enabled" if self.__fast_encoding else "disabled") + ".")
+        print("Compact sequences are " + ("enabled" if self.__compact else "disabled") + ".")
+        print("Fast quantization is " + ("enabled" if self.__fast_quantize else "disabled") + ".")
+        if self.__cache is not None:
+            self.__cache.status()
+        else:
+            print("Sequence cache is disabled.")
 
     def toggle_drum_splitter(self):
         self.__splitter.extract_drums = not self.__splitter.extract_drums
@@ -39,65 +72,330 @@ class MidiHandler:
     def toggle_uniform_tempo(self):
         self.__splitter.uniform_tempo = not self.__splitter.uniform_tempo
 
-    def prepare_data(self):
+    def toggle_in_memory(self):
+        self.__splitter.in_memory = not self.__splitter.in_memory
+
+    def toggle_debug_output(self):
+        self.__splitter.debug_output = not self.__splitter.debug_output
+
+    def toggle_fast_encoding(self):
+        self.__fast_encoding = not self.__fast_encoding
+
+    def toggle_compact(self):
+        self.__compact = not self.__compact
+
+    def toggle_fast_quantize(self):
+        self.__fast_quantize = not self.__fast_quantize
+
+    def toggle_cache(self, max_size: int = 2 * 1024 ** 3):
+        if self.__cache is None:
+            self.__cache = SequenceCache(self.__cache_path, max_size)
+        else:
+            self.__cache = None
+
+    def set_instrumentation(self, instrumentation: Instrumentation):
+        """
+        Set instrumentation that records timing of preparation stages, e.g. with a JsonLinesSink
+        or with a NullSink to disable progress output altogether.
+
+        :param instrumentation: Instrumentation used by following calls.
+        :return:
+        """
+        self.__instrumentation = instrumentation
+
+    def get_instrumentation(self):
+        return self.__instrumentation
+
+    def get_cache_stats(self):
+        if self.__cache is None:
+            return None
+        return self.__cache.stats()
+
+    def prepare_data(self, workers: int = 1, incremental: bool = False):
         """
         Prepares MIDIs, changes them to music21 streams that are then processed and added onto tensorflow tensors.
 
         Method starts with calling internal MidiSplitter that divides MIDIs into instrumental parts.
-        These parts, in order to be readable by music21 toolkit, have to physically exist on hard drive.
+        By default these parts have to physically exist on hard drive in order to be readable by music21 toolkit.
+        With in-memory splitting enabled the parts are passed to music21 as byte buffers instead and are written
+        to the split directory only if debug output is enabled.
         Split MIDIs contain data on time signatures and tempos. MIDI programs (instruments) that are not
         fully supported by music21 module, therefore are stored as comments in music21.instrument.Instrument() classes
-        found outside in a dictionary that is then used to reassign these programs when corresponding streams are
-        created. These comments become useful in later parts of input data creation process.
-
+        found outside in a dictionary (or attached to in-memory parts) that is then used to reassign these programs
+        when corresponding streams are created. These comments become useful in later parts of input data
+        creation process.
+
+        With more than one worker, splitting, parsing and reassigning of each input file is done in memory
+        by a pool of processes. Sequences are collected in the same order as in a serial run and files that
+        fail to be processed are reported and skipped instead of aborting the whole batch.
+        With the sequence cache enabled, input files are also prepared in memory and only files whose content
+        or settings changed since they were cached are parsed again.
+        With fast encoding enabled, music21 is not used at all and sequences are the split pretty_midi parts
+        that StreamHandler encodes directly from their note arrays.
+        With compact sequences enabled, every part is turned into NoteEvents (arrays of notes and small
+        metadata) right where it was prepared, so neither music21 streams nor pretty_midi objects are kept,
+        sent between processes, cached or backed up.
+        With fast quantization enabled, notes of split pretty_midi parts are quantized by numpy instead of music21
+        quantizePost and music21 streams (or NoteEvents when compact) are built from the quantized notes,
+        no part is written to MIDI bytes and parsed again.
+
+        Every preparation done file by file records its input files in a corpus manifest. In incremental mode
+        sequences already stored in the handler (e.g. loaded by rollback()) are kept for unchanged files,
+        sequences of deleted and changed files are dropped and only new and changed files are prepared.
+        Parts whose sequences were dropped are available from get_stale_parts().
+
+        :param workers: Number of processes used for preparation of input files.
+        :param incremental: Whether only changes of the input directory since the last preparation are processed.
         :return:
         """
+        if incremental:
+            self.__prepare_incremental(workers)
+            return
+        if workers > 1 or self.__splitter.in_memory or self.__cache is not None or self.__fast_encoding or \
+                self.__compact or self.__fast_quantize:
+            self.__manifest.files = {}
+            self.__prepare_per_file(workers, listdir(self.__input_path))
+            self.__manifest.settings = self.__cache_settings()
+            self.__manifest.save()
+            return
+
         # Input files are split into multiple instrument tracks and saved as separate MIDIs.
         input_files = listdir(self.__input_path)
-
-        pf = "Splitting MIDI files:"
-        end = len(input_files)
-
-        for progress, file in enumerate(input_files):
-            print_progress(progress, end, prefix=pf, suffix=file)
-            self.__splitter.split_midi(file)
-            print_progress(progress + 1, end, prefix=pf, suffix=file)
+        self.__manifest.files = {}
+
+        with self.__instrumentation.stage("Splitting MIDI files", len(input_files)) as stage:
+            for file in input_files:
+                with stage.item(file) as item:
+                    notes = self.__splitter.split_notes
+                    self.__splitter.split_midi(file)
+                    item.count(notes=self.__splitter.split_notes - notes)
+                    # parts of the file are recorded in the manifest, so the next run can be incremental
+                    self.__manifest.update_file(self.__input_path, file,
+                                                [part for part in self.__splitter.instruments_dict
+                                                 if part.startswith(file + "_part_")])
 
         # Split files are turned into music21 sequences.
+        import music21 as mu
+
         split_files = listdir(self.__split_path)
 
-        pf = "Assigning instruments for parts:"
-        end = len(split_files)
+        with self.__instrumentation.stage("Assigning instruments for parts", len(split_files)) as stage:
+            for file in split_files:
+                with stage.item(file):
+                    sequence = mu.converter.parse(self.__split_path + file, quantizePost=True,
+                                                   quarterLengthDivisors=QUANTIZE_DIVISORS)
+                    # Processed sequence is now reassigned its instrument
+                    # that have potentially lost during conversion.
+                    reassign_program(sequence, self.__find_instrument(file))
+                    sequence.id = file
+                    self.__sequences.append(sequence)
+                    self.__sources.append(file)
+
+        self.__manifest.settings = self.__cache_settings()
+        self.__manifest.save()
+
+    def __prepare_incremental(self, workers: int):
+        """
+        Prepare only input files that were added or changed since the last preparation.
+
+        :param workers: Number of processes in the pool.
+        :return:
+        """
+        input_files = listdir(self.__input_path)
+        settings = self.__cache_settings()
+        if not self.__manifest.load():
+            # without a manifest sequences of the backup cannot be matched to input files,
+            # so all of them are stale and the whole corpus is prepared again
+            print("Incremental preparation: no manifest found, all files are prepared again.")
+            self.__stale_parts = list(self.__sources)
+            self.__sequences = []
+            self.__sources = []
+            self.__prepare_per_file(workers, input_files)
+            self.__manifest.settings = settings
+            self.__manifest.save()
+            return
+        added, changed, removed, unchanged = self.__manifest.compare(self.__input_path, input_files, settings)
+
+        # unchanged files whose sequences are not present in the handler have to be prepared again
+        present = set(self.__sources)
+        for file in list(unchanged):
+            if not all(part in present for part in self.__manifest.get_parts([file])):
+                unchanged.remove(file)
+                changed.append(file)
+
+        self.__stale_parts = self.__manifest.get_parts(changed + removed)
+        kept_parts = set(self.__manifest.get_parts(unchanged))
+        kept = [(source, sequence) for source, sequence in zip(self.__sources, self.__sequences)
+                if source in kept_parts]
+        self.__sources = [source for source, _ in kept]
+        self.__sequences = [sequence for _, sequence in kept]
+
+        print("Incremental preparation: " + str(len(added)) + " added, " + str(len(changed)) + " changed, " +
+              str(len(removed)) + " removed, " + str(len(unchanged)) + " unchanged files.")
+
+        for file in removed:
+            self.__manifest.remove_file(file)
+        prepared = set(added + changed)
+        self.__prepare_per_file(workers, [file for file in input_files if file in prepared])
+        self.__manifest.settings = settings
+        self.__manifest.save()
+
+    def __prepare_per_file(self, workers: int, input_files: list):
+        """
+        Split input files and parse their parts in memory, one input file at a time.
+
+        Each part returned by the splitter carries its own commented music21.instrument,
+        so no dictionary lookup by file name is needed. Files found in the sequence cache are loaded from it,
+        the rest is prepared either directly or, with more than one worker, by a pool of processes.
+        Results are gathered in input order, so stored sequences do not depend on the order
+        in which workers finish.
 
-        for progress, file in enumerate(split_files):
-            print_progress(progress, end, prefix=pf, suffix=file)
-            sequence = mu.converter.parse(self.__split_path + file, quantizePost=True)
-            # Processed sequence is now reassigned its instrument that have potentially lost during conversion.
-            self.__reassign_program(sequence, file)
+        :param workers: Number of processes in the pool.
+        :param input_files: Names of input files that are prepared.
+        :return:
+        """
+        # files are prepared by an in-memory splitter with the same settings
+        splitter = MidiSplitter(self.__input_path, self.__split_path,
+                                extract_drums=self.__splitter.extract_drums,
+                                uniform_tempo=self.__splitter.uniform_tempo,
+                                in_memory=True,
+                                debug_output=self.__splitter.debug_output)
+
+        keys = {}
+        cached = {}
+        if self.__cache is not None:
+            settings = self.__cache_settings()
+            for file in input_files:
+                keys[file] = self.__cache.make_key(self.__input_path + file, settings)
+                parts = self.__cache.get(keys[file])
+                if parts is not None:
+                    cached[file] = parts
+
+        name = "Splitting and parsing MIDI files"
+        if workers > 1:
+            name = "Splitting and parsing MIDI files (" + str(workers) + " workers)"
+
+        tasks = [(splitter, file, self.__fast_encoding, self.__compact, self.__fast_quantize)
+                 for file in input_files if file not in cached]
+        # results of files that are not cached come in the order of input files
+        results = ordered_map(prepare_file, tasks, workers)
+        try:
+            with self.__instrumentation.stage(name, len(input_files)) as stage:
+                for file in input_files:
+                    metrics = {}
+                    if file in cached:
+                        parts, error = cached[file], None
+                        metrics["cached"] = True
+                    else:
+                        result, error = next(results)
+                        parts, error, metrics = result if error is None else ([], error, {})
+
+                    if error is None and file not in cached and self.__cache is not None:
+                        self.__cache.put(keys[file], parts)
+                    # files are measured where they were prepared, which is the worker process for a pool
+                    if error is not None:
+                        metrics["error"] = error
+                    stage.add(file, parts=len(parts), **metrics)
+                    self.__collect(file, parts, error)
+        finally:
+            results.close()
+
+    def __cache_settings(self):
+        """
+        Settings that influence sequences created from an input file, used as a part of cache keys.
+
+        :return: Dictionary of settings.
+        """
+        return {"uniform_tempo": self.__splitter.uniform_tempo,
+                "extract_drums": self.__splitter.extract_drums,
+                "quantize_post": not self.__fast_quantize,
+                "fast_encoding": self.__fast_encoding,
+                "compact": self.__compact,
+                "quarter_length_divisors": list(QUANTIZE_DIVISORS)}
+
+    def __collect(self, file_name: str, parts: list, error):
+        """
+        Store sequences prepared from a single input file or report its failure.
+
+        :param file_name: Name of the input file.
+        :param parts: List of (part name, sequence) tuples created from the file.
+        :param error: Description of an error that occurred during preparation, None if there was none.
+        :return:
+        """
+        if error is not None:
+            print("\nFile \"" + file_name + "\" could not be prepared: " + error)
+            self.__failures.append((file_name, error))
+            return
+        for part_name, sequence in parts:
+            self.__sources.append(part_name)
             self.__sequences.append(sequence)
-            print_progress(progress + 1, end, prefix=pf, suffix=file)
+        self.__manifest.update_file(self.__input_path, file_name, [part_name for part_name, _ in parts])
+
+    def get_failures(self):
+        return self.__failures
+
+    def get_sources(self):
+        return self.__sources
 
-    def regenerate_midis(self, generate_txt: bool = False):
+    def get_stale_parts(self):
+        return self.__stale_parts
+
+    def record_ranges(self, ranges: list):
         """
-        Regenerate MIDI files from internally stored sequences.
+        Record ranges of encoded data produced by every part in the corpus manifest.
 
-        :param generate_txt: Parameter that controls the generation of .txt files that contain music21.stream data.
+        :param ranges: List of (part name, start, stop) ranges, as returned by StreamHandler.get_ranges().
         :return:
         """
-        self.__clear_files(self.__regen_path)
+        self.__manifest.load()
+        self.__manifest.record_ranges(ranges)
+        self.__manifest.save()
+
+    def regenerate_midis(self, generate_txt: bool = False, workers: int = 1, skip_txt: list = None):
+        """
+        Regenerate MIDI files from internally stored sequences.
 
-        pf = "Regenerating MIDI files to " + self.__regen_path + ":"
-        end = len(self.__sequences)
+        Every sequence is written as "regenerated_<index>.mid" (index of the sequence in the handler),
+        so names do not depend on the number of workers or on the order in which they finish.
+        With more than one worker, sequences are regenerated by a pool of processes. A sequence that fails
+        is reported and skipped, a summary of failures and of the slowest files is returned at the end.
 
-        for progress, sequence in enumerate(self.__sequences):
-            print_progress(progress, end, prefix=pf, suffix=sequence)
-            stream_to_file(sequence, self.__regen_path + "regenerated_" + str(progress) + ".mid")
-            if generate_txt:
-                file = open(self.__regen_path + "regenerated_" + str(progress) + ".txt", "a")
-                for element in sequence[0]:
-                    file.write("{" + str(element.offset) + "}" + " - " + str(element) + "\n")
-                file.close()
-            print_progress(progress + 1, end, prefix=pf, suffix=sequence)
+        :param generate_txt: Parameter that controls the generation of .txt files that contain music21.stream data.
+        :param workers: Number of processes used for regeneration.
+        :param skip_txt: Sources (part names) whose .txt files are not generated even if generate_txt is enabled.
+        :return: Dictionary with number of regenerated files, list of (file name, error) failures
+        and list of (file name, wall time) of every regenerated file.
+        """
+        self.__clear_files(self.__regen_path)
+        skip_txt = set(skip_txt or [])
+        sources = self.__sources if len(self.__sources) == len(self.__sequences) else [None] * len(self.__sequences)
+
+        tasks = [(sequence, self.__regen_path + "regenerated_" + str(index),
+                  generate_txt and sources[index] not in skip_txt)
+                 for index, sequence in enumerate(self.__sequences)]
+
+        failures = []
+        timings = []
+        with self.__instrumentation.stage("Regenerating MIDI files to " + self.__regen_path, len(tasks)) as stage:
+            for index, (result, error) in enumerate(ordered_map(regenerate_file, tasks, workers)):
+                if error is None:
+                    error, metrics = result
+                else:
+                    metrics = {}
+
+                file_name = "regenerated_" + str(index) + ".mid"
+                if error is not None:
+                    print("\nSequence " + str(index) + " (" + str(sources[index]) +
+                          ") could not be regenerated: " + error)
+                    failures.append((file_name, error))
+                    metrics["error"] = error
+                else:
+                    timings.append((file_name, metrics.get("wall", 0.0)))
+                stage.add(file_name, source=sources[index], **metrics)
+
+        print("Regenerated " + str(len(timings)) + " of " + str(len(tasks)) + " sequences, " +
+              str(len(failures)) + " failed.")
+        return {"regenerated": len(timings), "failures": failures, "timings": timings}
 
     def get_data(self):
         return self.__sequences
@@ -111,6 +409,9 @@ class MidiHandler:
         self.__clear_files(self.__split_path)
         print("Removing sequences.")
         self.__sequences = []
+        self.__sources = []
+        self.__stale_parts = []
+        self.__failures = []
         print("Resetting splitter.")
         self.__splitter = MidiSplitter(self.__input_path, self.__split_path)
 
@@ -123,52 +424,31 @@ class MidiHandler:
         """
         clear_files = listdir(clear_path)
 
-        pf = "Removing files in " + clear_path + ":"
-        end = len(clear_files)
+        with self.__instrumentation.stage("Removing files in " + clear_path, len(clear_files)) as stage:
+            for file in clear_files:
+                with stage.item(file):
+                    remove(clear_path + file)
 
-        for progress, file in enumerate(clear_files):
-            print_progress(progress, end, prefix=pf, suffix=file)
-            remove(clear_path + file)
-            print_progress(progress + 1, end, prefix=pf, suffix=file)
+    def __find_instrument(self, file_name: str):
+        """
+        Find music21.instrument assigned to a split file by the splitter.
 
-    def __reassign_program(self, sequence, file_name: str):
+        :param file_name: The name of the split file, as well as a dictionary key for its music21.instrument.
+        :return: Commented music21.instrument.Instrument() found in the dictionary or a default one.
         """
-        Reassigns correct music21.instrument for sequence given.
+        import music21 as mu
 
-        Sequence iterates through parts (should be one) in order to find music21.instrument
-        classes that might have been automatically generated for the sequence. These instruments are removed and
-        exchanged for correct music21.instrument.Instrument() that by itself does nothing, but it also contains
-        music21.editorial.comments that can be called and detailed MIDI program data can be extracted and later used.
+        try:
+            return self.__splitter.instruments_dict[file_name]
+        except KeyError:
+            print("\nCorresponding key: \"" + file_name + "\" not found. Adding instrument.Instrument().")
+            edit = mu.editorial.Editorial()
+            edit.true_program = str(0)
+            edit.is_drum = str(0)
 
-        :param sequence: Music21.stream that contains majority of musical data.
-        :param file_name: The name of the file from with the stream was created,
-        as well as a dictionary key for its music21.instrument.
-        :return:
-        """
-        for i, part in enumerate(sequence):
-            instruments = part.getInstruments()
-            for instrument in instruments:
-                # Any instruments that could be found in the sequence are removed,
-                # as they could potentially be wrongly assigned with multiple occurrences.
-                part.remove(instrument)
-            # Function tries to reassign the instrument (or MIDI program)
-            # that is found in splitter's instrument dictionary.
-            try:
-                part.insert(0, self.__splitter.instruments_dict[file_name])
-            except KeyError:
-                print("\nCorresponding key: \"" + file_name + "\" not found. Adding instrument.Instrument().")
-                edit = mu.editorial.Editorial()
-                edit.true_program = str(0)
-                edit.is_drum = str(0)
-
-                insert_instrument = mu.instrument.Instrument()
-                insert_instrument.editorial.comments.append(edit)
-
-                part.insert(0, insert_instrument)
-            # The sequence might consist of multiple note tracks that are called voices.
-            # These tracks are flattened and all music21 elements are put into a single sequence.
-            if part.hasVoices():
-                sequence[i] = part.flattenUnnecessaryVoices(force=True)
+            insert_instrument = mu.instrument.Instrument()
+            insert_instrument.editorial.comments.append(edit)
+            return insert_instrument
 
 
 class MidiSplitter:
@@ -176,12 +456,17 @@ class MidiSplitter:
     MidiSplitter is a class that is capable of dividing complex MIDI files and returning multiple
     files for each instrument track that is found in the input file.
     """
-    def __init__(self, input_path: str, split_path: str, extract_drums: bool = True, uniform_tempo: bool = True):
+    def __init__(self, input_path: str, split_path: str, extract_drums: bool = True, uniform_tempo: bool = True,
+                 in_memory: bool = False, debug_output: bool = False):
         self.instruments_dict = {}
         self.__input_path = input_path
         self.__split_path = split_path
         self.uniform_tempo = uniform_tempo
         self.extract_drums = extract_drums
+        self.in_memory = in_memory
+        self.debug_output = debug_output
+        # number of notes in all split parts, so callers can report notes processed by the splitter
+        self.split_notes = 0
 
     def split_midi(self, file_name: str):
         """
@@ -190,13 +475,57 @@ class MidiSplitter:
         Function creates multiple files for each instrument track and stores them in a separate directory.
         Inclusion of drum tracks is optional. For each track a unique dictionary key is created that has assigned a
         music21.instrument object that can be later referenced in the process of creating learning streams.
+        If in-memory splitting is enabled, parts are serialized into byte buffers instead and are
+        written to the split directory only when debug output is enabled.
 
         :param file_name: Name of the file found in input path.
-        :return:
+        :return: List of (part name, MIDI bytes, music21.instrument) tuples when splitting in memory,
+        empty list otherwise.
         """
+        import music21 as mu
+
+        parts = []
+
+        for out_name, temp_pretty, instrument in self.split_pretty(file_name):
+            # assigning comments for music21.instrument
+            edit = mu.editorial.Editorial()
+            edit.true_program = str(instrument.program)
+            edit.is_drum = str(instrument.is_drum)
+
+            insert_instrument = mu.instrument.Instrument()
+            insert_instrument.editorial.comments.append(edit)
+
+            if self.in_memory:
+                # part is kept as a byte buffer together with its commented instrument
+                buffer = BytesIO()
+                temp_pretty.write(buffer)
+                part_data = buffer.getvalue()
+                parts.append((out_name, part_data, insert_instrument))
+                if self.debug_output:
+                    with open(self.__split_path + out_name, "wb") as f:
+                        f.write(part_data)
+            else:
+                # placing commented instrument into dictionary for later usage with music21 module
+                self.instruments_dict[out_name] = insert_instrument
+                temp_pretty.write(self.__split_path + out_name)
+
+        return parts
+
+    def split_pretty(self, file_name: str, pretty_mf=None):
+        """
+        Split MIDI file into pretty_midi objects, each containing a single instrument track.
+
+        :param file_name: Name of the file found in input path.
+        :param pretty_mf: The file already loaded as pretty_midi.PrettyMIDI, it is loaded if not given.
+        :return: List of (part name, pretty_midi.PrettyMIDI, pretty_midi.Instrument) tuples.
+        """
+        import pretty_midi as pm
+
+        parts = []
 
         # input file is loaded and its initial tempo is extracted
-        pretty_mf = pm.PrettyMIDI(self.__input_path + file_name)
+        if pretty_mf is None:
+            pretty_mf = pm.PrettyMIDI(self.__input_path + file_name)
         init_tempo = round(pretty_mf.get_tempo_changes()[1][0])
 
         part_tag = 0
@@ -208,19 +537,11 @@ class MidiSplitter:
                 # a single instrument is appended onto ints instrument list, with it all its notes
                 temp_pretty.instruments.append(instrument)
             else:
-                # deep copy should preserve all exact tempo changes throughout the song
-                temp_pretty = deepcopy(pretty_mf)
-                # all existing instruments are cleared and only one from the original file is appended
-                temp_pretty.instruments.clear()
-                temp_pretty.instruments.append(instrument)
-
-            # assigning comments for music21.instrument
-            edit = mu.editorial.Editorial()
-            edit.true_program = str(instrument.program)
-            edit.is_drum = str(instrument.is_drum)
-
-            insert_instrument = mu.instrument.Instrument()
-            insert_instrument.editorial.comments.append(edit)
+                # shallow copy preserves all exact tempo changes throughout the song, tempo, time signature
+                # and key maps are shared by all parts and are not modified by any of them
+                temp_pretty = copy(pretty_mf)
+                # the part gets its own instrument list with only one instrument from the original file
+                temp_pretty.instruments = [instrument]
 
             # assigning file / dictionary key name
             if not instrument.is_drum:
@@ -229,10 +550,11 @@ class MidiSplitter:
             else:
                 out_name = file_name + "_part_" + str(part_tag) + "_Percussion" + ".mid"
 
-            # placing commented instrument into dictionary for later usage with music21 module
-            self.instruments_dict[out_name] = insert_instrument
             part_tag += 1
-            temp_pretty.write(self.__split_path + out_name)
+            self.split_notes += len(instrument.notes)
+            parts.append((out_name, temp_pretty, instrument))
+
+        return parts
 
     def clear_dict(self):
         self.instruments_dict = {}
@@ -248,3 +570,141 @@ class MidiSplitter:
             return "enabled"
         else:
             return "disabled"
+
+    def in_memory_status(self):
+        if self.in_memory:
+            return "enabled"
+        else:
+            return "disabled"
+
+
+def reassign_program(sequence, insert_instrument):
+    """
+    Reassigns correct music21.instrument for sequence given.
+
+    Sequence iterates through parts (should be one) in order to find music21.instrument
+    classes that might have been automatically generated for the sequence. These instruments are removed and
+    exchanged for correct music21.instrument.Instrument() that by itself does nothing, but it also contains
+    music21.editorial.comments that can be called and detailed MIDI program data can be extracted and later used.
+
+    :param sequence: Music21.stream that contains majority of musical data.
+    :param insert_instrument: Commented music21.instrument that was created for the stream by the splitter.
+    :return:
+    """
+    for i, part in enumerate(sequence):
+        instruments = part.getInstruments()
+        for instrument in instruments:
+            # Any instruments that could be found in the sequence are removed,
+            # as they could potentially be wrongly assigned with multiple occurrences.
+            part.remove(instrument)
+        # The instrument (or MIDI program) prepared by the splitter is reassigned.
+        part.insert(0, insert_instrument)
+        # The sequence might consist of multiple note tracks that are called voices.
+        # These tracks are flattened and all music21 elements are put into a single sequence.
+        if part.hasVoices():
+            sequence[i] = part.flattenUnnecessaryVoices(force=True)
+
+
+def prepare_file(splitter: MidiSplitter, file_name: str, fast_encoding: bool = False, compact: bool = False,
+                 fast_quantize: bool = False):
+    """
+    Split a single input file in memory and turn its parts into music21 sequences.
+
+    Any exception raised while processing the file is caught and returned as its description.
+
+    :param splitter: MidiSplitter with in-memory splitting enabled.
+    :param file_name: Name of the file found in splitter's input path.
+    :param fast_encoding: If enabled, split pretty_midi parts are returned without being parsed by music21.
+    :param compact: If enabled, parts are returned as NoteEvents.
+    :param fast_quantize: If enabled, split pretty_midi parts are quantized by numpy instead of music21.
+    :return: Tuple of a list of (part name, sequence) tuples, an error description
+    (None if preparation succeeded) and a dictionary with wall time, CPU time and number of notes
+    measured while the file was prepared.
+    """
+    parts = []
+    error = None
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    notes = splitter.split_notes
+    try:
+        if fast_encoding and not compact:
+            parts = [(part_name, part) for part_name, part, _ in splitter.split_pretty(file_name)]
+        elif fast_encoding or fast_quantize:
+            # notes are read from split pretty_midi parts, no part is written to MIDI bytes and parsed again
+            for part_name, part, _ in splitter.split_pretty(file_name):
+                events = NoteEvents.from_pretty(part, part_name)
+                parts.append((part_name, events if compact or fast_encoding else events.to_stream()))
+        else:
+            parts = [(part_name, parse_part(part_name, part_data, instrument, compact, fast_quantize))
+                     for part_name, part_data, instrument in splitter.split_midi(file_name)]
+    except Exception as e:
+        parts, error = [], repr(e)
+    return parts, error, {"wall": time.perf_counter() - wall,
+                          "cpu": time.process_time() - cpu,
+                          "notes": splitter.split_notes - notes}
+
+
+def parse_part(part_name: str, part_data: bytes, instrument, compact: bool = False, fast_quantize: bool = False):
+    """
+    Parse a single part split in memory into a music21 sequence.
+
+    With fast quantization the part is read by pretty_midi, its notes are quantized by numpy on the same grid
+    that music21 quantizePost uses and the sequence is built from them directly (or not at all when compact).
+
+    :param part_name: Name of the part, assigned as the sequence id.
+    :param part_data: MIDI bytes of the part.
+    :param instrument: Commented music21.instrument created for the part by the splitter.
+    :param compact: If enabled, the sequence is returned as NoteEvents.
+    :param fast_quantize: Whether notes are quantized by numpy instead of music21 quantizePost.
+    :return: Music21.stream or NoteEvents.
+    """
+    if fast_quantize:
+        import pretty_midi as pm
+
+        events = NoteEvents.from_pretty(pm.PrettyMIDI(BytesIO(part_data)), part_name, QUANTIZE_DIVISORS)
+        return events if compact else events.to_stream(instrument)
+
+    import music21 as mu
+
+    sequence = mu.converter.parseData(part_data, format="midi", quantizePost=True,
+                                      quarterLengthDivisors=QUANTIZE_DIVISORS)
+    # Processed sequence is now reassigned its instrument that have potentially lost during conversion.
+    reassign_program(sequence, instrument)
+    sequence.id = part_name
+    return NoteEvents.from_stream(sequence, part_name) if compact else sequence
+
+
+def regenerate_file(sequence, output_path: str, generate_txt: bool = False):
+    """
+    Write a single sequence into a MIDI file and optionally dump its elements into a text file.
+
+    The text dump is created in memory and written in one pass.
+
+    :param sequence: Music21.stream, NoteEvents or pretty_midi.PrettyMIDI (prepared with fast encoding).
+    :param output_path: Path of the output files without extension.
+    :param generate_txt: Whether a .txt file with elements of the sequence is created.
+    :return: Tuple of an error description (None if regeneration succeeded) and a dictionary
+    with wall time and CPU time spent on the sequence.
+    """
+    error = None
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        if isinstance(sequence, NoteEvents):
+            sequence.to_pretty().write(output_path + ".mid")
+            lines = ["{" + str(note["onset"]) + "} - " + str(note) + "\n" for note in sequence.notes] \
+                if generate_txt else []
+        elif is_pretty(sequence):
+            sequence.write(output_path + ".mid")
+            lines = ["{" + str(note.start) + "} - " + str(note) + "\n"
+                     for instrument in sequence.instruments for note in instrument.notes] if generate_txt else []
+        else:
+            stream_to_file(sequence, output_path + ".mid")
+            lines = ["{" + str(element.offset) + "}" + " - " + str(element) + "\n"
+                     for element in sequence[0]] if generate_txt else []
+        if generate_txt:
+            with open(output_path + ".txt", "w") as f:
+                f.write("".join(lines))
+    except Exception as e:
+        error = repr(e)
+    return error, {"wall": time.perf_counter() - wall, "cpu": time.process_time() - cpu}
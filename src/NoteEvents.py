@@ -0,0 +1,218 @@
+import numpy as np
+from encoding import QUANTIZE_DIVISORS, pretty_to_notes, pretty_maps, encode_notes, encode_notes_ragged
+from decoding import DEFAULT_VELOCITY, RESOLUTION, write_tempo_changes, quarters_to_seconds
+from RaggedMeasures import RaggedMeasures
+
+
+def event_dtype(pitch_slots: int):
+    """
+    Record type of a single note event.
+
+    :param pitch_slots: Number of pitches a single event (a note or a chord) can hold.
+    :return: numpy.dtype with onset and duration fields, number of pitches and zero-padded pitch slots.
+    """
+    return np.dtype([("onset", np.float64),
+                     ("duration", np.float64),
+                     ("count", np.uint8),
+                     ("pitches", np.uint8, (max(pitch_slots, 1),))])
+
+
+class NoteEvents:
+    """
+    NoteEvents is a compact representation of a single part, an alternative to music21 streams.
+
+    Notes and chords of the part are stored in one structured numpy array sorted by onset, with offsets
+    and durations in quarter lengths and zero-padded pitches.
+    Program, drum flag, time signatures and tempo changes are kept as small metadata.
+    Objects are pickled as a few flat buffers, so they are stored and sent to other processes much faster
+    and take a fraction of memory of the music21 object graph they replace.
+    StreamHandler encodes them directly, the same way it encodes pretty_midi parts.
+    """
+    def __init__(self, notes, program: int, is_drum: bool, time_signatures: list, tempo_changes: tuple,
+                 name: str = None):
+        self.notes = notes
+        self.program = int(program)
+        self.is_drum = bool(is_drum)
+        self.time_signatures = [(float(offset), int(numerator), int(denominator))
+                                for offset, numerator, denominator in time_signatures]
+        self.tempo_changes = (np.asarray(tempo_changes[0], dtype=np.float64),
+                              np.asarray(tempo_changes[1], dtype=np.float64))
+        self.name = name
+
+    @classmethod
+    def from_arrays(cls, onsets, durations, pitches, counts, program: int, is_drum: bool, time_signatures: list,
+                    tempo_changes: tuple, name: str = None):
+        """
+        Create events from note arrays.
+
+        :param onsets: Sorted array of absolute note offsets in quarter lengths.
+        :param durations: Array of note durations in quarter lengths.
+        :param pitches: Zero-padded pitch matrix of shape [notes, chord size].
+        :param counts: Number of pitches of every note.
+        :param program: MIDI program of the part.
+        :param is_drum: Whether the part is a drum track.
+        :param time_signatures: List of (offset, numerator, denominator) sorted by offset.
+        :param tempo_changes: Tuple of arrays of tempo change offsets (the first one at 0) and tempi.
+        :param name: Name of the part, used as its source name.
+        :return: NoteEvents.
+        """
+        pitches = np.asarray(pitches).reshape(len(onsets), -1)
+        notes = np.zeros(len(onsets), dtype=event_dtype(pitches.shape[1]))
+        notes["onset"] = onsets
+        notes["duration"] = durations
+        notes["count"] = counts
+        notes["pitches"][:, :pitches.shape[1]] = pitches
+        return cls(notes, program, is_drum, time_signatures, tempo_changes, name)
+
+    @classmethod
+    def from_pretty(cls, pretty, name: str = None, divisors: tuple = QUANTIZE_DIVISORS):
+        """
+        Create events from a single-instrument pretty_midi object, quantized the same way as by fast encoding.
+
+        :param pretty: pretty_midi.PrettyMIDI with a single instrument.
+        :param name: Name of the part, used as its source name.
+        :param divisors: Subdivisions of a quarter note used for quantization.
+        :return: NoteEvents.
+        """
+        onsets, durations, pitches, counts = pretty_to_notes(pretty, divisors)
+        time_signatures, tempo_changes = pretty_maps(pretty, divisors)
+        instrument = pretty.instruments[0]
+        return cls.from_arrays(onsets, durations, pitches, counts, instrument.program, instrument.is_drum,
+                               time_signatures, tempo_changes, name)
+
+    @classmethod
+    def from_stream(cls, sequence, name: str = None):
+        """
+        Create events from a music21 stream prepared by MidiHandler.
+
+        Every note or chord of the stream becomes one event, program and drum flag are read
+        from the commented instrument assigned by MidiHandler.
+
+        :param sequence: Music21.stream with a single part.
+        :param name: Name of the part, sequence.id is used if not given.
+        :return: NoteEvents.
+        """
+        part = sequence[0]
+        flat = part.flat
+        elements = list(flat.notes)
+
+        onsets = np.array([float(element.offset) for element in elements], dtype=np.float64)
+        durations = np.array([float(element.quarterLength) for element in elements], dtype=np.float64)
+        counts = np.array([len(element.pitches) for element in elements], dtype=np.int64)
+        pitches = np.zeros((len(elements), max(counts.max(initial=0), 1)), dtype=np.float64)
+        for index, element in enumerate(elements):
+            pitches[index, :counts[index]] = [pitch.midi for pitch in element.pitches]
+        order = np.argsort(onsets, kind="stable")
+
+        time_signatures = [(float(ts.offset), ts.numerator, ts.denominator)
+                           for ts in flat.getElementsByClass("TimeSignature")]
+        boundaries = part.metronomeMarkBoundaries()
+        tempo_changes = (np.array([float(boundary[0]) for boundary in boundaries]),
+                         np.array([float(boundary[2].number) for boundary in boundaries]))
+
+        comment = part.getInstrument().editorial.comments[0]
+        return cls.from_arrays(onsets[order], durations[order], pitches[order], counts[order],
+                               int(comment.true_program), comment.is_drum == "True", time_signatures,
+                               tempo_changes, name if name is not None else str(sequence.id))
+
+    def encode(self, subsequence_length: int, subsequence_width: int, nearest_tempo: bool = True):
+        """
+        Encode events into subsequences, see encoding.encode_notes().
+
+        :return: Same tuple as encoding.encode_notes().
+        """
+        return encode_notes(self.notes["onset"], self.notes["duration"], self.notes["pitches"], self.notes["count"],
+                            self.time_signatures, self.tempo_changes, float(self.program), float(self.is_drum),
+                            subsequence_length, subsequence_width, nearest_tempo)
+
+    def encode_ragged(self, subsequence_width: int, nearest_tempo: bool = True):
+        """
+        Encode events into measures of variable length, see encoding.encode_notes_ragged().
+
+        :return: Tuple of RaggedMeasures and highest width loss.
+        """
+        lines, row_splits, tags, highest_width_loss = encode_notes_ragged(
+            self.notes["onset"], self.notes["duration"], self.notes["pitches"], self.notes["count"],
+            self.time_signatures, self.tempo_changes, float(self.program), float(self.is_drum),
+            subsequence_width, nearest_tempo)
+        return RaggedMeasures(lines, row_splits, tags), highest_width_loss
+
+    def to_stream(self, instrument=None):
+        """
+        Build a music21 stream of the same layout as MidiHandler creates by parsing a split part.
+
+        Notes are already quantized, so the stream is built from exact offsets and durations
+        and music21 neither parses MIDI nor quantizes anything.
+
+        :param instrument: Commented music21.instrument assigned to the part, created from program
+        and drum flag if not given.
+        :return: Music21.stream.Score with a single part.
+        """
+        import music21 as mu
+
+        if instrument is None:
+            edit = mu.editorial.Editorial()
+            edit.true_program = str(self.program)
+            edit.is_drum = str(self.is_drum)
+            instrument = mu.instrument.Instrument()
+            instrument.editorial.comments.append(edit)
+
+        elements = [0.0, instrument]
+        for offset, numerator, denominator in self.time_signatures:
+            elements += [offset, mu.meter.TimeSignature(str(numerator) + "/" + str(denominator))]
+        for offset, tempo in zip(*self.tempo_changes):
+            elements += [float(offset), mu.tempo.MetronomeMark(number=float(tempo))]
+        for note in self.notes:
+            pitches = [int(pitch) for pitch in note["pitches"][:note["count"]]]
+            element = mu.note.Note(pitches[0]) if len(pitches) == 1 else mu.chord.Chord(pitches)
+            element.quarterLength = float(note["duration"])
+            elements += [float(note["onset"]), element]
+
+        # all elements are inserted at once, so the part is sorted only once
+        part = mu.stream.Part()
+        part.insert(elements)
+        score = mu.stream.Score()
+        score.insert(0, part)
+        if self.name is not None:
+            score.id = self.name
+        return score
+
+    def to_pretty(self, resolution: int = RESOLUTION):
+        """
+        Create a pretty_midi object with a single instrument from events, e.g. to write them as a MIDI file.
+
+        :param resolution: Ticks per quarter note of created MIDI.
+        :return: pretty_midi.PrettyMIDI.
+        """
+        import pretty_midi as pm
+
+        change_offsets, change_tempi = self.tempo_changes
+        onsets = self.notes["onset"]
+        ends = onsets + self.notes["duration"]
+
+        pretty = pm.PrettyMIDI(resolution=resolution, initial_tempo=float(change_tempi[0]))
+        write_tempo_changes(pretty, change_offsets, change_tempi, ends.max(initial=0))
+        for offset, numerator, denominator in self.time_signatures:
+            time = float(quarters_to_seconds([offset], change_offsets, change_tempi)[0])
+            pretty.time_signature_changes.append(pm.TimeSignature(numerator, denominator, time))
+
+        instrument = pm.Instrument(program=self.program, is_drum=self.is_drum)
+        starts = quarters_to_seconds(onsets, change_offsets, change_tempi)
+        ends = quarters_to_seconds(ends, change_offsets, change_tempi)
+        for start, end, count, pitches in zip(starts, ends, self.notes["count"], self.notes["pitches"]):
+            for pitch in pitches[:count]:
+                instrument.notes.append(pm.Note(velocity=DEFAULT_VELOCITY, pitch=int(pitch),
+                                                start=float(start), end=float(end)))
+        pretty.instruments.append(instrument)
+        return pretty
+
+    @property
+    def nbytes(self):
+        return self.notes.nbytes + self.tempo_changes[0].nbytes + self.tempo_changes[1].nbytes
+
+    def __len__(self):
+        return len(self.notes)
+
+    def __repr__(self):
+        return "NoteEvents(" + str(self.name) + ", " + str(len(self.notes)) + " events, program " + \
+               str(self.program) + (", drums" if self.is_drum else "") + ")"
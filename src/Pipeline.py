@@ -0,0 +1,298 @@
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from os import listdir
+
+from Instrumentation import Instrumentation, ConsoleSink
+from MidiHandler import MidiSplitter, parse_part
+from NoteEvents import NoteEvents
+from StreamHandler import StreamHandler, encode_sequence
+
+STOP = None
+POLL_INTERVAL = 0.1
+
+
+class PipelineCancelled(Exception):
+    pass
+
+
+class Pipeline:
+    """
+    Pipeline streams input files through splitting, parsing and encoding at once.
+
+    Every stage runs its own workers connected by bounded queues: splitting is done by threads,
+    as it mostly reads and writes MIDI data, parsing and encoding are done by pools of processes.
+    A part is parsed as soon as it was split and encoded as soon as it was parsed, so the stages overlap
+    and only a limited number of parts waits between them. A full queue blocks the stage before it,
+    which keeps memory bounded when a later stage is slower. The pipeline can be cancelled at any time,
+    e.g. by KeyboardInterrupt, and parts that fail are reported and skipped.
+    With fast encoding or fast quantization, split pretty_midi parts (or NoteEvents quantized from them)
+    go straight to encoding and no parsing processes are started.
+    """
+    def __init__(self, input_path: str, split_workers: int = 2, parse_workers: int = 4, encode_workers: int = 2,
+                 queue_size: int = 16, extract_drums: bool = True, uniform_tempo: bool = True,
+                 fast_encoding: bool = False, fast_quantize: bool = False, instrumentation: Instrumentation = None):
+        self.__input_path = input_path
+        self.split_workers = split_workers
+        self.parse_workers = parse_workers
+        self.encode_workers = encode_workers
+        self.queue_size = queue_size
+        self.fast_encoding = fast_encoding
+        self.fast_quantize = fast_quantize
+        self.__splitter = MidiSplitter(input_path, "", extract_drums=extract_drums, uniform_tempo=uniform_tempo,
+                                       in_memory=True)
+        self.__instrumentation = instrumentation if instrumentation is not None else Instrumentation(ConsoleSink())
+        self.__cancelled = threading.Event()
+        self.__lock = threading.Lock()
+        self.__failures = []
+        # number of parts of every split input file, by index of the file
+        self.__part_counts = {}
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    def get_failures(self):
+        return self.__failures
+
+    def run(self, stream_handler: StreamHandler, input_files: list = None, subsequence_length: int = 16,
+            subsequence_width: int = 6, nearest_tempo: bool = True, deduplicate: bool = False):
+        """
+        Run the pipeline and add encoded sequences to a StreamHandler.
+
+        Encoded sequences are added in the order of input files and their parts,
+        regardless of the order in which workers finish.
+
+        :param stream_handler: StreamHandler that receives encoded data, its previous data is replaced.
+        :param input_files: Names of files in the input path, all files are processed if not given.
+        :param subsequence_length: Maximum number of notes stored in one measure.
+        :param subsequence_width: Width of tag_line and note lines.
+        :param nearest_tempo: Tempo semantics used for encoding, see StreamHandler.prepare_data().
+        :param deduplicate: Whether encoded measures are stored once, see StreamHandler.prepare_data().
+        :return: List of source names of encoded sequences.
+        """
+        input_files = list(input_files if input_files is not None else listdir(self.__input_path))
+        self.__cancelled.clear()
+        self.__failures = []
+        self.__part_counts = {}
+
+        files = queue.Queue()
+        for index, file in enumerate(input_files):
+            files.put((index, file))
+        parsing = queue.Queue(maxsize=self.queue_size)
+        encoding = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+
+        parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers) \
+            if not self.fast_encoding and not self.fast_quantize else None
+        encode_pool = ProcessPoolExecutor(max_workers=self.encode_workers)
+        encode_settings = (subsequence_length, subsequence_width, nearest_tempo)
+
+        threads = [
+            self.__start_stage(lambda item: self.__split(item), files, parsing, self.split_workers,
+                               self.parse_workers),
+            self.__start_stage(lambda item: self.__parse(parse_pool, item), parsing, encoding, self.parse_workers,
+                               self.encode_workers),
+            self.__start_stage(lambda item: self.__encode(encode_pool, encode_settings, item), encoding, results,
+                               self.encode_workers, 1)]
+        for _ in range(self.split_workers):
+            files.put(STOP)
+
+        # parts are added in input order as soon as all parts before them are done, previous data
+        # is replaced only by a finished run, an empty run leaves empty data of requested dimensions
+        staging = StreamHandler([], instrumentation=self.__instrumentation)
+        staging.reset_data(subsequence_length, subsequence_width, deduplicate)
+        ready = {}
+        position = (0, 0)
+        names = []
+        completed = False
+        try:
+            # number of parts is not known in advance, so the stage has no total
+            with self.__instrumentation.stage("Pipeline: splitting, parsing and encoding MIDI files") as stage:
+                finished_files = set()
+                while True:
+                    item = self.__get(results)
+                    if item is STOP:
+                        break
+                    key, part_name, result, metrics = item
+                    ready[key] = (part_name, result)
+                    if result is not None:
+                        stage.add(part_name, **metrics)
+                        finished_files.add(key[0])
+                    position = self.__add_ready(staging, ready, position, names, deduplicate)
+            self.__add_ready(staging, ready, position, names, deduplicate)
+            stream_handler.take_data(staging)
+            print("Pipeline finished: " + str(len(names)) + " parts of " + str(len(finished_files)) +
+                  " files encoded, " + str(len(self.__failures)) + " failures.")
+            completed = True
+        except (KeyboardInterrupt, PipelineCancelled):
+            print("\nPipeline cancelled.")
+            raise
+        finally:
+            # on any error the remaining workers are stopped instead of finishing the corpus
+            if not completed:
+                self.cancel()
+            for thread in threads:
+                thread.join()
+            if parse_pool is not None:
+                parse_pool.shutdown(wait=completed)
+            encode_pool.shutdown(wait=completed)
+        return names
+
+    def __add_ready(self, staging: StreamHandler, ready: dict, position: tuple, names: list, deduplicate: bool):
+        """
+        Add encoded parts that are next in input order to the staging handler.
+
+        :param staging: StreamHandler that collects encoded data of the run.
+        :param ready: Dictionary of (part name, encoded result) of finished parts by their (file, part) key,
+        the result is None for a part that failed. Added parts are removed from it.
+        :param position: Key of the next part in input order.
+        :param names: List of source names of added parts, extended by newly added ones.
+        :param deduplicate: Whether encoded measures are stored once.
+        :return: Key of the next part that is not finished yet.
+        """
+        file_index, part_index = position
+        while True:
+            with self.__lock:
+                part_count = self.__part_counts.get(file_index)
+            if part_count is None:
+                # the file was not split yet
+                return file_index, part_index
+            if part_index >= part_count:
+                file_index, part_index = file_index + 1, 0
+                continue
+            if (file_index, part_index) not in ready:
+                return file_index, part_index
+            part_name, result = ready.pop((file_index, part_index))
+            if result is not None:
+                subsequences, tags = result
+                staging.add_encoded(part_name, subsequences, tags, deduplicate)
+                names.append(part_name)
+            part_index += 1
+
+    def __start_stage(self, function, inbox: queue.Queue, outbox: queue.Queue, workers: int, next_workers: int):
+        """
+        Start worker threads of a stage and a thread that closes the next stage when they are done.
+
+        :param function: Function processing a single item, returning a list of items for the next stage.
+        :param inbox: Queue of items of the stage.
+        :param outbox: Queue of items of the next stage.
+        :param workers: Number of worker threads of the stage.
+        :param next_workers: Number of worker threads of the next stage, each of them gets a STOP item.
+        :return: Thread that closes the stage.
+        """
+        def work():
+            try:
+                while True:
+                    item = self.__get(inbox)
+                    if item is STOP:
+                        break
+                    for result in function(item):
+                        self.__put(outbox, result)
+            except PipelineCancelled:
+                pass
+
+        def close():
+            for thread in threads:
+                thread.join()
+            try:
+                for _ in range(next_workers):
+                    self.__put(outbox, STOP)
+            except PipelineCancelled:
+                pass
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        closer = threading.Thread(target=close, daemon=True)
+        closer.start()
+        return closer
+
+    def __split(self, item):
+        index, file = item
+        wall = time.perf_counter()
+        try:
+            if self.fast_encoding:
+                parts = [(part_name, pretty, None) for part_name, pretty, _ in self.__splitter.split_pretty(file)]
+            elif self.fast_quantize:
+                # notes are quantized right after splitting, NoteEvents are encoded from their note arrays
+                parts = [(part_name, NoteEvents.from_pretty(pretty, part_name), None)
+                         for part_name, pretty, _ in self.__splitter.split_pretty(file)]
+            else:
+                parts = self.__splitter.split_midi(file)
+        except Exception as e:
+            self.__fail(file, e)
+            parts = []
+        with self.__lock:
+            self.__part_counts[index] = len(parts)
+        split_time = (time.perf_counter() - wall) / max(len(parts), 1)
+        return [((index, part_index), part_name, payload, instrument, {"split": split_time})
+                for part_index, (part_name, payload, instrument) in enumerate(parts)]
+
+    def __parse(self, pool: ProcessPoolExecutor, item):
+        key, part_name, payload, instrument, metrics = item
+        if pool is None:
+            # pretty_midi parts and NoteEvents are encoded directly
+            return [(key, part_name, payload, metrics)]
+        wall = time.perf_counter()
+        try:
+            sequence = self.__wait(pool.submit(parse_part, part_name, payload, instrument))
+        except PipelineCancelled:
+            raise
+        except Exception as e:
+            self.__fail(part_name, e)
+            # failed parts are passed on, so parts after them are not kept waiting
+            return [(key, part_name, None, metrics)]
+        return [(key, part_name, sequence, dict(metrics, parse=time.perf_counter() - wall))]
+
+    def __encode(self, pool: ProcessPoolExecutor, settings: tuple, item):
+        key, part_name, sequence, metrics = item
+        if sequence is None:
+            return [item]
+        wall = time.perf_counter()
+        try:
+            subsequences, tags, _, _ = self.__wait(pool.submit(encode_sequence, sequence, *settings))
+        except PipelineCancelled:
+            raise
+        except Exception as e:
+            self.__fail(part_name, e)
+            return [(key, part_name, None, metrics)]
+        metrics = dict(metrics, encode=time.perf_counter() - wall)
+        metrics["wall"] = metrics.get("split", 0.0) + metrics.get("parse", 0.0) + metrics["encode"]
+        return [(key, part_name, (subsequences, tags), dict(metrics, measures=len(tags)))]
+
+    def __fail(self, name: str, error: Exception):
+        with self.__lock:
+            print("\n\"" + name + "\" could not be processed: " + repr(error))
+            self.__failures.append((name, repr(error)))
+
+    def __wait(self, future):
+        # waiting is interrupted when the pipeline is cancelled
+        while True:
+            if self.__cancelled.is_set():
+                future.cancel()
+                raise PipelineCancelled()
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except FutureTimeoutError:
+                continue
+
+    def __get(self, inbox: queue.Queue):
+        while True:
+            if self.__cancelled.is_set():
+                raise PipelineCancelled()
+            try:
+                return inbox.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def __put(self, outbox: queue.Queue, item):
+        # a full queue blocks the stage until the next stage takes an item, or the pipeline is cancelled
+        while True:
+            if self.__cancelled.is_set():
+                raise PipelineCancelled()
+            try:
+                outbox.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
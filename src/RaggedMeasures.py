@@ -0,0 +1,129 @@
+import numpy as np
+
+POOL_BATCHES = 100
+
+
+class RaggedMeasures:
+    """
+    RaggedMeasures stores encoded measures of variable length as flat lines and row splits.
+
+    Every measure is its tag_line followed by one line for every note, measures are stored one after another
+    in a single float32 array of shape [lines, subsequence_width]. Measure i spans lines
+    row_splits[i]:row_splits[i + 1], so no measure is padded and dense measures are not truncated.
+    Batches are padded only to their longest measure by pad().
+    """
+    def __init__(self, lines, row_splits, tags: list = None):
+        self.lines = np.asarray(lines, dtype=np.float32)
+        self.row_splits = np.asarray(row_splits, dtype=np.int64)
+        self.tags = tags if tags is not None else []
+
+    @classmethod
+    def concatenate(cls, parts: list):
+        """
+        Join ragged measures of several sequences into one object.
+
+        :param parts: List of RaggedMeasures with the same width.
+        :return: RaggedMeasures with measures of all parts in their order.
+        """
+        if len(parts) == 0:
+            return cls(np.zeros((0, 0), dtype=np.float32), np.zeros(1, dtype=np.int64))
+        line_offsets = np.cumsum([0] + [len(part.lines) for part in parts[:-1]])
+        row_splits = np.concatenate([[0]] + [part.row_splits[1:] + offset
+                                            for part, offset in zip(parts, line_offsets)])
+        return cls(np.concatenate([part.lines for part in parts]), row_splits,
+                   [tag for part in parts for tag in part.tags])
+
+    def __len__(self):
+        return len(self.row_splits) - 1
+
+    def __getitem__(self, index: int):
+        return self.lines[self.row_splits[index]:self.row_splits[index + 1]]
+
+    @property
+    def width(self):
+        return self.lines.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.lines.nbytes + self.row_splits.nbytes
+
+    def lengths(self):
+        """
+        :return: Number of lines of every measure, tag_line included.
+        """
+        return np.diff(self.row_splits)
+
+    def pad(self, indices, length: int = None):
+        """
+        Gather measures into a zero-padded array.
+
+        :param indices: Integer array of measure indices of any shape.
+        :param length: Number of lines of every padded measure, longer measures are truncated.
+        By default measures are padded to the longest of them.
+        :return: float32 array of shape indices.shape + [length, subsequence_width].
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        flat = indices.reshape(-1)
+        lengths = self.lengths()[flat]
+        if length is None:
+            length = int(lengths.max(initial=1))
+        padded = np.zeros((len(flat), length, self.width), dtype=np.float32)
+
+        # every stored line is copied at once to its position in the padded array
+        kept = np.minimum(lengths, length)
+        rows = np.repeat(np.arange(len(flat)), kept)
+        positions = np.arange(int(kept.sum())) - np.repeat(np.cumsum(kept) - kept, kept)
+        padded[rows, positions] = self.lines[np.repeat(self.row_splits[flat], kept) + positions]
+        return padded.reshape(indices.shape + (length, self.width))
+
+
+def bucket_batches(lengths, batch_size: int = 32, pool_batches: int = POOL_BATCHES, seed: int = None):
+    """
+    Group items of similar length into batches, so every batch is padded only to its longest item.
+
+    Items are shuffled and split into pools of pool_batches batches, items of a pool are sorted by length
+    and cut into batches, and order of all batches is shuffled again. Larger pools give tighter batches,
+    smaller ones keep batches more random.
+
+    :param lengths: Length of every item, e.g. the longer measure of each (input, target) pair.
+    :param batch_size: Number of items in a batch.
+    :param pool_batches: Number of batches sorted together.
+    :param seed: Seed of shuffling.
+    :return: List of integer arrays of item indices.
+    """
+    lengths = np.asarray(lengths)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(lengths))
+    pool_size = max(batch_size * pool_batches, 1)
+
+    batches = []
+    for pool_start in range(0, len(order), pool_size):
+        pool = order[pool_start:pool_start + pool_size]
+        pool = pool[np.argsort(lengths[pool], kind="stable")]
+        batches.extend(pool[start:start + batch_size] for start in range(0, len(pool), batch_size))
+    return [batches[index] for index in rng.permutation(len(batches))]
+
+
+def padding_stats(lengths, subsequence_length: int, batches: list = None):
+    """
+    Compare padding of fixed-size measures with padding of length-bucketed batches.
+
+    :param lengths: Number of lines of every item, tag_line included.
+    :param subsequence_length: Maximum number of notes of the fixed-size layout.
+    :param batches: Batches of item indices, e.g. from bucket_batches().
+    :return: Dictionary with stored lines, padding ratio and truncated lines of the fixed-size layout
+    and padding ratio of the batches.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    lines = int(lengths.sum())
+    fixed_lines = len(lengths) * (subsequence_length + 1)
+    kept_lines = int(np.minimum(lengths, subsequence_length + 1).sum())
+    stats = {"items": len(lengths),
+             "lines": lines,
+             "fixed_padding_ratio": 1.0 - kept_lines / fixed_lines if fixed_lines > 0 else 0.0,
+             "fixed_truncated_lines": lines - kept_lines,
+             "bucketed_padding_ratio": None}
+    if batches is not None:
+        batch_lines = sum(len(batch) * int(lengths[batch].max(initial=0)) for batch in batches)
+        stats["bucketed_padding_ratio"] = 1.0 - lines / batch_lines if batch_lines > 0 else 0.0
+    return stats
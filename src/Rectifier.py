@@ -0,0 +1,43 @@
+import numpy as np
+
+DISTANCE_BUDGET = 2 ** 24
+
+
+class Rectifier:
+    """
+    Rectifier snaps generated vectors onto the nearest vocabulary coordinates.
+
+    Vocabulary coordinates and their squared norms are prepared once, so the same Rectifier can be reused
+    for any number of calls. Inputs of any shape ending with [..., 3] are processed in vectorised chunks,
+    only the first two values of every time step (the coordinates) are changed.
+    """
+    def __init__(self, coords, distance_budget: int = DISTANCE_BUDGET):
+        coords = np.asarray(coords, dtype=np.float64)
+        if coords.size == 0:
+            raise ValueError("Rectifier needs at least one vocabulary coordinate, empty coords were given")
+        self.__coords = coords[:, :2]
+        self.__norms = np.sum(self.__coords ** 2, axis=1)
+        # number of points processed at once is limited, so the distance matrix stays within the budget
+        self.__chunk_size = max(1, distance_budget // len(self.__coords))
+
+    def rectify(self, vectors):
+        """
+        Replace coordinates of every time step with the nearest vocabulary coordinates.
+
+        :param vectors: Array of shape [batch, time_steps, 3] (or any shape ending with 3).
+        Encoded measures must not be passed, their first columns hold offsets and tempi, not coordinates.
+        :return: New array of the same shape with rectified coordinates.
+        """
+        vectors = np.array(vectors, dtype=np.float64)
+        if vectors.ndim == 0 or vectors.shape[-1] != 3:
+            raise ValueError("Rectifier expects w2v vectors of shape [..., 3], got shape " + str(vectors.shape))
+        points = vectors.reshape(-1, vectors.shape[-1])
+
+        for start in range(0, len(points), self.__chunk_size):
+            chunk = points[start:start + self.__chunk_size, :2]
+            # squared euclidean distance without the |point|^2 term, which does not change the nearest coords
+            distances = self.__norms[np.newaxis, :] - 2.0 * (chunk @ self.__coords.T)
+            nearest = np.argmin(distances, axis=1)
+            points[start:start + self.__chunk_size, :2] = self.__coords[nearest]
+
+        return points.reshape(vectors.shape)
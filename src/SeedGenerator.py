@@ -0,0 +1,146 @@
+import numpy as np
+from ArtifactStore import ArtifactStore, RaggedArray
+from file import load_file
+
+
+class SeedGenerator:
+    """
+    SeedGenerator creates batches of seed vectors of shape [batch_size, time_steps, 3] for generation.
+
+    Vocabulary, dictionary and sequences are loaded lazily on first use and kept until invalidate() is called.
+    Dictionary tokens are mapped to rows of a dense coords array and sequences are stored as token index
+    arrays, so whole batches are built with a few numpy operations. Random values come from
+    numpy.random.Generator that can be seeded for reproducible results.
+
+    When an ArtifactStore converted from the current pickles exists, artifacts are memory-mapped from it
+    and only sampled sequences are read, otherwise they are loaded from pickled files.
+    """
+    def __init__(self, seed: int = None, store: ArtifactStore = None):
+        self.__rng = np.random.default_rng(seed)
+        self.__store = store if store is not None else ArtifactStore()
+        self.__noise_bounds = None
+        self.__vocab_coords = None
+        self.__token_coords = None
+        self.__sequences = None
+        self.__offsets = None
+
+    def seed(self, seed: int = None):
+        self.__rng = np.random.default_rng(seed)
+
+    def invalidate(self):
+        """
+        Forget loaded artifacts, they are loaded again on the next call that needs them.
+
+        :return:
+        """
+        self.__noise_bounds = None
+        self.__vocab_coords = None
+        self.__token_coords = None
+        self.__sequences = None
+        self.__offsets = None
+        self.__store.close()
+
+    def noise(self, batch_size: int = 1, time_steps: int = 128, length: int = 128, offset: int = 0):
+        """
+        Create seed vectors with random coordinates for given length preceded and followed by empty steps.
+
+        :return: Array of shape [batch_size, time_steps, 3], empty array if length and offset exceed time steps.
+        """
+        if time_steps - length - offset < 0:
+            return np.array([])
+        low_x, high_x, low_y, high_y = self.__load_noise_bounds()
+
+        data = self.zero(batch_size, time_steps)
+        data[:, offset:offset + length, 0] = low_x + (high_x - low_x) * self.__rng.random((batch_size, length))
+        data[:, offset:offset + length, 1] = low_y + (high_y - low_y) * self.__rng.random((batch_size, length))
+        return data
+
+    def partial(self, batch_size: int = 1, time_steps: int = 128, length: int = 128, offset: int = 0):
+        """
+        Create seed vectors from beginnings of randomly chosen corpus sequences.
+
+        Steps after the end of a sequence shorter than length stay empty.
+
+        :return: Array of shape [batch_size, time_steps, 3], empty array if length and offset exceed time steps.
+        """
+        if time_steps - length - offset < 0:
+            return np.array([])
+        self.__load_corpus()
+
+        data = self.zero(batch_size, time_steps)
+        indices = self.__rng.integers(0, len(self.__sequences), batch_size)
+        for vector, index in enumerate(indices):
+            tokens = self.__sequences[index][:length]
+            offsets = self.__offsets[index][:length]
+            end = offset + len(tokens)
+            data[vector, offset:end, :2] = self.__token_coords[tokens]
+            # offsets are stored as differences between subsequent notes
+            data[vector, offset:end, 2] = np.diff(offsets, prepend=offsets[:1])
+        return data
+
+    def zero(self, batch_size: int = 1, time_steps: int = 128):
+        data = np.zeros((batch_size, time_steps, 3))
+        data[:, :, 2] = self.__rng.random((batch_size, time_steps))
+        return data
+
+    def vocab_coords(self):
+        """
+        Coords of the w2v vocabulary, read from the artifact store if possible, loaded once.
+
+        :return: Array of shape [2, vocabulary size].
+        """
+        if self.__vocab_coords is None:
+            coords = self.__store.vocab_coords() if self.__use_store() else None
+            self.__vocab_coords = coords if coords is not None else np.asarray(load_file("w2v_vocab")["coords"])
+        return self.__vocab_coords
+
+    def __load_noise_bounds(self):
+        if self.__noise_bounds is None:
+            coords = self.vocab_coords()
+            self.__noise_bounds = (float(np.argmin(coords[0])), float(np.argmax(coords[0])),
+                                   float(np.argmin(coords[1])), float(np.argmax(coords[1])))
+        return self.__noise_bounds
+
+    def __load_corpus(self):
+        if self.__sequences is not None:
+            return
+        if self.__use_store():
+            sequences = self.__store.sequences()
+            if sequences is not None:
+                self.__token_coords = np.asarray(self.__store.token_coords()[:, :2])
+                self.__sequences, self.__offsets = sequences
+                return
+
+        master_dict = load_file("dictionary")
+        sequence_dict = load_file("sequences")
+
+        # every token gets a row in a dense coords array
+        token_index = {}
+        coords = []
+        for token, entry in master_dict.items():
+            token_index[token] = len(coords)
+            coords.append(entry["coords"][:2])
+        self.__token_coords = np.asarray(coords, dtype=np.float64)
+
+        # sequences are kept in the same flat layout as in the store
+        splits = np.zeros(len(sequence_dict["sequences"]) + 1, dtype=np.int64)
+        splits[1:] = np.cumsum([len(sequence) for sequence in sequence_dict["sequences"]])
+        self.__sequences = RaggedArray(np.array([token_index[token] for sequence in sequence_dict["sequences"]
+                                                 for token in sequence], dtype=np.int64), splits)
+        self.__offsets = RaggedArray(np.array([offset for offsets in sequence_dict["offsets"] for offset in offsets],
+                                              dtype=np.float64), splits)
+
+    def __use_store(self):
+        """
+        Open the artifact store if it exists and was converted from the current pickles.
+
+        :return: Whether artifacts are read from the store, otherwise pickles are loaded.
+        """
+        if not self.__store.exists():
+            return False
+        if self.__store.manifest is None:
+            self.__store.open()
+            if not self.__store.is_current():
+                print("Artifact store is older than pickled artifacts, pickles are loaded instead. "
+                      "Run ArtifactStore.py to convert them again.")
+        return self.__store.is_current()
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import pickle as pkl
+from collections import OrderedDict
+from os import listdir, makedirs, remove, replace, stat, utime
+from os.path import exists
+
+from CorpusManifest import file_hash
+
+CACHE_VERSION = 3
+
+
+class SequenceCache:
+    """
+    SequenceCache is a content-addressed store of music21 sequences prepared from single input files.
+
+    Every input file is kept as a separate entry, whose key is a hash of the file content and
+    of the settings that were used to split and parse it. Least recently used entries are evicted
+    once the total size of the cache directory exceeds given limit.
+    Sizes and order of use of the entries are kept in memory, the directory is listed only when the cache
+    is created, so it is expected to be used by a single process at a time.
+    """
+    def __init__(self, cache_path: str = "../cache/sequences/", max_size: int = 2 * 1024 ** 3):
+        self.__cache_path = cache_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        makedirs(self.__cache_path, exist_ok=True)
+        # entry paths and sizes from the least to the most recently used one
+        self.__index = OrderedDict((path, size) for _, size, path in sorted(self.__entries()))
+        self.__size = sum(self.__index.values())
+
+    @staticmethod
+    def make_key(file_path: str, settings: dict):
+        """
+        Create cache key for an input file.
+
+        :param file_path: Path to the input file, its content is hashed.
+        :param settings: Splitter and quantization settings that influence created sequences.
+        :return: Hexadecimal key of the entry.
+        """
+        # content hash is the same one CorpusManifest stores for the file
+        settings = dict(settings, cache_version=CACHE_VERSION, content=file_hash(file_path))
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Load sequences stored under given key.
+
+        A hit refreshes the entry, so it becomes the most recently used one.
+
+        :param key: Key created by make_key().
+        :return: List of (part name, sequence) tuples or None if the entry does not exist.
+        """
+        path = self.__entry_path(key)
+        if not exists(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, "rb") as f:
+                sequences = pkl.load(f)
+        except (OSError, EOFError, pkl.UnpicklingError):
+            # damaged entries are treated as missing and removed
+            remove(path)
+            self.__forget(path)
+            self.misses += 1
+            return None
+        utime(path)
+        if path in self.__index:
+            self.__index.move_to_end(path)
+        self.hits += 1
+        return sequences
+
+    def put(self, key: str, sequences: list):
+        """
+        Store sequences under given key and evict old entries if the size limit was exceeded.
+
+        :param key: Key created by make_key().
+        :param sequences: List of (part name, sequence) tuples prepared from the input file.
+        :return:
+        """
+        path = self.__entry_path(key)
+        # entry is written under a temporary name first, so no partially written entry can be read
+        with open(path + ".tmp", "wb") as f:
+            pkl.dump(sequences, f)
+        replace(path + ".tmp", path)
+        self.__forget(path)
+        self.__index[path] = stat(path).st_size
+        self.__size += self.__index[path]
+        self.__evict()
+
+    def clear(self):
+        for file in listdir(self.__cache_path):
+            remove(self.__cache_path + file)
+        self.__index.clear()
+        self.__size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.__index),
+                "size": self.__size,
+                "max_size": self.max_size}
+
+    def status(self):
+        stats = self.stats()
+        print("Sequence cache in: " + self.__cache_path + " - (" + str(stats["entries"]) + " entries, " +
+              str(stats["size"]) + "/" + str(stats["max_size"]) + " bytes)")
+        print("Cache hits: " + str(stats["hits"]) + ", misses: " + str(stats["misses"]) +
+              ", evictions: " + str(stats["evictions"]) + ".")
+
+    def __entry_path(self, key: str):
+        return self.__cache_path + key + ".pkl"
+
+    def __entries(self):
+        """
+        List cache entries.
+
+        :return: List of (last access time, size, path) tuples.
+        """
+        entries = []
+        for file in listdir(self.__cache_path):
+            if not file.endswith(".pkl"):
+                continue
+            info = stat(self.__cache_path + file)
+            entries.append((info.st_mtime, info.st_size, self.__cache_path + file))
+        return entries
+
+    def __forget(self, path: str):
+        self.__size -= self.__index.pop(path, 0)
+
+    def __evict(self):
+        """
+        Remove least recently used entries until the cache fits into its size limit.
+
+        :return:
+        """
+        while self.__size > self.max_size and self.__index:
+            path, size = self.__index.popitem(last=False)
+            if exists(path):
+                remove(path)
+            self.__size -= size
+            self.evictions += 1
@@ -0,0 +1,211 @@
+import json
+import numpy as np
+from os import listdir, makedirs, remove
+from os.path import exists
+
+SHARD_VERSION = 1
+SHARD_SIZE = 65536
+
+
+class ShardStore:
+    """
+    ShardStore keeps encoded input and target subsequences on hard drive as raw float32 shards.
+
+    Every shard is a pair of binary files that can be opened with numpy.memmap, so opening the store
+    is nearly instant, pages are shared between processes reading the same store and reading a slice
+    does not load the rest of the data. A small JSON manifest describes shapes, shards and the ranges
+    of pairs created from each source sequence.
+    Deduplicated data is stored as input shards of measures without targets, together with a flat
+    int64 file of (input index, target index) pairs and ranges of measures of each source.
+    """
+    def __init__(self, store_path: str):
+        self.__store_path = store_path
+        self.manifest = None
+
+    def write(self, inputs, targets, subsequence_length: int, subsequence_width: int,
+              sources: list = None, shard_size: int = SHARD_SIZE, pairs=None, measure_sources: list = None):
+        """
+        Write input and target subsequences to the store, replacing its previous content.
+
+        :param inputs: Array of shape [pairs, subsequence_length + 1, subsequence_width].
+        :param targets: Array of the same shape as inputs, None for deduplicated data.
+        :param subsequence_length: Length used to encode subsequences.
+        :param subsequence_width: Width used to encode subsequences.
+        :param sources: List of (source name, start, stop) ranges of pairs created from each sequence.
+        :param shard_size: Maximum number of pairs in a single shard.
+        :param pairs: Integer array of (input index, target index) rows of deduplicated data.
+        :param measure_sources: List of (source name, start, stop) ranges of measures of deduplicated data.
+        :return:
+        """
+        if subsequence_length < 0 or subsequence_width < 1:
+            raise ValueError("Subsequences of length " + str(subsequence_length) + " and width " +
+                             str(subsequence_width) + " cannot be stored, data was probably never prepared")
+        makedirs(self.__store_path, exist_ok=True)
+        self.clear()
+
+        count = len(inputs)
+        shards = []
+        for shard_index, start in enumerate(range(0, count, shard_size)):
+            stop = min(start + shard_size, count)
+            shard = {"input": "input_" + str(shard_index).zfill(5) + ".bin",
+                     "start": start,
+                     "stop": stop}
+            np.ascontiguousarray(inputs[start:stop], dtype=np.float32).tofile(self.__store_path + shard["input"])
+            if targets is not None:
+                shard["target"] = "target_" + str(shard_index).zfill(5) + ".bin"
+                np.ascontiguousarray(targets[start:stop],
+                                     dtype=np.float32).tofile(self.__store_path + shard["target"])
+            shards.append(shard)
+
+        self.manifest = {"version": SHARD_VERSION,
+                         "dtype": "float32",
+                         "subsequence_length": subsequence_length,
+                         "subsequence_width": subsequence_width,
+                         "count": count,
+                         "shards": shards,
+                         "sources": [{"source": source, "start": start, "stop": stop}
+                                     for source, start, stop in (sources or [])]}
+        if pairs is not None:
+            np.ascontiguousarray(pairs, dtype=np.int64).tofile(self.__store_path + "pairs.bin")
+            self.manifest["pairs"] = len(pairs)
+            self.manifest["measure_sources"] = [{"source": source, "start": start, "stop": stop}
+                                                for source, start, stop in (measure_sources or [])]
+        with open(self.__store_path + "manifest.json", "w") as f:
+            json.dump(self.manifest, f, indent=1)
+
+    def open(self):
+        """
+        Open the store for reading.
+
+        :return: Tuple of ShardedArray objects with input and target subsequences,
+        targets are None for deduplicated data.
+        """
+        with open(self.__store_path + "manifest.json", "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != SHARD_VERSION:
+            raise ValueError("Unsupported shard store version: " + str(self.manifest["version"]))
+
+        shape = (self.manifest["subsequence_length"] + 1, self.manifest["subsequence_width"])
+        inputs = []
+        targets = []
+        for shard in self.manifest["shards"]:
+            shard_shape = (shard["stop"] - shard["start"],) + shape
+            inputs.append(np.memmap(self.__store_path + shard["input"], dtype=np.float32, mode="r",
+                                    shape=shard_shape))
+            if "target" in shard:
+                targets.append(np.memmap(self.__store_path + shard["target"], dtype=np.float32, mode="r",
+                                         shape=shard_shape))
+        if "pairs" in self.manifest:
+            return ShardedArray(inputs, shape), None
+        return ShardedArray(inputs, shape), ShardedArray(targets, shape)
+
+    def get_pairs(self):
+        """
+        Map pairs of deduplicated data.
+
+        :return: Memory-mapped integer array of (input index, target index) rows, None if data is not deduplicated.
+        """
+        if "pairs" not in self.manifest:
+            return None
+        if self.manifest["pairs"] == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        return np.memmap(self.__store_path + "pairs.bin", dtype=np.int64, mode="r", shape=(self.manifest["pairs"], 2))
+
+    def get_measure_sources(self):
+        return [(source["source"], source["start"], source["stop"])
+                for source in self.manifest.get("measure_sources", [])]
+
+    def get_sources(self):
+        return [(source["source"], source["start"], source["stop"]) for source in self.manifest["sources"]]
+
+    def exists(self):
+        return exists(self.__store_path + "manifest.json")
+
+    def clear(self):
+        if not exists(self.__store_path):
+            return
+        for file in listdir(self.__store_path):
+            if file.endswith(".bin") or file == "manifest.json":
+                remove(self.__store_path + file)
+        self.manifest = None
+
+
+class ShardedArray:
+    """
+    Read-only array-like view over consecutive memory-mapped shards.
+
+    Indexing with an integer or a contiguous slice that stays within one shard returns a view of the mapped file,
+    slices that span multiple shards are gathered into a new array containing only requested rows.
+    Strided slices, integer and boolean arrays are gathered shard by shard into a new array, tuples
+    select rows by their first element and apply the rest to the selected rows. A tuple may contain only one
+    array index, a one-dimensional first one, other forms raise IndexError instead of reading all shards.
+    """
+    def __init__(self, shards: list, item_shape: tuple):
+        self.__shards = shards
+        self.__starts = np.cumsum([0] + [len(shard) for shard in shards])
+        self.shape = (int(self.__starts[-1]),) + tuple(item_shape)
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        if isinstance(item, tuple):
+            if len(item) == 0:
+                return self[:]
+            if item[0] is Ellipsis:
+                return self[:][item]
+            if np.ndim(item[0]) > 1 or any(index is None or np.ndim(index) > 0 for index in item[1:]):
+                raise IndexError("ShardedArray supports only a single array index of rows, given as the first "
+                                 "index of a tuple with one dimension.")
+            rows = self[item[0]]
+            if np.ndim(item[0]) == 0 and not isinstance(item[0], slice):
+                return rows[item[1:]]
+            return rows[(slice(None),) + item[1:]]
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step == 1:
+                return self.__slice(start, stop)
+            return self.__gather(np.arange(start, stop, step))
+        if np.ndim(item) > 0:
+            # boolean masks and negative indices are resolved (and checked) by numpy
+            return self.__gather(np.arange(len(self))[np.asarray(item)])
+        index = int(item)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Index " + str(item) + " is out of bounds for ShardedArray of length " +
+                             str(len(self)))
+        shard = int(np.searchsorted(self.__starts, index, side="right")) - 1
+        return self.__shards[shard][index - self.__starts[shard]]
+
+    def __array__(self, dtype=None):
+        array = self.__slice(0, len(self))
+        if dtype is not None:
+            return array.astype(dtype, copy=False)
+        return array
+
+    def __gather(self, indices):
+        flat = indices.reshape(-1)
+        gathered = np.empty((len(flat),) + self.shape[1:], dtype=np.float32)
+        shards = np.searchsorted(self.__starts, flat, side="right") - 1
+        for shard in np.unique(shards):
+            selected = shards == shard
+            gathered[selected] = self.__shards[shard][flat[selected] - self.__starts[shard]]
+        return gathered.reshape(indices.shape + self.shape[1:])
+
+    def __slice(self, start: int, stop: int):
+        if stop <= start:
+            return np.zeros((0,) + self.shape[1:], dtype=np.float32)
+        first = int(np.searchsorted(self.__starts, start, side="right")) - 1
+        last = int(np.searchsorted(self.__starts, stop - 1, side="right")) - 1
+        if first == last:
+            offset = self.__starts[first]
+            return self.__shards[first][start - offset:stop - offset]
+        parts = []
+        for shard in range(first, last + 1):
+            offset = self.__starts[shard]
+            shard_start = max(start, offset) - offset
+            shard_stop = min(stop, self.__starts[shard + 1]) - offset
+            parts.append(self.__shards[shard][shard_start:shard_stop])
+        return np.concatenate(parts)
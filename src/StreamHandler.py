@@ -1,167 +1,169 @@
-import tensorflow as tf
-import music21 as mu
-from utilities import print_progress
+import sys
+import numpy as np
+from Instrumentation import Instrumentation, ConsoleSink
 from file import save_file, load_file
+from ShardStore import ShardStore
+from NoteEvents import NoteEvents
+from RaggedMeasures import RaggedMeasures, POOL_BATCHES, bucket_batches, padding_stats
+from encoding import TAG_LINE_LEN, NOTE_LINE_LEN, encode_pretty_part, lookup_tempi
+from decoding import decode_to_pretty, write_batch
 
-TAG_LINE_LEN = 5
+CHUNK_SIZE = 4096
 
 
 class StreamHandler:
-    def __init__(self, sequences: list):
+    def __init__(self, sequences: list, sources: list = None, instrumentation: Instrumentation = None):
         self.__sequences = sequences
-        self.__input = []
-        self.__target = []
-
-    def load_sequences(self, sequences):
+        self.__sources = sources
+        self.__instrumentation = instrumentation if instrumentation is not None else Instrumentation(ConsoleSink())
+        self.__input = np.zeros((0, 0, 0), dtype=np.float32)
+        self.__target = np.zeros((0, 0, 0), dtype=np.float32)
+        self.__size = 0
+        self.__ranges = []
+        # with deduplicated storage __input holds every measure once and pairs index into it
+        self.__pairs = None
+        self.__pair_count = 0
+        self.__measure_ranges = []
+        # measures of variable length with pairs of their indices, see prepare_ragged()
+        self.__ragged = None
+        self.__ragged_pairs = None
+        self.__store = ShardStore("../pkl_files/sh_shards/")
+
+    def load_sequences(self, sequences, sources: list = None):
         self.__sequences = sequences
+        self.__sources = sources
+
+    def set_instrumentation(self, instrumentation: Instrumentation):
+        self.__instrumentation = instrumentation
+
+    def backup(self, sharded: bool = True):
+        """
+        Save prepared data.
+
+        By default data is written as memory-mappable shards, otherwise it is pickled.
+        Deduplicated data is saved as measures and pairs of their indices.
+
+        :param sharded: Whether data is saved to the shard store or pickled.
+        :return:
+        """
+        if self.__input.shape[1] == 0:
+            print("No data was prepared, there is nothing to back up.")
+            return
+        if self.__pairs is not None:
+            pairs = self.__pairs[:self.__pair_count]
+            if sharded:
+                self.__store.write(self.__input[:self.__size], None, self.__input.shape[1] - 1,
+                                   self.__input.shape[2], self.__ranges, pairs=pairs,
+                                   measure_sources=self.__measure_sources())
+            else:
+                save_file("sh_dedup", {"measures": self.__input[:self.__size], "pairs": pairs,
+                                       "ranges": self.__ranges, "measure_ranges": self.__measure_ranges})
+        elif sharded:
+            self.__store.write(self.__input[:self.__size], self.__target[:self.__size],
+                               self.__input.shape[1] - 1, self.__input.shape[2], self.__ranges)
+        else:
+            save_file("sh_in", self.__input[:self.__size])
+            save_file("sh_tar", self.__target[:self.__size])
+
+    def rollback(self, sharded: bool = True, deduplicated: bool = False):
+        """
+        Load previously saved data.
+
+        Shards are only memory-mapped, their content is read from hard drive when it is accessed.
+        Whether the shard store holds deduplicated data is read from its manifest.
 
-    def backup(self):
-        save_file("sh_in", self.__input)
-        save_file("sh_tar", self.__target)
+        :param sharded: Whether data is loaded from the shard store or from pickles.
+        :param deduplicated: Whether pickled deduplicated data is loaded, used only without shards.
+        :return:
+        """
+        self.__pairs = None
+        self.__measure_ranges = []
+        if sharded:
+            self.__input, self.__target = self.__store.open()
+            self.__ranges = self.__store.get_sources()
+            pairs = self.__store.get_pairs()
+            if pairs is not None:
+                self.__pairs = np.array(pairs, dtype=np.int64)
+                self.__measure_ranges = [(start, stop) for _, start, stop in self.__store.get_measure_sources()]
+        elif deduplicated:
+            data = load_file("sh_dedup")
+            self.__input = np.asarray(data["measures"], dtype=np.float32)
+            self.__target = None
+            self.__pairs = np.asarray(data["pairs"], dtype=np.int64)
+            self.__ranges = data["ranges"]
+            self.__measure_ranges = data["measure_ranges"]
+        else:
+            self.__input = np.asarray(load_file("sh_in"), dtype=np.float32)
+            self.__target = np.asarray(load_file("sh_tar"), dtype=np.float32)
+            self.__ranges = []
+        self.__size = len(self.__input)
+        self.__pair_count = len(self.__pairs) if self.__pairs is not None else 0
 
-    def rollback(self):
-        self.__input = load_file("sh_in")
-        self.__target = load_file("sh_tar")
+    def has_backup(self):
+        return self.__store.exists()
 
-    def prepare_data(self, subsequence_length: int = 16, subsequence_width: int = 6):
+    def prepare_data(self, subsequence_length: int = 16, subsequence_width: int = 6, nearest_tempo: bool = True,
+                     incremental: bool = False, stale_sources: list = None, deduplicate: bool = False):
         """
-        Final training data preparations. Final lists are created that can be converted into tensorflow.Tensor classes.
+        Final training data preparations. Final arrays are created that can be converted into tensorflow.Tensor classes.
 
         Function iterates through loaded sequences, extracts necessary parameters
         and creates measures from these sequences. These measures are then transformed into
-        two-dimensional lists of size [subsequence_length + 1, subsequence_width].
+        two-dimensional arrays of size [subsequence_length + 1, subsequence_width].
         Subsequence_length describes how many notes can be stored in one measure
         (+1 is for tag_line that sits in the beginning of every subsequence and gives more
         information concerning the measure structure).
+        Measures are written straight into preallocated float32 arrays that grow by chunks,
+        so no intermediate Python lists are created.
+        In incremental mode, data already prepared (or loaded by rollback()) is kept for sources that are still
+        loaded and not stale, data of other sources is dropped and only sequences of sources without any
+        prepared data are encoded and appended.
+        With deduplicated storage every encoded measure is stored only once, together with an array
+        of (input index, target index) pairs. Interior measures are no longer copied into both input and target
+        data, pairs (or windows of several previous measures) are gathered only when data is requested.
 
         :param subsequence_length:
         :param subsequence_width:
+        :param nearest_tempo: If enabled, notes take the tempo of the nearest tempo boundary in their measure
+        (the original behaviour), otherwise the tempo in effect at the note's offset is used.
+        :param incremental: Whether previously prepared data is kept and only new sequences are encoded.
+        :param stale_sources: Sources whose prepared data is outdated, e.g. MidiHandler.get_stale_parts().
+        :param deduplicate: Whether measures are stored once together with pairs of their indices.
         :return:
         """
-        # data is reset
-        self.__input = []
-        self.__target = []
+        names = [self.__source_name(sequence, index) for index, sequence in enumerate(self.__sequences)]
+        shape = (subsequence_length + 1, subsequence_width)
+        if incremental and len(self.__ranges) > 0 and tuple(self.__input.shape[1:]) == shape and \
+                deduplicate == (self.__pairs is not None):
+            # only data of loaded, up-to-date sources is kept
+            stale = set(stale_sources or [])
+            self.__retain({name for name in names if name not in stale})
+        else:
+            # data is reset
+            self.__reset(subsequence_length, subsequence_width, deduplicate)
+        encoded = {source for source, _, _ in self.__ranges}
 
         if subsequence_width >= TAG_LINE_LEN:
 
             highest_width_loss = 0
             highest_length_loss = 0
 
-            pf = "Splitting parts to subsequences: "
-            end = len(self.__sequences)
+            pending = [index for index, name in enumerate(names) if name not in encoded]
+            with self.__instrumentation.stage("Splitting parts to subsequences", len(pending)) as stage:
+                for index in pending:
+                    with stage.item(names[index]) as item:
+                        subsequences, tags, width_loss, length_loss = encode_sequence(self.__sequences[index],
+                                                                                      subsequence_length,
+                                                                                      subsequence_width,
+                                                                                      nearest_tempo)
+                        highest_width_loss = max(highest_width_loss, width_loss)
+                        highest_length_loss = max(highest_length_loss, length_loss)
 
-            for progress, sequence in enumerate(self.__sequences):
-                print_progress(progress, end, prefix=pf, suffix=sequence)
-                # divide each sequence into measures that are defined by time signature
-                measures = sequence[0].makeMeasures()
+                        pairs = self.__store_encoded(names[index], subsequences, tags)
 
-                # saving tempo (dynamically changing tempos are not supported)
-                boundaries = sequence[0].metronomeMarkBoundaries()
-                if len(boundaries) == 1:
-                    metronome = float(boundaries[0][2].number)
-                    uniform = True
-                else:
-                    metronome = 0.0
-                    uniform = False
-
-                # saving initial time signature
-                time_signature = sequence[0].timeSignature
-
-                # saving tag line values instrument values
-                instrument = sequence[0].getInstrument()
-                is_drum = float(instrument.editorial.comments[0].is_drum == "True")
-                program = float(instrument.editorial.comments[0].true_program)
-
-                # subsequences are unique to each midi track,
-                # these same subsequences will be divided into training and target data
-                # (subsequent subsequences)
-                subsequences = []
-
-                for measure in measures:
-                    # in case if the object is not a measure, it's discarded
-                    if type(measure) is not mu.stream.Measure:
-                        measures.remove(measure)
-                        continue
-
-                    # deleting empty measure and skipping to the next one
-                    if measure.notes.highestOffset == 0.0:
-                        measures.remove(measure)
-                        continue
-
-                    # creating subsequence and measures dictionary for each measure
-                    # dictionary is created and cleared but used only if uniform is False
-                    subsequence = []
-                    metronomes = {}
-
-                    # detecting changes in time signatures
-                    if measure.timeSignature is not None:
-                        time_signature = measure.timeSignature
-
-                    # tag_line is a list composed of "instruction values"
-                    # that are found at the very beginning of every input vector
-                    tag_line = [float(measure.offset), program, is_drum,
-                                float(time_signature.numerator), float(time_signature.denominator)]
-                    tag_line += ([0.0] * (subsequence_width - TAG_LINE_LEN))
-                    subsequence.append(tag_line)
-
-                    # extracting metronome boundaries for each measure
-                    # as they have different offsets compared to the initial metronome boundaries check
-                    if uniform is False:
-                        boundaries = measure.metronomeMarkBoundaries()
-                        for boundary in boundaries:
-                            metronomes[float(boundary[0])] = boundary[2].number
-
-                    # adding elements to subsequence
-                    for element in measure.notes.sorted:
-                        offset = float(element.offset)
-                        if uniform is False:
-                            key = min(metronomes.keys(), key=lambda x: abs(x-offset))
-                            metronome = metronomes[key]
-                        length = float(element.quarterLength)
-                        line = [offset, metronome, length]
-                        # adding cord pitches to width
-                        for pitch in element.pitches:
-                            line.append(float(pitch.midi))
-
-                        # zero-padding width
-                        diff = subsequence_width - len(line)
-                        if diff > 0:
-                            for i in range(diff):
-                                line.append(0.0)
-                        if diff < 0:
-                            if len(line) > highest_width_loss:
-                                highest_width_loss = len(line)
-                            for i in range(abs(diff)):
-                                line.pop()
-
-                        subsequence.append(line)
-
-                    # zero-padding length
-                    diff = subsequence_length + 1 - len(subsequence)
-                    if diff > 0:
-                        for i in range(diff):
-                            subsequence.append([0.0] * subsequence_width)
-                    elif diff < 0:
-                        if len(subsequence) - 1 > highest_length_loss:
-                            highest_length_loss = len(subsequence) - 1
-                        for i in range(abs(diff)):
-                            subsequence.pop()
-
-                    subsequences.append(subsequence)
-
-                # assigning input and target data to subsequent subsequences
-                expected_offset = 0.0
-                past_subsequence = None
-                for subsequence in subsequences:
-                    tag_line = subsequence[0]
-                    current_offset = tag_line[0]
-                    if current_offset == expected_offset and past_subsequence is not None:
-                        self.__input.append(past_subsequence)
-                        self.__target.append(subsequence)
-                    past_subsequence = subsequence
-                    expected_offset = current_offset + (tag_line[3]/tag_line[4]*4)
-
-                print_progress(progress+1, end, prefix=pf, suffix=sequence)
+                        # stored note lines are those with a non-zero duration
+                        item.count(notes=int(np.count_nonzero(subsequences[:, 1:, 2])), measures=len(tags),
+                                   pairs=pairs)
 
             if highest_width_loss > 0:
                 print("Subsequence width (" + str(subsequence_width) + ") may result in data losses. "
@@ -172,19 +174,459 @@ class StreamHandler:
         else:
             print("Subsequence width (" + str(subsequence_width) + ") cannot be smaller than " + str(TAG_LINE_LEN))
 
-    def get_data(self):
-        # data is converted into tensorflow tensors
-        return tf.convert_to_tensor(self.__input, dtype=tf.float32), \
-               tf.convert_to_tensor(self.__target, dtype=tf.float32)
+    def prepare_ragged(self, subsequence_width: int = 6, nearest_tempo: bool = True):
+        """
+        Prepare training data as measures of variable length instead of fixed-size subsequences.
+
+        Every measure is stored once with only as many note lines as it has notes, together with
+        (input index, target index) pairs of subsequent measures. No note is truncated and no line
+        is spent on padding, batches are padded only to their longest measure by get_bucketed_dataset().
+        music21 streams and pretty_midi parts are converted to NoteEvents first.
+
+        :param subsequence_width: Width of tag_line and note lines.
+        :param nearest_tempo: Tempo semantics, see prepare_data().
+        :return:
+        """
+        if subsequence_width < TAG_LINE_LEN:
+            print("Subsequence width (" + str(subsequence_width) + ") cannot be smaller than " + str(TAG_LINE_LEN))
+            return
+
+        parts = []
+        pairs = []
+        measures = 0
+        highest_width_loss = 0
+        with self.__instrumentation.stage("Splitting parts to ragged measures", len(self.__sequences)) as stage:
+            for index, sequence in enumerate(self.__sequences):
+                with stage.item(self.__source_name(sequence, index)) as item:
+                    ragged, width_loss = encode_sequence_ragged(sequence, subsequence_width, nearest_tempo)
+                    highest_width_loss = max(highest_width_loss, width_loss)
+                    parts.append(ragged)
+                    pairs.append(pair_subsequences(ragged.tags) + measures)
+                    measures += len(ragged)
+                    item.count(notes=len(ragged.lines) - len(ragged), measures=len(ragged))
+
+        self.__ragged = RaggedMeasures.concatenate(parts)
+        self.__ragged_pairs = np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+        if highest_width_loss > 0:
+            print("Subsequence width (" + str(subsequence_width) + ") may result in data losses. "
+                  "Minimum width of " + str(highest_width_loss) + " is recommended")
+
+    def get_ragged(self):
+        """
+        Returns data prepared by prepare_ragged().
+
+        :return: Tuple of RaggedMeasures and integer array of (input index, target index) pairs,
+        None if ragged data was not prepared.
+        """
+        if self.__ragged is None:
+            return None
+        return self.__ragged, self.__ragged_pairs
+
+    def get_bucketed_dataset(self, batch_size: int = 32, pool_batches: int = POOL_BATCHES, prefetch: int = None,
+                             seed: int = None):
+        """
+        Creates tensorflow.data.Dataset of length-bucketed batches of ragged data.
+
+        Pairs whose measures have similar length are batched together, inputs and targets of a batch
+        are padded only to the longest measure in it, so batches have shape [batch, lines, subsequence_width]
+        with lines varying from batch to batch. Batches are formed again on every pass through the dataset.
+
+        :param batch_size: Number of pairs in a batch.
+        :param pool_batches: Number of batches sorted by length together, see RaggedMeasures.bucket_batches().
+        :param prefetch: Number of batches prepared in advance, None lets tensorflow tune it, 0 disables prefetching.
+        :param seed: Seed of shuffling.
+        :return: tensorflow.data.Dataset yielding (input, target) float32 batches.
+        """
+        import tensorflow as tf
+
+        if self.__ragged is None:
+            print("Ragged data has to be prepared by prepare_ragged() first.")
+            return None
+        ragged = self.__ragged
+        pairs = self.__ragged_pairs
+        lengths = ragged.lengths()[pairs].max(axis=1)
+        rng = np.random.default_rng(seed)
+
+        def generator():
+            for batch in bucket_batches(lengths, batch_size, pool_batches, int(rng.integers(2 ** 32))):
+                padded = ragged.pad(pairs[batch])
+                yield padded[:, 0], padded[:, 1]
+
+        shape = (None, None, ragged.width)
+        dataset = tf.data.Dataset.from_generator(generator, output_types=(tf.float32, tf.float32),
+                                                 output_shapes=(shape, shape))
+        if prefetch is None:
+            dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
+        elif prefetch > 0:
+            dataset = dataset.prefetch(prefetch)
+        return dataset
+
+    def get_padding_stats(self, subsequence_length: int = 16, batch_size: int = 32,
+                          pool_batches: int = POOL_BATCHES, seed: int = None):
+        """
+        Compare padding of fixed-size subsequences with padding of length-bucketed batches of ragged data.
+
+        :param subsequence_length: Maximum number of notes of fixed-size subsequences.
+        :param batch_size: Number of pairs in a batch.
+        :param pool_batches: Number of batches sorted by length together.
+        :param seed: Seed of shuffling.
+        :return: Dictionary of RaggedMeasures.padding_stats() computed over inputs and targets of all pairs,
+        None if ragged data was not prepared.
+        """
+        if self.__ragged is None:
+            return None
+        lengths = self.__ragged.lengths()[self.__ragged_pairs]
+        batches = bucket_batches(lengths.max(axis=1), batch_size, pool_batches, seed)
+        # inputs and targets of a pair are padded to the same length, measure 2i is the input, 2i + 1 the target
+        stats = padding_stats(lengths.reshape(-1), subsequence_length,
+                              [np.concatenate((2 * batch, 2 * batch + 1)) for batch in batches])
+        stats["pairs"] = len(self.__ragged_pairs)
+        stats["bytes"] = self.__ragged.nbytes
+        stats["fixed_bytes"] = len(self.__ragged) * (subsequence_length + 1) * self.__ragged.width * 4
+        return stats
+
+    def reset_data(self, subsequence_length: int = 16, subsequence_width: int = 6, deduplicate: bool = False):
+        """
+        Drop prepared data and start empty data of given dimensions, e.g. before sequences are added by add_encoded().
+
+        :param subsequence_length: Maximum number of notes stored in one measure.
+        :param subsequence_width: Width of tag_line and note lines.
+        :param deduplicate: Whether measures are stored once together with pairs of their indices.
+        :return:
+        """
+        self.__reset(subsequence_length, subsequence_width, deduplicate)
+
+    def take_data(self, other):
+        """
+        Replace prepared data with data of another handler, e.g. a staging handler filled by a pipeline.
+
+        Arrays are taken over without copying, so the other handler should not be used afterwards.
+
+        :param other: StreamHandler whose data is taken.
+        :return:
+        """
+        self.__input = other.__input
+        self.__target = other.__target
+        self.__size = other.__size
+        self.__ranges = other.__ranges
+        self.__pairs = other.__pairs
+        self.__pair_count = other.__pair_count
+        self.__measure_ranges = other.__measure_ranges
+
+    def add_encoded(self, name: str, subsequences, tags: list, deduplicate: bool = False):
+        """
+        Append a sequence encoded outside of prepare_data(), e.g. by a worker process of a pipeline.
+
+        Data is reset by the first call, or whenever shape of subsequences or storage mode changes.
+
+        :param name: Source name of the sequence.
+        :param subsequences: Array of encoded measures, as returned by encode_sequence().
+        :param tags: List of (offset, numerator, denominator) tags of the measures.
+        :param deduplicate: Whether measures are stored once together with pairs of their indices.
+        :return: Number of pairs created from the sequence.
+        """
+        shape = tuple(np.shape(subsequences)[1:])
+        if tuple(self.__input.shape[1:]) != shape or deduplicate != (self.__pairs is not None):
+            self.__reset(shape[0] - 1, shape[1], deduplicate)
+        return self.__store_encoded(name, subsequences, tags)
+
+    def __store_encoded(self, name: str, subsequences, tags: list):
+        """
+        Assign input and target data to subsequent subsequences of an encoded sequence.
+
+        :return: Number of pairs created from the sequence.
+        """
+        pairs = pair_subsequences(tags)
+        if self.__pairs is not None:
+            start = self.__pair_count
+            self.__measure_ranges.append((self.__size, self.__size + len(subsequences)))
+            self.__append_pairs(pairs + self.__size)
+            self.__append(subsequences)
+            self.__ranges.append((name, start, self.__pair_count))
+        else:
+            start = self.__size
+            if len(pairs) > 0:
+                self.__append(subsequences[pairs[:, 0]], subsequences[pairs[:, 1]])
+            self.__ranges.append((name, start, self.__size))
+        return len(pairs)
+
+    def __reset(self, subsequence_length: int, subsequence_width: int, deduplicate: bool = False):
+        self.__input = np.zeros((CHUNK_SIZE, subsequence_length + 1, subsequence_width), dtype=np.float32)
+        self.__target = None if deduplicate else \
+            np.zeros((CHUNK_SIZE, subsequence_length + 1, subsequence_width), dtype=np.float32)
+        self.__size = 0
+        self.__ranges = []
+        self.__pairs = np.zeros((CHUNK_SIZE, 2), dtype=np.int64) if deduplicate else None
+        self.__pair_count = 0
+        self.__measure_ranges = []
+
+    def __retain(self, sources: set):
+        """
+        Keep only prepared data of given sources, moving it to the beginning of new arrays.
+
+        :param sources: Names of sources whose data is kept.
+        :return:
+        """
+        if self.__pairs is not None:
+            self.__retain_deduplicated(sources)
+            return
+        kept = [(source, start, stop) for source, start, stop in self.__ranges if source in sources]
+        total = sum(stop - start for _, start, stop in kept)
+        inputs = np.zeros((max(total, CHUNK_SIZE),) + tuple(self.__input.shape[1:]), dtype=np.float32)
+        targets = np.zeros((max(total, CHUNK_SIZE),) + tuple(self.__target.shape[1:]), dtype=np.float32)
+
+        position = 0
+        ranges = []
+        for source, start, stop in kept:
+            inputs[position:position + stop - start] = self.__input[start:stop]
+            targets[position:position + stop - start] = self.__target[start:stop]
+            ranges.append((source, position, position + stop - start))
+            position += stop - start
+
+        self.__input = inputs
+        self.__target = targets
+        self.__size = position
+        self.__ranges = ranges
+
+    def __retain_deduplicated(self, sources: set):
+        kept = [(source, start, stop, measures) for (source, start, stop), measures
+                in zip(self.__ranges, self.__measure_ranges) if source in sources]
+        total = sum(measure_stop - measure_start for _, _, _, (measure_start, measure_stop) in kept)
+        pair_total = sum(stop - start for _, start, stop, _ in kept)
+        measures = np.zeros((max(total, CHUNK_SIZE),) + tuple(self.__input.shape[1:]), dtype=np.float32)
+        pairs = np.zeros((max(pair_total, CHUNK_SIZE), 2), dtype=np.int64)
+
+        position = 0
+        pair_position = 0
+        ranges = []
+        measure_ranges = []
+        for source, start, stop, (measure_start, measure_stop) in kept:
+            measures[position:position + measure_stop - measure_start] = self.__input[measure_start:measure_stop]
+            # pair indices are moved together with their measures
+            pairs[pair_position:pair_position + stop - start] = self.__pairs[start:stop] - measure_start + position
+            ranges.append((source, pair_position, pair_position + stop - start))
+            measure_ranges.append((position, position + measure_stop - measure_start))
+            position += measure_stop - measure_start
+            pair_position += stop - start
+
+        self.__input = measures
+        self.__size = position
+        self.__pairs = pairs
+        self.__pair_count = pair_position
+        self.__ranges = ranges
+        self.__measure_ranges = measure_ranges
+
+    def __measure_sources(self):
+        return [(source, start, stop) for (source, _, _), (start, stop) in zip(self.__ranges, self.__measure_ranges)]
+
+    def __source_name(self, sequence, index: int):
+        if self.__sources is not None:
+            return self.__sources[index]
+        return source_name(sequence, index)
+
+    def __append(self, inputs, targets=None):
+        """
+        Copy input and target subsequences into preallocated arrays, growing them if necessary.
+
+        :param inputs: Array of input subsequences (measures with deduplicated storage).
+        :param targets: Array of corresponding target subsequences, None with deduplicated storage.
+        :return:
+        """
+        needed = self.__size + len(inputs)
+        capacity = len(self.__input)
+        if needed > capacity:
+            capacity = max(needed, capacity + max(CHUNK_SIZE, capacity // 2))
+            self.__input = self.__grow(self.__input, capacity, self.__size)
+            if targets is not None:
+                self.__target = self.__grow(self.__target, capacity, self.__size)
+        self.__input[self.__size:needed] = inputs
+        if targets is not None:
+            self.__target[self.__size:needed] = targets
+        self.__size = needed
+
+    def __append_pairs(self, pairs):
+        needed = self.__pair_count + len(pairs)
+        capacity = len(self.__pairs)
+        if needed > capacity:
+            capacity = max(needed, capacity + max(CHUNK_SIZE, capacity // 2))
+            self.__pairs = self.__grow(self.__pairs, capacity, self.__pair_count)
+        self.__pairs[self.__pair_count:needed] = pairs
+        self.__pair_count = needed
+
+    @staticmethod
+    def __grow(array, capacity: int, size: int):
+        grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:size] = array[:size]
+        return grown
+
+    def get_data(self, context: int = 1):
+        """
+        Returns prepared input and target data as tensors.
+
+        Deduplicated data is gathered into separate input and target tensors here, which again needs memory
+        for both of them, get_dataset() gathers only one batch at a time instead.
+
+        :param context: Number of previous measures in every input, more than one requires deduplicated data.
+        :return: Tuple of input and target float32 tensors, inputs have shape [pairs, context, ...] for context > 1.
+        """
+        import tensorflow as tf
+
+        if self.__pairs is not None:
+            measures = np.asarray(self.__input[:self.__size])
+            windows = context_windows(self.__pairs[:self.__pair_count], context)
+            inputs = measures[windows[:, 0]] if context == 1 else measures[windows[:, :-1]]
+            return tf.convert_to_tensor(inputs, dtype=tf.float32), \
+                   tf.convert_to_tensor(measures[windows[:, -1]], dtype=tf.float32)
+        if context != 1:
+            print("Context of " + str(context) + " measures requires deduplicated data.")
+            return None
+
+        # float32 arrays are converted directly, tensorflow copies them once but no Python lists are built
+        return tf.convert_to_tensor(self.__input[:self.__size], dtype=tf.float32), \
+               tf.convert_to_tensor(self.__target[:self.__size], dtype=tf.float32)
+
+    def get_dataset(self, batch_size: int = 32, shuffle_buffer: int = 0, prefetch: int = None,
+                    subsequence_length: int = 16, subsequence_width: int = 6,
+                    from_sequences: bool = True, seed: int = None, nearest_tempo: bool = True, context: int = 1):
+        """
+        Creates tensorflow.data.Dataset of (input, target) subsequence pairs.
+
+        By default pairs are encoded lazily from loaded sequences, one sequence at a time,
+        so training can start as soon as the first sequence is encoded and the whole corpus
+        is never held in memory. Otherwise pairs are read from data created by prepare_data() or rollback().
+        Deduplicated data is kept in the dataset as a single tensor of measures, batches of pairs
+        (or of windows of previous measures) are gathered from it by their indices.
+
+        :param batch_size: Number of pairs in a batch, 0 disables batching.
+        :param shuffle_buffer: Size of shuffling buffer, 0 disables shuffling.
+        :param prefetch: Number of batches prepared in advance, None lets tensorflow tune it, 0 disables prefetching.
+        :param subsequence_length: Used only when pairs are encoded from sequences.
+        :param subsequence_width: Used only when pairs are encoded from sequences.
+        :param from_sequences: Whether pairs are encoded from sequences or read from prepared data.
+        :param seed: Seed of the shuffling buffer.
+        :param nearest_tempo: Tempo semantics used when pairs are encoded from sequences, see prepare_data().
+        :param context: Number of previous measures in every input, inputs get shape [context, ...] if it is
+        more than one. Prepared data has to be deduplicated for context > 1.
+        :return: tensorflow.data.Dataset yielding (input, target) float32 tensors.
+        """
+        import tensorflow as tf
+
+        if not from_sequences and self.__pairs is not None:
+            return self.__gather_dataset(batch_size, shuffle_buffer, prefetch, seed, context)
+        if not from_sequences and context != 1:
+            print("Context of " + str(context) + " measures requires deduplicated data.")
+            return None
+
+        if from_sequences:
+            if subsequence_width < TAG_LINE_LEN:
+                print("Subsequence width (" + str(subsequence_width) + ") cannot be smaller than " +
+                      str(TAG_LINE_LEN))
+                return None
+            shape = (subsequence_length + 1, subsequence_width)
+
+            def generator():
+                return self.__iterate_sequences(subsequence_length, subsequence_width, nearest_tempo, context)
+        else:
+            shape = self.__input.shape[1:]
+
+            def generator():
+                return self.__iterate_prepared()
+
+        input_shape = shape if context == 1 else (context,) + tuple(shape)
+        dataset = tf.data.Dataset.from_generator(generator,
+                                                 output_types=(tf.float32, tf.float32),
+                                                 output_shapes=(input_shape, shape))
+        if shuffle_buffer > 0:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+        if batch_size > 0:
+            dataset = dataset.batch(batch_size)
+        if prefetch is None:
+            dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
+        elif prefetch > 0:
+            dataset = dataset.prefetch(prefetch)
+        return dataset
+
+    def __gather_dataset(self, batch_size: int, shuffle_buffer: int, prefetch: int, seed: int, context: int):
+        import tensorflow as tf
+
+        measures = tf.constant(np.asarray(self.__input[:self.__size]), dtype=tf.float32)
+        windows = context_windows(self.__pairs[:self.__pair_count], context)
+
+        def gather(window):
+            inputs = tf.gather(measures, window[..., 0] if context == 1 else window[..., :-1])
+            return inputs, tf.gather(measures, window[..., -1])
+
+        # only indices go through shuffling and batching, measures are gathered for whole batches
+        dataset = tf.data.Dataset.from_tensor_slices(windows)
+        if shuffle_buffer > 0:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+        if batch_size > 0:
+            dataset = dataset.batch(batch_size)
+        dataset = dataset.map(gather, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        if prefetch is None:
+            dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
+        elif prefetch > 0:
+            dataset = dataset.prefetch(prefetch)
+        return dataset
+
+    def __iterate_sequences(self, subsequence_length: int, subsequence_width: int, nearest_tempo: bool,
+                            context: int = 1):
+        for sequence in self.__sequences:
+            subsequences, tags, _, _ = encode_sequence(sequence, subsequence_length, subsequence_width,
+                                                       nearest_tempo)
+            for window in context_windows(pair_subsequences(tags), context):
+                inputs = subsequences[window[0]] if context == 1 else subsequences[window[:-1]]
+                yield inputs, subsequences[window[-1]]
+
+    def __iterate_prepared(self):
+        for index in range(self.__size):
+            yield self.__input[index], self.__target[index]
+
+    def get_ranges(self):
+        return self.__ranges
+
+    def get_pairs(self):
+        """
+        Returns pairs of deduplicated data.
+
+        :return: Integer array of (input index, target index) rows indexing prepared measures,
+        None if data is not deduplicated.
+        """
+        if self.__pairs is None:
+            return None
+        return self.__pairs[:self.__pair_count]
 
     def clear_data(self):
-        self.__input = []
-        self.__target = []
+        self.__input = np.zeros((0, 0, 0), dtype=np.float32)
+        self.__target = np.zeros((0, 0, 0), dtype=np.float32)
+        self.__size = 0
+        self.__ranges = []
+        self.__pairs = None
+        self.__pair_count = 0
+        self.__measure_ranges = []
+        self.__ragged = None
+        self.__ragged_pairs = None
+
+    def decode_pretty(self, predictions):
+        """
+        Translates raw network output straight into pretty_midi object that can be written as MIDI file.
+
+        It is much faster than decode_data() that stays the reference implementation.
+        """
+        return decode_to_pretty(predictions)
+
+    def write_batch(self, batch, output_paths: list):
+        """
+        Translates a batch of raw network outputs and writes each of them into a MIDI file.
+        """
+        write_batch(batch, output_paths)
 
     def decode_data(self, predictions):
         """
         Prepares raw network output data and translates into music21 stream for MidiHandler to process further.
         """
+        import music21 as mu
+
         score = mu.stream.Score()
 
         # assigning instrument from only the very first tag_line (MIDI program won't change throughout the song)
@@ -237,3 +679,204 @@ class StreamHandler:
             score.insert(tag_line[0], measure)
 
         return score
+
+
+def encode_sequence(sequence, subsequence_length: int, subsequence_width: int, nearest_tempo: bool = True):
+    """
+    Encode a single sequence into subsequences, one for every non-empty measure.
+
+    NoteEvents and single-instrument pretty_midi objects are encoded directly from their note arrays,
+    music21 streams are encoded measure by measure.
+    For sequences with changing tempo, the tempo map is computed once per sequence as a sorted array
+    and tempi of all notes in a measure are found with a single binary search.
+
+    :param sequence: Music21.stream with a single part, NoteEvents or pretty_midi.PrettyMIDI
+    with a single instrument.
+    :param subsequence_length: Maximum number of notes stored in one measure.
+    :param subsequence_width: Width of tag_line and note lines.
+    :param nearest_tempo: If enabled, a note takes the tempo of the nearest tempo boundary in its measure,
+    otherwise the tempo in effect at the note's offset is used.
+    :return: Tuple of float32 array of shape [measures, subsequence_length + 1, subsequence_width],
+    list of (offset, numerator, denominator) tags for each measure, highest width loss and highest length loss.
+    """
+    if isinstance(sequence, NoteEvents):
+        return sequence.encode(subsequence_length, subsequence_width, nearest_tempo)
+    if is_pretty(sequence):
+        return encode_pretty_part(sequence, subsequence_length, subsequence_width, nearest_tempo)
+    import music21 as mu
+
+    highest_width_loss = 0
+    highest_length_loss = 0
+    pitch_slots = subsequence_width - NOTE_LINE_LEN
+
+    # divide each sequence into measures that are defined by time signature
+    measures = sequence[0].makeMeasures()
+
+    # saving tempo, for changing tempos a sorted tempo map is created
+    boundaries = sequence[0].metronomeMarkBoundaries()
+    if len(boundaries) == 1:
+        metronome = float(boundaries[0][2].number)
+        uniform = True
+    else:
+        change_offsets = np.array([float(boundary[0]) for boundary in boundaries])
+        change_tempi = np.array([float(boundary[2].number) for boundary in boundaries])
+        uniform = False
+
+    # saving initial time signature
+    time_signature = sequence[0].timeSignature
+
+    # saving tag line values instrument values
+    instrument = sequence[0].getInstrument()
+    is_drum = float(instrument.editorial.comments[0].is_drum == "True")
+    program = float(instrument.editorial.comments[0].true_program)
+
+    # subsequences are unique to each midi track,
+    # these same subsequences will be divided into training and target data
+    # (subsequent subsequences)
+    # number of elements is an upper bound for the number of measures, unused rows are trimmed at the end
+    subsequences = np.zeros((len(measures), subsequence_length + 1, subsequence_width), dtype=np.float32)
+    tags = []
+
+    # measures are only skipped, not removed from the stream while iterating over it as before,
+    # which also skipped the measure following every removed one, so such measures are now encoded too
+    for measure in measures:
+        # in case if the object is not a measure, it's discarded
+        if type(measure) is not mu.stream.Measure:
+            continue
+
+        # empty measure is skipped
+        if measure.notes.highestOffset == 0.0:
+            continue
+
+        subsequence = subsequences[len(tags)]
+
+        # detecting changes in time signatures
+        if measure.timeSignature is not None:
+            time_signature = measure.timeSignature
+
+        # tag_line is composed of "instruction values"
+        # that are found at the very beginning of every input vector
+        tag = (float(measure.offset), float(time_signature.numerator), float(time_signature.denominator))
+        subsequence[0, :TAG_LINE_LEN] = (tag[0], program, is_drum, tag[1], tag[2])
+        tags.append(tag)
+
+        notes = measure.notes.sorted
+        offsets = [float(element.offset) for element in notes]
+
+        # tempi of all notes in the measure are looked up in the tempo map at once
+        if uniform:
+            metronomes = [metronome] * len(notes)
+        else:
+            metronomes = lookup_tempi(tag[0] + np.array(offsets), tag[0], tag[0] + tag[1] * 4.0 / tag[2],
+                                      change_offsets, change_tempi, nearest_tempo)
+
+        # adding elements to subsequence
+        for index, element in enumerate(notes):
+            pitches = element.pitches
+            if NOTE_LINE_LEN + len(pitches) > subsequence_width:
+                highest_width_loss = max(highest_width_loss, NOTE_LINE_LEN + len(pitches))
+            if index >= subsequence_length:
+                continue
+
+            line = subsequence[index + 1]
+            line[0] = offsets[index]
+            line[1] = metronomes[index]
+            line[2] = float(element.quarterLength)
+            # adding cord pitches to width, the rest stays zero-padded
+            for slot, pitch in enumerate(pitches[:pitch_slots]):
+                line[NOTE_LINE_LEN + slot] = float(pitch.midi)
+
+        if len(notes) > subsequence_length:
+            highest_length_loss = max(highest_length_loss, len(notes))
+
+    return subsequences[:len(tags)], tags, highest_width_loss, highest_length_loss
+
+
+def encode_sequence_ragged(sequence, subsequence_width: int, nearest_tempo: bool = True):
+    """
+    Encode a single sequence into measures of variable length.
+
+    :param sequence: Music21.stream with a single part, NoteEvents or pretty_midi.PrettyMIDI
+    with a single instrument.
+    :param subsequence_width: Width of tag_line and note lines.
+    :param nearest_tempo: Tempo semantics, see encode_sequence().
+    :return: Tuple of RaggedMeasures and highest width loss.
+    """
+    if not isinstance(sequence, NoteEvents):
+        sequence = NoteEvents.from_pretty(sequence) if is_pretty(sequence) else NoteEvents.from_stream(sequence)
+    return sequence.encode_ragged(subsequence_width, nearest_tempo)
+
+
+def pair_subsequences(tags: list):
+    """
+    Find pairs of subsequent measures that become input and target data.
+
+    A measure is a target of the previous one only if it starts exactly where the previous one ends.
+
+    :param tags: List of (offset, numerator, denominator) tags of encoded measures.
+    :return: Integer array of shape [pairs, 2] with (input index, target index) rows.
+    """
+    pairs = []
+    expected_offset = 0.0
+    past_index = None
+    for index, (offset, numerator, denominator) in enumerate(tags):
+        if offset == expected_offset and past_index is not None:
+            pairs.append((past_index, index))
+        past_index = index
+        expected_offset = offset + (numerator/denominator*4)
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+
+def context_windows(pairs, context: int = 1):
+    """
+    Extend pairs of subsequent measures into windows of several previous measures followed by the target.
+
+    A window exists only if all of its measures follow each other, i.e. every measure of the window
+    is paired with the next one.
+
+    :param pairs: Integer array of (input index, target index) rows.
+    :param context: Number of previous measures in a window.
+    :return: Integer array of shape [windows, context + 1], the target index is in the last column.
+    For context 1 the pairs themselves are returned.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if context <= 1:
+        return pairs
+    if len(pairs) == 0:
+        return np.zeros((0, context + 1), dtype=np.int64)
+
+    # every target knows its directly preceding measure
+    previous = np.full(int(pairs.max()) + 1, -1, dtype=np.int64)
+    previous[pairs[:, 1]] = pairs[:, 0]
+
+    columns = [pairs[:, 1], pairs[:, 0]]
+    current = pairs[:, 0]
+    for _ in range(context - 1):
+        current = np.where(current >= 0, previous[np.maximum(current, 0)], -1)
+        columns.append(current)
+    windows = np.stack(columns[::-1], axis=1)
+    return windows[np.all(windows >= 0, axis=1)]
+
+
+def source_name(sequence, index: int):
+    """
+    Name of the source of a sequence used to describe ranges of encoded data.
+
+    pretty_midi objects and NoteEvents without a name carry no part name and are named by their position,
+    names of their parts should be passed to StreamHandler together with them, see MidiHandler.get_sources().
+
+    :param sequence: Music21.stream named by MidiHandler, NoteEvents or pretty_midi.PrettyMIDI.
+    :param index: Position of the sequence, used for sequences without a name.
+    :return: Name of the source.
+    """
+    if isinstance(sequence, NoteEvents) and sequence.name is not None:
+        return sequence.name
+    if is_pretty(sequence) or isinstance(sequence, NoteEvents):
+        return "sequence_" + str(index)
+    return str(sequence.id)
+
+
+def is_pretty(sequence):
+    # a pretty_midi object can exist only if pretty_midi was already imported, so it is not imported here
+    pretty_midi = sys.modules.get("pretty_midi")
+    return pretty_midi is not None and isinstance(sequence, pretty_midi.PrettyMIDI)
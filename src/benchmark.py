@@ -0,0 +1,370 @@
+import json
+import platform
+import sys
+import time
+from os import listdir, makedirs
+from os.path import join
+from tempfile import mkdtemp
+
+import numpy as np
+
+from MidiHandler import MidiSplitter, reassign_program
+from StreamHandler import StreamHandler, encode_sequence
+from file import stream_to_file, file_exists
+from encoding import QUANTIZE_DIVISORS
+from decoding import quarters_to_seconds, write_tempo_changes
+from utilities import rectify_vector, gen_noise_vector, gen_partial_vector, gen_zero_vector
+
+BENCHMARK_VERSION = 1
+REGRESSION_THRESHOLD = 0.1
+DECODED_MEASURES = 8
+TIME_SIGNATURES = [(4, 4), (3, 4), (6, 8), (2, 4), (5, 4)]
+PROGRAMS = [0, 24, 32, 40, 56, 73]
+
+
+def generate_corpus(output_path: str, files: int = 8, instruments: int = 3, measures: int = 32,
+                    tempo_changes: int = 2, chord_density: float = 0.3, time_signature_changes: int = 1,
+                    seed: int = 0):
+    """
+    Generate a synthetic corpus of MIDI files with pretty_midi.
+
+    Every file has given number of instruments (the last one is a drum track if there are more than one),
+    notes on a grid of eighth notes and triplets, chords of up to four pitches, tempo changes and
+    time signature changes at measure boundaries. The same seed always creates the same corpus.
+
+    :param output_path: Directory the files are written to.
+    :param files: Number of generated files.
+    :param instruments: Number of instrument tracks in every file.
+    :param measures: Number of measures in every file.
+    :param tempo_changes: Number of tempo changes after the initial tempo.
+    :param chord_density: Probability that a note is a chord instead of a single pitch.
+    :param time_signature_changes: Number of time signature changes after the initial time signature.
+    :param seed: Seed of the random generator.
+    :return: List of names of generated files.
+    """
+    import pretty_midi as pm
+
+    rng = np.random.default_rng(seed)
+    makedirs(output_path, exist_ok=True)
+    names = []
+
+    for index in range(files):
+        # time signatures change at measure boundaries, lengths are counted in quarters
+        signature_measures = np.sort(rng.choice(np.arange(1, measures), min(time_signature_changes, measures - 1),
+                                                replace=False)) if measures > 1 else np.array([], dtype=int)
+        signatures = [TIME_SIGNATURES[0]] + [TIME_SIGNATURES[rng.integers(len(TIME_SIGNATURES))]
+                                             for _ in signature_measures]
+        bounds = np.concatenate(([0], signature_measures, [measures]))
+        measure_starts = []
+        measure_lengths = []
+        quarter = 0.0
+        signature_offsets = []
+        for (numerator, denominator), first, last in zip(signatures, bounds[:-1], bounds[1:]):
+            signature_offsets.append(quarter)
+            length = numerator * 4.0 / denominator
+            for _ in range(first, last):
+                measure_starts.append(quarter)
+                measure_lengths.append(length)
+                quarter += length
+
+        # tempo changes are placed on measure starts as well
+        change_measures = np.sort(rng.choice(np.arange(1, measures), min(tempo_changes, measures - 1),
+                                             replace=False)) if measures > 1 else np.array([], dtype=int)
+        change_quarters = np.concatenate(([0.0], np.asarray(measure_starts)[change_measures]))
+        change_tempi = np.concatenate(([120.0], rng.integers(60, 180, len(change_measures)).astype(float)))
+
+        pretty = pm.PrettyMIDI(initial_tempo=change_tempi[0])
+        write_tempo_changes(pretty, change_quarters, change_tempi)
+
+        signature_times = quarters_to_seconds(signature_offsets, change_quarters, change_tempi)
+        for seconds, (numerator, denominator) in zip(signature_times, signatures):
+            pretty.time_signature_changes.append(pm.TimeSignature(numerator, denominator, float(seconds)))
+
+        for track in range(instruments):
+            is_drum = instruments > 1 and track == instruments - 1
+            instrument = pm.Instrument(program=PROGRAMS[track % len(PROGRAMS)], is_drum=is_drum)
+            onsets = []
+            ends = []
+            pitches = []
+            for start, length in zip(measure_starts, measure_lengths):
+                # every measure uses either an eighth note or a triplet grid
+                grid = 0.5 if rng.random() < 0.7 else 1.0 / 3.0
+                steps = int(round(length / grid))
+                for onset in start + grid * np.flatnonzero(rng.random(steps) < 0.6):
+                    end = onset + grid * rng.integers(1, 4)
+                    size = rng.integers(2, 5) if rng.random() < chord_density else 1
+                    root = rng.integers(36, 84) if not is_drum else rng.integers(35, 60)
+                    for pitch in root + np.array([0, 4, 7, 12])[:size]:
+                        onsets.append(onset)
+                        ends.append(end)
+                        pitches.append(int(pitch))
+
+            starts = quarters_to_seconds(onsets, change_quarters, change_tempi)
+            ends = quarters_to_seconds(ends, change_quarters, change_tempi)
+            velocities = rng.integers(60, 110, len(pitches))
+            for start, end, pitch, velocity in zip(starts, ends, pitches, velocities):
+                instrument.notes.append(pm.Note(velocity=int(velocity), pitch=pitch, start=float(start),
+                                                end=float(end)))
+            pretty.instruments.append(instrument)
+
+        name = "synthetic_" + str(index) + ".mid"
+        pretty.write(join(output_path, name))
+        names.append(name)
+    return names
+
+
+def time_stage(function, items: int = 1, repeat: int = 1, catch: bool = False):
+    """
+    Time a stage of the pipeline.
+
+    :param function: Function without arguments that runs the stage once.
+    :param items: Number of items processed by a single run, used for throughput.
+    :param repeat: Number of runs, the fastest one is reported.
+    :param catch: Whether an exception raised by the stage is recorded as its failure instead of being raised.
+    :return: Tuple of the stage result dictionary and the value returned by the last run
+    (None if the stage failed).
+    """
+    times = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            value = function()
+        except Exception as e:
+            if not catch:
+                raise
+            return {"failed": repr(e)}, None
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"time": best,
+            "times": times,
+            "items": items,
+            "items_per_second": items / best if best > 0 else None}, value
+
+
+def run_benchmark(corpus_path: str = None, work_path: str = None, repeat: int = 3, decoded: int = 4,
+                  **corpus_settings):
+    """
+    Time every stage of the pipeline on a synthetic corpus.
+
+    Stages are run in pipeline order, each one on the output of the previous one: splitting, music21 parsing,
+    subsequence preparation, conversion to tensors, music21 and direct pretty_midi
+    decoding of prepared subsequences, writing decoded streams, rectification and seed vector generation.
+    Stages whose dependencies are missing are reported as skipped, decoding stages that raise are reported
+    as failed, so a single broken stage does not discard timings of the others.
+
+    :param corpus_path: Directory of the corpus, a synthetic one is generated there if it is empty or missing.
+    :param work_path: Directory for split and regenerated files, a temporary one is created if not given.
+    :param repeat: Number of runs of fast stages, the fastest one is reported.
+    :param decoded: Number of predictions, runs of DECODED_MEASURES input measures, that are decoded and written.
+    :param corpus_settings: Parameters of generate_corpus().
+    :return: Dictionary with environment, settings and results of every stage.
+    """
+    work_path = work_path or mkdtemp(prefix="benchmark_")
+    corpus_path = corpus_path or join(work_path, "corpus")
+    split_path = join(work_path, "parts", "")
+    regen_path = join(work_path, "regen", "")
+    makedirs(split_path, exist_ok=True)
+    makedirs(regen_path, exist_ok=True)
+
+    stages = {}
+    corpus_files = listdir(corpus_path) if corpus_path and file_count(corpus_path) > 0 else None
+    if corpus_files is None:
+        stages["generate_corpus"], corpus_files = time_stage(lambda: generate_corpus(corpus_path,
+                                                                                     **corpus_settings))
+        stages["generate_corpus"]["items"] = len(corpus_files)
+
+    # splitting writes parts to the split directory, it is run only once so parts are not written repeatedly
+    splitter = MidiSplitter(join(corpus_path, ""), split_path)
+    stages["split_midi"], _ = time_stage(lambda: [splitter.split_midi(file) for file in corpus_files],
+                                         items=len(corpus_files))
+
+    import music21 as mu
+
+    split_files = sorted(listdir(split_path))
+
+    def parse():
+        sequences = []
+        for file in split_files:
+            sequence = mu.converter.parse(split_path + file, quantizePost=True,
+                                          quarterLengthDivisors=QUANTIZE_DIVISORS)
+            reassign_program(sequence, splitter.instruments_dict[file])
+            sequence.id = file
+            sequences.append(sequence)
+        return sequences
+
+    stages["parse"], sequences = time_stage(parse, items=len(split_files))
+    stages["parse"]["notes"] = sum(len(sequence.flat.notes) for sequence in sequences)
+
+    handler = StreamHandler(sequences)
+    stages["prepare_data"], _ = time_stage(handler.prepare_data, items=len(sequences), repeat=repeat)
+    ranges = handler.get_ranges()
+    stages["prepare_data"]["pairs"] = int(ranges[-1][2]) if len(ranges) > 0 else 0
+
+    try:
+        stages["get_data"], (inputs, _) = time_stage(handler.get_data, items=stages["prepare_data"]["pairs"],
+                                                     repeat=repeat)
+        inputs = inputs.numpy()
+    except ImportError as e:
+        # without tensorflow decoding stages get measures encoded straight from the first sequence
+        stages["get_data"] = {"skipped": repr(e)}
+        inputs = encode_sequence(sequences[0], 16, 6)[0] if len(sequences) > 0 else np.zeros((0, 17, 6))
+
+    # every decoded prediction is a run of consecutive measures
+    predictions = [inputs[index * DECODED_MEASURES:(index + 1) * DECODED_MEASURES]
+                   for index in range(min(decoded, len(inputs) // DECODED_MEASURES))]
+    stages["decode_data"], streams = time_stage(lambda: [handler.decode_data(prediction)
+                                                         for prediction in predictions],
+                                                items=len(predictions), repeat=repeat, catch=True)
+    if streams is not None:
+        stages["stream_to_file"], _ = time_stage(lambda: [stream_to_file(stream, regen_path + "regenerated_" +
+                                                                         str(index) + ".mid")
+                                                          for index, stream in enumerate(streams)],
+                                                 items=len(streams), repeat=repeat, catch=True)
+    else:
+        stages["stream_to_file"] = {"skipped": "decode_data failed"}
+    stages["write_batch"], _ = time_stage(lambda: handler.write_batch(
+        predictions, [regen_path + "decoded_" + str(index) + ".mid" for index in range(len(predictions))]),
+                                          items=len(predictions), repeat=repeat, catch=True)
+
+    rng = np.random.default_rng(0)
+    coords = rng.random((2048, 2)) * 100.0
+    vector = rng.random((1, 1024, 3)) * 100.0
+    stages["rectify_vector"], _ = time_stage(lambda: rectify_vector(vector, coords), items=vector.shape[1],
+                                             repeat=repeat)
+
+    stages["gen_zero_vector"], _ = time_stage(lambda: gen_zero_vector(64, 128), items=64, repeat=repeat)
+    # noise and partial vectors need vocabulary artifacts created by training, they are not synthesised
+    if file_exists("w2v_vocab"):
+        stages["gen_noise_vector"], _ = time_stage(lambda: gen_noise_vector(64, 128, 64), items=64, repeat=repeat)
+    else:
+        stages["gen_noise_vector"] = {"skipped": "w2v_vocab not found"}
+    if file_exists("dictionary") and file_exists("sequences"):
+        stages["gen_partial_vector"], _ = time_stage(lambda: gen_partial_vector(64, 128, 64), items=64,
+                                                     repeat=repeat)
+    else:
+        stages["gen_partial_vector"] = {"skipped": "dictionary or sequences not found"}
+
+    return {"version": BENCHMARK_VERSION,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "environment": {"python": platform.python_version(),
+                            "platform": platform.platform(),
+                            "numpy": np.__version__},
+            "settings": dict(corpus_settings, corpus_path=corpus_path, files=len(corpus_files),
+                             parts=len(split_files), repeat=repeat, decoded=decoded),
+            "stages": stages}
+
+
+def file_count(path: str):
+    try:
+        return len(listdir(path))
+    except FileNotFoundError:
+        return 0
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD):
+    """
+    Compare stage times of two benchmark runs.
+
+    :param baseline: Results of the reference run.
+    :param current: Results of the new run.
+    :param threshold: Relative slowdown above which a stage is reported as a regression.
+    :return: Tuple of a list of (stage, baseline time, current time, relative change) rows and a list of
+    stages that regressed.
+    """
+    rows = []
+    regressions = []
+    for stage, result in current["stages"].items():
+        reference = baseline["stages"].get(stage)
+        if reference is None or "time" not in reference or "time" not in result:
+            continue
+        change = (result["time"] - reference["time"]) / reference["time"] if reference["time"] > 0 else 0.0
+        rows.append((stage, reference["time"], result["time"], change))
+        if change > threshold:
+            regressions.append(stage)
+    if baseline.get("settings", {}).get("files") != current.get("settings", {}).get("files"):
+        print("Runs were done on corpora of different size, comparison may not be meaningful.")
+    return rows, regressions
+
+
+def print_results(results: dict):
+    for stage, result in results["stages"].items():
+        if "skipped" in result:
+            print("{0:<20} skipped ({1})".format(stage, result["skipped"]))
+        elif "failed" in result:
+            print("{0:<20} failed ({1})".format(stage, result["failed"]))
+        else:
+            rate = result["items_per_second"]
+            print("{0:<20} {1:>10.4f} s {2:>12} items/s".format(stage, result["time"],
+                                                                "{0:.1f}".format(rate) if rate else "-"))
+
+
+def print_comparison(rows: list, regressions: list, threshold: float):
+    for stage, reference, current, change in rows:
+        print("{0:<20} {1:>10.4f} s -> {2:>10.4f} s {3:>+8.1%}{4}".format(
+            stage, reference, current, change, "  REGRESSION" if stage in regressions else ""))
+    if regressions:
+        print(str(len(regressions)) + " stage(s) slower by more than " + "{0:.0%}".format(threshold) + ".")
+    else:
+        print("No regressions.")
+
+
+def main(arguments: list):
+    """
+    Run the benchmark and save results, or compare two saved results.
+
+    Usage:
+        python benchmark.py run [output.json] [--corpus path] [--files n] [--instruments n] [--measures n]
+            [--tempo-changes n] [--chord-density x] [--time-signature-changes n] [--seed n] [--repeat n]
+        python benchmark.py compare baseline.json current.json [--threshold x]
+
+    :param arguments: Command line arguments without the script name.
+    :return: Exit code, 1 if a comparison found regressions.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark of the MIDI preparation pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmark")
+    run.add_argument("output", nargs="?", default="benchmark.json")
+    run.add_argument("--corpus", default=None)
+    run.add_argument("--work", default=None)
+    run.add_argument("--files", type=int, default=8)
+    run.add_argument("--instruments", type=int, default=3)
+    run.add_argument("--measures", type=int, default=32)
+    run.add_argument("--tempo-changes", type=int, default=2)
+    run.add_argument("--chord-density", type=float, default=0.3)
+    run.add_argument("--time-signature-changes", type=int, default=1)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--repeat", type=int, default=3)
+
+    compare = commands.add_parser("compare", help="compare two benchmark results")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args(arguments)
+
+    if args.command == "run":
+        results = run_benchmark(args.corpus, args.work, args.repeat,
+                                files=args.files, instruments=args.instruments, measures=args.measures,
+                                tempo_changes=args.tempo_changes, chord_density=args.chord_density,
+                                time_signature_changes=args.time_signature_changes, seed=args.seed)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+        print_results(results)
+        print("Results saved to " + args.output + ".")
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    with open(args.current, "r") as f:
+        current = json.load(f)
+    rows, regressions = compare_results(baseline, current, args.threshold)
+    print_comparison(rows, regressions, args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+
+IMPORT_BUDGET = 1.0
+LIGHT_MODULES = ["utilities", "file", "encoding", "decoding", "Rectifier", "ArtifactStore", "SeedGenerator",
+                 "SequenceCache", "ShardStore", "Instrumentation", "RaggedMeasures", "NoteEvents", "MidiHandler",
+                 "Pipeline", "CorpusProfiler", "StreamHandler", "workers"]
+HEAVY_MODULES = ["tensorflow", "music21", "pretty_midi"]
+
+MEASURE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "heavy": [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module: str):
+    """
+    Measure import time of a module in a fresh interpreter.
+
+    :param module: Name of the module.
+    :return: Dictionary with import time in seconds and heavy modules that got imported with it.
+    """
+    script = MEASURE_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def check_imports(modules: list = None, budget: float = IMPORT_BUDGET):
+    """
+    Check that modules used by preprocessing workers and small tools import within the time budget
+    and without pulling in tensorflow, music21 or pretty_midi.
+
+    :param modules: Names of modules to check.
+    :param budget: Maximum import time of a single module in seconds.
+    :return: True if every module fits the budget.
+    """
+    passed = True
+    for module in modules or LIGHT_MODULES:
+        result = measure_import(module)
+        ok = result["time"] <= budget and len(result["heavy"]) == 0
+        passed = passed and ok
+        print(("OK  " if ok else "FAIL") + " " + module + ": " + "{0:.3f}".format(result["time"]) + " s" +
+              (" (imports " + ", ".join(result["heavy"]) + ")" if result["heavy"] else ""))
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_imports() else 1)
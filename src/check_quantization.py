@@ -0,0 +1,145 @@
+import json
+import sys
+import time
+from collections import Counter
+from os import listdir
+
+from MidiHandler import MidiSplitter, parse_part
+from file import directory_path
+
+WORST_PARTS = 10
+
+
+def note_keys(events):
+    """
+    Expand events into single notes, chords are compared pitch by pitch.
+
+    :param events: NoteEvents of a part.
+    :return: Counter of (onset, pitch) keys and dictionary of sorted durations of every key.
+    """
+    keys = Counter()
+    durations = {}
+    for note in events.notes:
+        for pitch in note["pitches"][:note["count"]]:
+            key = (round(float(note["onset"]), 6), int(pitch))
+            keys[key] += 1
+            durations.setdefault(key, []).append(float(note["duration"]))
+    return keys, {key: sorted(values) for key, values in durations.items()}
+
+
+def compare_part(part_name: str, part_data: bytes, instrument):
+    """
+    Quantize a single part by music21 quantizePost and by numpy and compare the results note by note.
+
+    :param part_name: Name of the part.
+    :param part_data: MIDI bytes of the part.
+    :param instrument: Commented music21.instrument created for the part by the splitter.
+    :return: Dictionary with numbers of notes, notes found by only one of the quantizers, notes whose durations
+    differ, the highest duration deviation and time spent by both quantizers.
+    """
+    wall = time.perf_counter()
+    reference = parse_part(part_name, part_data, instrument, compact=True)
+    music21_time = time.perf_counter() - wall
+    wall = time.perf_counter()
+    events = parse_part(part_name, part_data, instrument, compact=True, fast_quantize=True)
+    numpy_time = time.perf_counter() - wall
+
+    reference_keys, reference_durations = note_keys(reference)
+    keys, durations = note_keys(events)
+
+    duration_mismatches = 0
+    highest_deviation = 0.0
+    for key in reference_keys.keys() & keys.keys():
+        for expected, actual in zip(reference_durations[key], durations[key]):
+            if abs(expected - actual) > 1e-6:
+                duration_mismatches += 1
+                highest_deviation = max(highest_deviation, abs(expected - actual))
+
+    return {"part": part_name,
+            "notes_music21": sum(reference_keys.values()),
+            "notes_numpy": sum(keys.values()),
+            "only_music21": sum((reference_keys - keys).values()),
+            "only_numpy": sum((keys - reference_keys).values()),
+            "duration_mismatches": duration_mismatches,
+            "highest_duration_deviation": highest_deviation,
+            "music21_time": music21_time,
+            "numpy_time": numpy_time}
+
+
+def check_quantization(input_path: str, input_files: list = None, uniform_tempo: bool = True):
+    """
+    Compare numpy quantization with music21 quantizePost on every part of a corpus.
+
+    :param input_path: Directory of input MIDI files.
+    :param input_files: Names of compared files, all files in the input path are compared if not given.
+    :param uniform_tempo: Tempo setting of the splitter, see MidiSplitter.
+    :return: Dictionary with totals over all parts, parts that deviate and files that failed.
+    """
+    splitter = MidiSplitter(input_path, "", uniform_tempo=uniform_tempo, in_memory=True)
+    input_files = list(input_files if input_files is not None else listdir(input_path))
+
+    parts = []
+    failures = []
+    for file in input_files:
+        try:
+            for part_name, part_data, instrument in splitter.split_midi(file):
+                parts.append(compare_part(part_name, part_data, instrument))
+        except Exception as e:
+            failures.append((file, repr(e)))
+
+    deviating = [part for part in parts
+                 if part["only_music21"] or part["only_numpy"] or part["duration_mismatches"]]
+    deviating.sort(key=lambda part: part["only_music21"] + part["only_numpy"] + part["duration_mismatches"],
+                   reverse=True)
+    totals = {key: sum(part[key] for part in parts)
+              for key in ("notes_music21", "notes_numpy", "only_music21", "only_numpy", "duration_mismatches",
+                          "music21_time", "numpy_time")}
+    return dict(totals,
+                files=len(input_files),
+                parts=len(parts),
+                deviating_parts=len(deviating),
+                highest_duration_deviation=max([part["highest_duration_deviation"] for part in parts], default=0.0),
+                deviations=deviating,
+                failures=failures)
+
+
+def print_report(report: dict):
+    print("Compared " + str(report["parts"]) + " parts of " + str(report["files"]) + " files (" +
+          str(len(report["failures"])) + " failures)")
+    print("Notes: " + str(report["notes_music21"]) + " by music21, " + str(report["notes_numpy"]) + " by numpy, " +
+          str(report["only_music21"]) + " only by music21, " + str(report["only_numpy"]) + " only by numpy")
+    print("Duration mismatches: " + str(report["duration_mismatches"]) + " (highest deviation " +
+          "{0:.4f}".format(report["highest_duration_deviation"]) + " quarter lengths)")
+    print("Time: music21 " + "{0:.2f}".format(report["music21_time"]) + " s, numpy " +
+          "{0:.2f}".format(report["numpy_time"]) + " s")
+    for part in report["deviations"][:WORST_PARTS]:
+        print("  " + part["part"] + ": " + str(part["only_music21"]) + " only by music21, " +
+              str(part["only_numpy"]) + " only by numpy, " + str(part["duration_mismatches"]) +
+              " duration mismatches")
+
+
+def main(arguments: list):
+    """
+    usage: python check_quantization.py input_path [--files N] [--exact-tempo] [--output report.json]
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare numpy quantization with music21 quantizePost.")
+    parser.add_argument("input")
+    parser.add_argument("--files", type=int, default=None)
+    parser.add_argument("--exact-tempo", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(arguments)
+
+    input_path = directory_path(args.input)
+    input_files = sorted(listdir(input_path))[:args.files]
+    report = check_quantization(input_path, input_files, uniform_tempo=not args.exact_tempo)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    return 0 if report["deviating_parts"] == 0 and not report["failures"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
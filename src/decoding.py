@@ -0,0 +1,157 @@
+import numpy as np
+from io import BytesIO
+from encoding import NOTE_LINE_LEN
+
+DEFAULT_TEMPO = 120.0
+DEFAULT_VELOCITY = 90
+RESOLUTION = 220
+
+
+def decode_to_pretty(predictions, resolution: int = RESOLUTION):
+    """
+    Translate network output straight into pretty_midi object, without building a music21 stream.
+
+    Instrument is taken from the very first tag_line (MIDI program won't change throughout the song),
+    tempo changes are created from the metronome column and time signatures from tag_lines.
+    Zero-padded note lines and zero pitches are skipped.
+
+    :param predictions: Array of shape [measures, subsequence_length + 1, subsequence_width].
+    :param resolution: Ticks per quarter note of created MIDI.
+    :return: pretty_midi.PrettyMIDI with a single instrument, without any instrument if predictions have no measure.
+    """
+    import pretty_midi as pm
+
+    predictions = np.asarray(predictions, dtype=np.float64)
+    if len(predictions) == 0:
+        return pm.PrettyMIDI(resolution=resolution, initial_tempo=DEFAULT_TEMPO)
+    tag_lines = predictions[:, 0]
+    lines = predictions[:, 1:]
+
+    # note lines without any pitch are padding
+    pitches = np.rint(lines[:, :, NOTE_LINE_LEN:]).astype(np.int64)
+    pitches[(pitches < 1) | (pitches > 127)] = 0
+    valid = pitches.max(axis=2, initial=0) > 0
+
+    measure_index, line_index = np.nonzero(valid)
+    onsets = tag_lines[measure_index, 0] + lines[measure_index, line_index, 0]
+    durations = lines[measure_index, line_index, 2]
+    metronomes = lines[measure_index, line_index, 1]
+    pitches = pitches[measure_index, line_index]
+
+    order = np.argsort(onsets, kind="stable")
+    onsets, durations, metronomes, pitches = onsets[order], durations[order], metronomes[order], pitches[order]
+
+    # a tempo change is created whenever the metronome column changes its value
+    change_mask = metronomes > 0
+    change_mask[1:] &= metronomes[1:] != metronomes[:-1]
+    change_offsets = onsets[change_mask]
+    change_tempi = metronomes[change_mask]
+    if len(change_offsets) == 0 or change_offsets[0] > 0:
+        first_tempo = change_tempi[0] if len(change_tempi) > 0 else DEFAULT_TEMPO
+        change_offsets = np.concatenate(([0.0], change_offsets))
+        change_tempi = np.concatenate(([first_tempo], change_tempi))
+    # only the last of tempo changes at the same offset is kept
+    last = np.concatenate((change_offsets[1:] != change_offsets[:-1], [True]))
+    change_offsets, change_tempi = change_offsets[last], change_tempi[last]
+
+    pretty = pm.PrettyMIDI(resolution=resolution, initial_tempo=float(change_tempi[0]))
+    write_tempo_changes(pretty, change_offsets, change_tempi, (onsets + durations).max(initial=0))
+
+    starts = quarters_to_seconds(onsets, change_offsets, change_tempi)
+    ends = quarters_to_seconds(onsets + durations, change_offsets, change_tempi)
+
+    # time signatures are added when they change between measures
+    signatures = tag_lines[:, 3:5]
+    signature_mask = np.concatenate(([True], np.any(signatures[1:] != signatures[:-1], axis=1)))
+    for offset, (numerator, denominator) in zip(tag_lines[signature_mask, 0], signatures[signature_mask]):
+        if numerator < 1 or denominator < 1:
+            continue
+        time = float(quarters_to_seconds(np.array([offset]), change_offsets, change_tempi)[0])
+        pretty.time_signature_changes.append(pm.TimeSignature(int(numerator), int(denominator), time))
+
+    instrument = pm.Instrument(program=int(np.clip(tag_lines[0, 1], 0, 127)), is_drum=bool(tag_lines[0, 2]))
+    for start, end, chord in zip(starts, ends, pitches):
+        for pitch in chord[chord > 0]:
+            instrument.notes.append(pm.Note(velocity=DEFAULT_VELOCITY, pitch=int(pitch),
+                                            start=float(start), end=float(end)))
+    pretty.instruments.append(instrument)
+    return pretty
+
+
+def write_tempo_changes(pretty, change_offsets, change_tempi, end: float = 0.0):
+    """
+    Write tempo changes into a pretty_midi object.
+
+    pretty_midi has no public interface for tempo changes, they are written into its tick scales by set_tick_scales().
+
+    :param pretty: pretty_midi.PrettyMIDI created with the first tempo as its initial tempo.
+    :param change_offsets: Sorted array of tempo change offsets in quarter lengths, the first one at 0.
+    :param change_tempi: Array of tempi set by the tempo changes.
+    :param end: Offset of the end of the last note, tick to time mapping is computed up to it.
+    :return:
+    """
+    resolution = pretty.resolution
+    change_ticks = np.rint(np.asarray(change_offsets, dtype=np.float64) * resolution).astype(np.int64)
+    set_tick_scales(pretty, [(int(tick), 60.0 / (float(tempo) * resolution))
+                             for tick, tempo in zip(change_ticks, change_tempi)],
+                    int(max(round(end * resolution), change_ticks.max())))
+
+
+def set_tick_scales(pretty, tick_scales: list, max_tick: int):
+    """
+    Replace tick scales of a pretty_midi object and update its tick to time mapping.
+
+    It is the only place relying on private attributes of pretty_midi.PrettyMIDI.
+
+    :param pretty: pretty_midi.PrettyMIDI.
+    :param tick_scales: List of (tick, seconds per tick) tuples sorted by tick, the first one at tick 0.
+    :param max_tick: Highest tick the mapping has to cover.
+    :return:
+    """
+    pretty._tick_scales = tick_scales
+    pretty._update_tick_to_time(max_tick + 1)
+
+
+def quarters_to_seconds(offsets, change_offsets, change_tempi):
+    """
+    Convert offsets in quarter lengths into seconds using a sorted tempo map.
+
+    :param offsets: Array of offsets in quarter lengths.
+    :param change_offsets: Sorted array of tempo change offsets, the first one at 0.
+    :param change_tempi: Array of tempi set by the tempo changes.
+    :return: Array of times in seconds.
+    """
+    offsets = np.asarray(offsets, dtype=np.float64)
+    change_seconds = np.concatenate(([0.0], np.cumsum(np.diff(change_offsets) * 60.0 / change_tempi[:-1])))
+    index = np.clip(np.searchsorted(change_offsets, offsets, side="right") - 1, 0, None)
+    return change_seconds[index] + (offsets - change_offsets[index]) * 60.0 / change_tempi[index]
+
+
+def decode_batch(batch, resolution: int = RESOLUTION):
+    """
+    Translate a batch of network outputs into pretty_midi objects.
+
+    :param batch: Array of shape [batch, measures, subsequence_length + 1, subsequence_width].
+    :param resolution: Ticks per quarter note of created MIDIs.
+    :return: List of pretty_midi.PrettyMIDI objects.
+    """
+    return [decode_to_pretty(predictions, resolution) for predictions in batch]
+
+
+def write_batch(batch, output_paths: list, resolution: int = RESOLUTION):
+    """
+    Translate a batch of network outputs and write each of them into a MIDI file.
+
+    :param batch: Array of shape [batch, measures, subsequence_length + 1, subsequence_width].
+    :param output_paths: Path of the output file for every item of the batch.
+    :param resolution: Ticks per quarter note of created MIDIs.
+    :return:
+    """
+    for predictions, output_path in zip(batch, output_paths):
+        decode_to_pretty(predictions, resolution).write(output_path)
+
+
+def pretty_to_bytes(pretty):
+    buffer = BytesIO()
+    pretty.write(buffer)
+    return buffer.getvalue()
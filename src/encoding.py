@@ -0,0 +1,360 @@
+import numpy as np
+
+TAG_LINE_LEN = 5
+NOTE_LINE_LEN = 3
+QUANTIZE_DIVISORS = (4, 3)
+
+
+def times_to_quarters(pretty, times):
+    """
+    Convert times in seconds into offsets in quarter lengths using tempo map of a pretty_midi object.
+
+    :param pretty: pretty_midi.PrettyMIDI whose tempo changes are used.
+    :param times: Array of times in seconds.
+    :return: Array of offsets in quarter lengths.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    change_times, tempi = pretty.get_tempo_changes()
+    # offset of every tempo change is the sum of all previous tempo segments
+    change_quarters = np.concatenate(([0.0], np.cumsum(np.diff(change_times) * tempi[:-1] / 60.0)))
+    index = np.clip(np.searchsorted(change_times, times, side="right") - 1, 0, None)
+    return change_quarters[index] + (times - change_times[index]) * tempi[index] / 60.0
+
+
+def quantize(values, divisors: tuple = QUANTIZE_DIVISORS):
+    """
+    Snap values to the nearest multiple of 1/divisor, choosing the divisor with the smallest error.
+
+    Ties are resolved in favour of the finer grid, the same way music21 chooses its best match.
+
+    :param values: Array of offsets or durations in quarter lengths.
+    :param divisors: Subdivisions of a quarter note that make up the grid.
+    :return: Array of quantized values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    best = None
+    best_error = None
+    for divisor in sorted(divisors, reverse=True):
+        match = np.floor(values * divisor + 0.5) / divisor
+        error = np.abs(values - match)
+        if best is None:
+            best, best_error = match, error
+        else:
+            better = error < best_error
+            best = np.where(better, match, best)
+            best_error = np.where(better, error, best_error)
+    return best
+
+
+def quantize_notes(starts, ends, divisors: tuple = QUANTIZE_DIVISORS):
+    """
+    Quantize onsets and durations of all notes of a part at once, replacing music21 quantizePost.
+
+    Onsets and durations are snapped separately, as music21 does, and notes are not allowed to disappear,
+    a duration quantized to zero becomes the shortest duration of the grid instead.
+
+    :param starts: Array of note starts in quarter lengths.
+    :param ends: Array of note ends in quarter lengths.
+    :param divisors: Subdivisions of a quarter note that make up the grid, e.g. (4, 3) for sixteenths and triplets.
+    :return: Tuple of arrays of quantized onsets and durations.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    onsets = quantize(starts, divisors)
+    durations = quantize(np.asarray(ends, dtype=np.float64) - starts, divisors)
+    return onsets, np.where(durations > 0, durations, 1.0 / max(divisors))
+
+
+def measure_grid(time_signatures: list, end: float):
+    """
+    Compute measures that cover offsets from 0 to end.
+
+    :param time_signatures: List of (offset, numerator, denominator) sorted by offset.
+    If the list is empty or does not start at 0, 4/4 is assumed at the beginning.
+    :param end: Offset that has to be covered by the last measure.
+    :return: Tuple of arrays with measure starts, numerators and denominators.
+    """
+    if len(time_signatures) == 0 or time_signatures[0][0] > 0:
+        time_signatures = [(0.0, 4, 4)] + list(time_signatures)
+
+    starts = []
+    numerators = []
+    denominators = []
+    for index, (offset, numerator, denominator) in enumerate(time_signatures):
+        length = numerator * 4.0 / denominator
+        if index + 1 < len(time_signatures):
+            count = int(np.ceil((time_signatures[index + 1][0] - offset) / length - 1e-9))
+        else:
+            count = int(np.floor((max(end, offset) - offset) / length)) + 1
+        if count <= 0:
+            continue
+        starts.append(offset + np.arange(count) * length)
+        numerators.append(np.full(count, numerator, dtype=np.float64))
+        denominators.append(np.full(count, denominator, dtype=np.float64))
+    return np.concatenate(starts), np.concatenate(numerators), np.concatenate(denominators)
+
+
+def lookup_tempi(offsets, measure_starts, measure_ends, change_offsets, change_tempi, nearest: bool = True):
+    """
+    Find tempo for every note using a sorted tempo map.
+
+    With nearest semantics a note takes the tempo of the closest tempo boundary within its measure
+    (measure start or a tempo change inside the measure, ties resolved in favour of the earlier one),
+    which is how music21 metronome mark boundaries of a measure were used. Otherwise the musically correct
+    tempo in effect at the note's offset is used.
+
+    :param offsets: Array of absolute note offsets.
+    :param measure_starts: Array of starts of measures that contain the notes.
+    :param measure_ends: Array of ends of measures that contain the notes.
+    :param change_offsets: Sorted array of tempo change offsets, the first one at 0.
+    :param change_tempi: Array of tempi set by the tempo changes.
+    :param nearest: Whether nearest boundary or most recent boundary semantics are used.
+    :return: Array of tempi.
+    """
+    offsets = np.asarray(offsets, dtype=np.float64)
+    change_offsets = np.asarray(change_offsets, dtype=np.float64)
+    change_tempi = np.asarray(change_tempi, dtype=np.float64)
+
+    index = np.clip(np.searchsorted(change_offsets, offsets, side="right") - 1, 0, None)
+    tempi = change_tempi[index]
+    if not nearest:
+        return tempi
+
+    # the closest boundary before the note is either the measure start or the latest tempo change
+    left = np.maximum(measure_starts, change_offsets[index])
+    next_index = np.minimum(index + 1, len(change_offsets) - 1)
+    right = change_offsets[next_index]
+    use_right = (index + 1 < len(change_offsets)) & (right < measure_ends) & (right - offsets < offsets - left)
+    return np.where(use_right, change_tempi[next_index], tempi)
+
+
+def pretty_to_notes(pretty, divisors: tuple = QUANTIZE_DIVISORS):
+    """
+    Extract quantized notes of a pretty_midi object and group simultaneous ones into chords.
+
+    :param pretty: pretty_midi.PrettyMIDI with a single instrument.
+    :param divisors: Subdivisions of a quarter note used for quantization.
+    :return: Tuple of onsets, durations, zero-padded pitch matrix of shape [notes, chord size]
+    and number of pitches of every note, notes are sorted by onset.
+    """
+    notes = [note for instrument in pretty.instruments for note in instrument.notes]
+    if len(notes) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros((0, 1)), np.zeros(0, dtype=np.int64)
+
+    starts = times_to_quarters(pretty, [note.start for note in notes])
+    ends = times_to_quarters(pretty, [note.end for note in notes])
+    pitches = np.array([note.pitch for note in notes], dtype=np.float64)
+    onsets, durations = quantize_notes(starts, ends, divisors)
+
+    order = np.lexsort((pitches, onsets))
+    onsets = onsets[order]
+    durations = durations[order]
+    pitches = pitches[order]
+
+    # notes starting at the same offset form a chord
+    group_starts = np.flatnonzero(np.concatenate(([True], onsets[1:] != onsets[:-1])))
+    counts = np.diff(np.concatenate((group_starts, [len(onsets)])))
+    groups = np.repeat(np.arange(len(group_starts)), counts)
+    ranks = np.arange(len(onsets)) - group_starts[groups]
+
+    pitch_matrix = np.zeros((len(group_starts), counts.max()), dtype=np.float64)
+    pitch_matrix[groups, ranks] = pitches
+    return onsets[group_starts], np.maximum.reduceat(durations, group_starts), pitch_matrix, counts
+
+
+def encode_notes(onsets, durations, pitches, counts, time_signatures: list, tempo_changes: tuple,
+                 program: float, is_drum: float, subsequence_length: int, subsequence_width: int,
+                 nearest_tempo: bool = True):
+    """
+    Encode notes into subsequences of the same layout as StreamHandler creates from music21 streams.
+
+    Notes are bucketed into measures computed from time signatures, every non-empty measure
+    becomes a tag_line followed by note lines, all with vectorised numpy operations.
+
+    :param onsets: Sorted array of absolute note offsets in quarter lengths.
+    :param durations: Array of note durations in quarter lengths.
+    :param pitches: Zero-padded pitch matrix of shape [notes, chord size].
+    :param counts: Number of pitches of every note.
+    :param time_signatures: List of (offset, numerator, denominator) sorted by offset.
+    :param tempo_changes: Tuple of arrays of tempo change offsets and tempi.
+    :param program: MIDI program stored in tag_line.
+    :param is_drum: Drum flag stored in tag_line.
+    :param subsequence_length: Maximum number of notes stored in one measure.
+    :param subsequence_width: Width of tag_line and note lines.
+    :param nearest_tempo: Whether nearest or most recent tempo boundary is used for non-uniform tempo.
+    :return: Tuple of float32 array of shape [measures, subsequence_length + 1, subsequence_width],
+    list of (offset, numerator, denominator) tags for each measure, highest width loss and highest length loss.
+    """
+    onsets = np.asarray(onsets, dtype=np.float64)
+    if len(onsets) == 0:
+        return np.zeros((0, subsequence_length + 1, subsequence_width), dtype=np.float32), [], 0, 0
+
+    starts, numerators, denominators, measure_index, local_offsets, keep, rows, ranks, tempi = \
+        _bucket_notes(onsets, time_signatures, tempo_changes, nearest_tempo)
+
+    subsequences = np.zeros((int(keep.sum()), subsequence_length + 1, subsequence_width), dtype=np.float32)
+    subsequences[:, 0, 0] = starts[keep]
+    subsequences[:, 0, 1] = program
+    subsequences[:, 0, 2] = is_drum
+    subsequences[:, 0, 3] = numerators[keep]
+    subsequences[:, 0, 4] = denominators[keep]
+
+    kept_notes = keep[measure_index]
+    stored = kept_notes & (ranks < subsequence_length)
+    target_rows = rows[measure_index[stored]]
+    target_lines = ranks[stored] + 1
+    subsequences[target_rows, target_lines, 0] = local_offsets[stored]
+    subsequences[target_rows, target_lines, 1] = tempi[stored]
+    subsequences[target_rows, target_lines, 2] = np.asarray(durations)[stored]
+    pitch_slots = min(subsequence_width - NOTE_LINE_LEN, np.shape(pitches)[1])
+    subsequences[target_rows, target_lines, NOTE_LINE_LEN:NOTE_LINE_LEN + pitch_slots] = \
+        np.asarray(pitches)[stored, :pitch_slots]
+
+    # losses are reported the same way as by music21 based encoding
+    widths = np.concatenate(([0], NOTE_LINE_LEN + np.asarray(counts)[kept_notes]))
+    highest_width_loss = int(widths.max()) if widths.max() > subsequence_width else 0
+    note_counts = np.bincount(measure_index[kept_notes], minlength=len(starts))
+    highest_length_loss = int(note_counts.max()) if note_counts.max() > subsequence_length else 0
+
+    tags = list(zip(starts[keep].tolist(), numerators[keep].tolist(), denominators[keep].tolist()))
+    return subsequences, tags, highest_width_loss, highest_length_loss
+
+
+def encode_notes_ragged(onsets, durations, pitches, counts, time_signatures: list, tempo_changes: tuple,
+                        program: float, is_drum: float, subsequence_width: int, nearest_tempo: bool = True):
+    """
+    Encode notes into measures of variable length, without padding them to a common number of note lines.
+
+    Every non-empty measure becomes a tag_line followed by one line for every note, measures are stored
+    one after another in a single array of lines together with row splits, so no note is truncated
+    and no line is spent on padding.
+
+    :param subsequence_width: Width of tag_line and note lines.
+    :return: Tuple of float32 array of lines of shape [lines, subsequence_width], integer array of row splits
+    (measure i spans lines row_splits[i]:row_splits[i + 1]), list of (offset, numerator, denominator) tags
+    for each measure and highest width loss. See encode_notes() for other parameters.
+    """
+    onsets = np.asarray(onsets, dtype=np.float64)
+    if len(onsets) == 0:
+        return np.zeros((0, subsequence_width), dtype=np.float32), np.zeros(1, dtype=np.int64), [], 0
+
+    starts, numerators, denominators, measure_index, local_offsets, keep, rows, ranks, tempi = \
+        _bucket_notes(onsets, time_signatures, tempo_changes, nearest_tempo)
+
+    kept_notes = keep[measure_index]
+    note_counts = np.bincount(measure_index[kept_notes], minlength=len(starts))[keep]
+    row_splits = np.concatenate(([0], np.cumsum(note_counts + 1))).astype(np.int64)
+
+    lines = np.zeros((int(row_splits[-1]), subsequence_width), dtype=np.float32)
+    tag_lines = row_splits[:-1]
+    lines[tag_lines, 0] = starts[keep]
+    lines[tag_lines, 1] = program
+    lines[tag_lines, 2] = is_drum
+    lines[tag_lines, 3] = numerators[keep]
+    lines[tag_lines, 4] = denominators[keep]
+
+    targets = row_splits[rows[measure_index[kept_notes]]] + ranks[kept_notes] + 1
+    lines[targets, 0] = local_offsets[kept_notes]
+    lines[targets, 1] = tempi[kept_notes]
+    lines[targets, 2] = np.asarray(durations)[kept_notes]
+    pitch_slots = min(subsequence_width - NOTE_LINE_LEN, np.shape(pitches)[1])
+    lines[targets, NOTE_LINE_LEN:NOTE_LINE_LEN + pitch_slots] = np.asarray(pitches)[kept_notes, :pitch_slots]
+
+    widths = np.concatenate(([0], NOTE_LINE_LEN + np.asarray(counts)[kept_notes]))
+    highest_width_loss = int(widths.max()) if widths.max() > subsequence_width else 0
+
+    tags = list(zip(starts[keep].tolist(), numerators[keep].tolist(), denominators[keep].tolist()))
+    return lines, row_splits, tags, highest_width_loss
+
+
+def notes_per_measure(onsets, time_signatures: list):
+    """
+    Count notes of every measure that encoding keeps, without encoding anything.
+
+    :param onsets: Sorted array of absolute note offsets in quarter lengths.
+    :param time_signatures: List of (offset, numerator, denominator) sorted by offset.
+    :return: Integer array with number of notes of every non-empty measure.
+    """
+    onsets = np.asarray(onsets, dtype=np.float64)
+    if len(onsets) == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts, _, _, measure_index, _, keep = _measure_notes(onsets, time_signatures)
+    return np.bincount(measure_index, minlength=len(starts))[keep]
+
+
+def _measure_notes(onsets, time_signatures: list):
+    """
+    Assign sorted notes to measures computed from time signatures and find measures that encoding keeps.
+
+    :return: Tuple of measure starts, numerators and denominators, measure index and offset within the measure
+    of every note and mask of kept (non-empty) measures.
+    """
+    starts, numerators, denominators = measure_grid(time_signatures, onsets[-1])
+
+    # bucketing notes into measures
+    measure_index = np.searchsorted(starts, onsets, side="right") - 1
+    local_offsets = onsets - starts[measure_index]
+
+    # measures without notes or with notes only on the downbeat are skipped
+    highest = np.full(len(starts), -1.0)
+    np.maximum.at(highest, measure_index, local_offsets)
+    return starts, numerators, denominators, measure_index, local_offsets, highest > 0.0
+
+
+def _bucket_notes(onsets, time_signatures: list, tempo_changes: tuple, nearest_tempo: bool):
+    """
+    Assign sorted notes to measures, shared by padded and ragged encoding.
+
+    :return: Tuple of _measure_notes() extended by row of every measure among kept ones, position of every
+    note within its measure and tempo of every note.
+    """
+    starts, numerators, denominators, measure_index, local_offsets, keep = _measure_notes(onsets, time_signatures)
+    ends = starts + numerators * 4.0 / denominators
+    rows = np.cumsum(keep) - 1
+
+    # position of every note within its measure
+    first_note = np.searchsorted(measure_index, measure_index, side="left")
+    ranks = np.arange(len(onsets)) - first_note
+
+    change_offsets, change_tempi = tempo_changes
+    if len(change_offsets) == 1:
+        tempi = np.full(len(onsets), float(change_tempi[0]))
+    else:
+        tempi = lookup_tempi(onsets, starts[measure_index], ends[measure_index],
+                             change_offsets, change_tempi, nearest_tempo)
+    return starts, numerators, denominators, measure_index, local_offsets, keep, rows, ranks, tempi
+
+
+def encode_pretty_part(pretty, subsequence_length: int, subsequence_width: int, nearest_tempo: bool = True,
+                       divisors: tuple = QUANTIZE_DIVISORS):
+    """
+    Encode a single-instrument pretty_midi object without building a music21 stream.
+
+    :param pretty: pretty_midi.PrettyMIDI with a single instrument.
+    :param subsequence_length: Maximum number of notes stored in one measure.
+    :param subsequence_width: Width of tag_line and note lines.
+    :param nearest_tempo: Whether nearest or most recent tempo boundary is used for non-uniform tempo.
+    :param divisors: Subdivisions of a quarter note used for quantization.
+    :return: Same tuple as encode_notes().
+    """
+    onsets, durations, pitches, counts = pretty_to_notes(pretty, divisors)
+    time_signatures, tempo_changes = pretty_maps(pretty, divisors)
+
+    instrument = pretty.instruments[0]
+    return encode_notes(onsets, durations, pitches, counts, time_signatures, tempo_changes,
+                        float(instrument.program), float(instrument.is_drum),
+                        subsequence_length, subsequence_width, nearest_tempo)
+
+
+def pretty_maps(pretty, divisors: tuple = QUANTIZE_DIVISORS):
+    """
+    Extract time signature and tempo maps of a pretty_midi object in quantized quarter lengths.
+
+    :param pretty: pretty_midi.PrettyMIDI whose maps are extracted.
+    :param divisors: Subdivisions of a quarter note used for quantization.
+    :return: Tuple of a list of (offset, numerator, denominator) time signatures
+    and a tuple of arrays of tempo change offsets and tempi.
+    """
+    time_signatures = [(float(quantize(times_to_quarters(pretty, [ts.time]), divisors)[0]),
+                        ts.numerator, ts.denominator) for ts in pretty.time_signature_changes]
+    change_times, change_tempi = pretty.get_tempo_changes()
+    return time_signatures, (quantize(times_to_quarters(pretty, change_times), divisors), change_tempi)
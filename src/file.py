@@ -1,8 +1,11 @@
 import pickle as pkl
-import music21 as mu
+from os import sep
+from os.path import exists
 
 
 def stream_to_file(stream, output_path):
+    import music21 as mu
+
     mf = mu.midi.translate.streamToMidiFile(stream)
     mf.open(output_path, 'wb')
     mf.write()
@@ -18,3 +21,12 @@ def save_file(file_name, data):
 def load_file(file_name):
     with open("../pkl_files/" + file_name + ".pkl", 'rb') as f:
         return pkl.load(f)
+
+
+def file_exists(file_name):
+    return exists("../pkl_files/" + file_name + ".pkl")
+
+
+def directory_path(path):
+    # MidiSplitter joins input path and file names directly, so the path has to end with a separator
+    return path if path.endswith(("/", "\\")) else path + sep
@@ -5,17 +5,37 @@
 # Intuitive Analysis, Creation and Manipulation of MIDI Data with pretty_midi.
 # In 15th International Conference on Music Information Retrieval Late Breaking and Demo Papers, 2014.
 
+import sys
+
 from MidiHandler import MidiHandler
 from StreamHandler import StreamHandler
+from Pipeline import Pipeline
 
-if __name__ == "__main__":
+if __name__ == "__main__" and "--pipeline" in sys.argv:
+    # all stages run at once, each input file streams through splitting, parsing and encoding
+    handler2 = StreamHandler([])
+    pipeline = Pipeline("..\\MIDIs\\input\\", uniform_tempo=False)
+    pipeline.run(handler2)
+    handler2.backup()
+    x, y = handler2.get_data()
+elif __name__ == "__main__":
     handler = MidiHandler()
-    handler.clear_data()
+    # previously prepared corpus is updated only with changes in the input directory
+    incremental = handler.has_backup()
+    if incremental:
+        handler.rollback()
+    else:
+        handler.clear_data()
     handler.toggle_uniform_tempo()
-    handler.prepare_data()
+    handler.prepare_data(incremental=incremental)
+    handler.backup()
     s = handler.get_data()
 
-    handler2 = StreamHandler(s)
-    handler2.prepare_data()
+    handler2 = StreamHandler(s, handler.get_sources())
+    if incremental and handler2.has_backup():
+        handler2.rollback()
+    handler2.prepare_data(incremental=incremental, stale_sources=handler.get_stale_parts())
+    handler2.backup()
+    handler.record_ranges(handler2.get_ranges())
     x, y = handler2.get_data()
 
@@ -0,0 +1,34 @@
+from concurrent.futures import ProcessPoolExecutor
+
+
+def ordered_map(function, tasks: list, workers: int = 1):
+    """
+    Apply a function to every task, in a pool of worker processes if there is more than one worker.
+
+    Results are yielded in the order of tasks, so they can be reported while the remaining tasks are processed.
+    The function has to be defined on module level, so it can be sent to worker processes.
+    An exception raised by the function or by a worker process (e.g. when the pool got broken) is not propagated,
+    its description is yielded instead of a result. The pool is shut down when the generator is exhausted or closed.
+
+    :param function: Function processing a single task.
+    :param tasks: List of tuples of positional arguments of the function.
+    :param workers: Number of worker processes, tasks are processed in this process if it is 1.
+    :return: Generator of (result, error) tuples, error is None if the task succeeded, result is None if it failed.
+    """
+    executor = None
+    futures = []
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        futures = [executor.submit(function, *task) for task in tasks]
+
+    try:
+        for index, task in enumerate(tasks):
+            try:
+                result = futures[index].result() if executor is not None else function(*task)
+            except Exception as e:
+                yield None, repr(e)
+            else:
+                yield result, None
+    finally:
+        if executor is not None:
+            executor.shutdown()
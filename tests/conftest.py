@@ -0,0 +1,7 @@
+import sys
+from os.path import abspath, dirname, join
+
+# modules of the repository import each other by bare names from src
+SRC_PATH = join(dirname(dirname(abspath(__file__))), "src")
+if SRC_PATH not in sys.path:
+    sys.path.insert(0, SRC_PATH)
@@ -0,0 +1,46 @@
+from os import utime
+
+from CorpusManifest import CorpusManifest
+
+SETTINGS = {"uniform_tempo": True}
+
+
+def prepared(tmp_path, files: dict):
+    input_path = str(tmp_path / "input") + "/"
+    (tmp_path / "input").mkdir()
+    manifest = CorpusManifest(str(tmp_path / "manifest.json"))
+    for name, content in files.items():
+        (tmp_path / "input" / name).write_bytes(content)
+        manifest.update_file(input_path, name, [name + "_part_0"])
+    manifest.settings = dict(SETTINGS)
+    manifest.save()
+    manifest.load()
+    return input_path, manifest
+
+
+def test_compare_finds_added_changed_removed_unchanged(tmp_path):
+    input_path, manifest = prepared(tmp_path, {"a.mid": b"a", "b.mid": b"b", "c.mid": b"c"})
+    (tmp_path / "input" / "b.mid").write_bytes(b"bb")
+    (tmp_path / "input" / "c.mid").unlink()
+    (tmp_path / "input" / "d.mid").write_bytes(b"d")
+
+    added, changed, removed, unchanged = manifest.compare(input_path, ["a.mid", "b.mid", "d.mid"], SETTINGS)
+    assert (added, changed, removed, unchanged) == (["d.mid"], ["b.mid"], ["c.mid"], ["a.mid"])
+
+
+def test_compare_ignores_touched_files(tmp_path):
+    input_path, manifest = prepared(tmp_path, {"a.mid": b"a"})
+    utime(input_path + "a.mid", (1, 1))
+    assert manifest.compare(input_path, ["a.mid"], SETTINGS) == ([], [], [], ["a.mid"])
+
+
+def test_compare_with_other_settings_changes_every_file(tmp_path):
+    input_path, manifest = prepared(tmp_path, {"a.mid": b"a", "b.mid": b"b"})
+    assert manifest.compare(input_path, ["a.mid", "b.mid"], {"uniform_tempo": False}) == \
+        ([], ["a.mid", "b.mid"], [], [])
+
+
+def test_load_without_manifest(tmp_path):
+    manifest = CorpusManifest(str(tmp_path / "manifest.json"))
+    assert not manifest.load()
+    assert manifest.files == {} and manifest.settings == {}
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from decoding import decode_to_pretty
+from encoding import encode_notes, encode_pretty_part
+
+# decoding imports pretty_midi only when it is called
+pytest.importorskip("pretty_midi")
+
+TIME_SIGNATURES = [(0.0, 4, 4), (8.0, 3, 4)]
+
+
+@pytest.mark.parametrize("tempo", [120.0, 87.0])
+def test_decoded_measures_encode_again(tempo):
+    onsets = np.array([0.0, 0.5, 1.0, 2.75, 4.0, 5.0, 8.0, 9.5, 10.0])
+    durations = np.array([0.5, 0.5, 1.0, 0.25, 1.0, 2.0, 1.5, 0.5, 1.0])
+    pitches = np.array([[60, 64, 67], [62, 0, 0], [64, 0, 0], [65, 69, 0], [67, 0, 0], [48, 55, 0],
+                        [72, 0, 0], [71, 0, 0], [69, 0, 0]])
+    counts = (pitches > 0).sum(axis=1)
+    subsequences, tags, _, _ = encode_notes(onsets, durations, pitches, counts, TIME_SIGNATURES,
+                                            (np.array([0.0]), np.array([tempo])), 33.0, 0.0, 8, 6)
+
+    pretty = decode_to_pretty(subsequences)
+    assert pretty.instruments[0].program == 33
+    again, again_tags, _, _ = encode_pretty_part(pretty, 8, 6)
+    assert again_tags == tags
+    assert np.allclose(again, subsequences)
+
+
+def test_empty_predictions_decode_to_empty_midi():
+    pretty = decode_to_pretty(np.zeros((0, 9, 6)))
+    assert pretty.instruments == []
+    assert pretty.get_end_time() == 0.0
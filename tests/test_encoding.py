@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from encoding import encode_notes, encode_notes_ragged, lookup_tempi, notes_per_measure, quantize_notes
+
+TEMPO = (np.array([0.0]), np.array([120.0]))
+FOUR_FOUR = [(0.0, 4, 4)]
+
+
+def notes(onsets, pitches=60):
+    onsets = np.asarray(onsets, dtype=np.float64)
+    return onsets, np.full(len(onsets), 0.5), np.full((len(onsets), 1), pitches), np.ones(len(onsets), dtype=int)
+
+
+def test_encode_notes_layout():
+    onsets, durations, pitches, counts = notes([0.0, 0.5, 1.0, 8.0, 9.5])
+    subsequences, tags, width_loss, length_loss = encode_notes(onsets, durations, pitches, counts, FOUR_FOUR,
+                                                               TEMPO, 3.0, 0.0, 4, 6)
+    assert subsequences.shape == (2, 5, 6)
+    assert tags == [(0.0, 4.0, 4.0), (8.0, 4.0, 4.0)]
+    assert np.allclose(subsequences[0, 0, :5], [0.0, 3.0, 0.0, 4.0, 4.0])
+    assert np.allclose(subsequences[0, 1:4, 0], [0.0, 0.5, 1.0])
+    assert np.allclose(subsequences[0, 1:4, 1], 120.0)
+    assert np.allclose(subsequences[1, 1:3, 3], 60.0)
+    assert np.all(subsequences[1, 3:] == 0.0)
+    assert width_loss == 0 and length_loss == 0
+
+
+def test_encode_notes_skips_downbeat_only_measures():
+    onsets, durations, pitches, counts = notes([0.0, 1.0, 4.0])
+    subsequences, tags, _, _ = encode_notes(onsets, durations, pitches, counts, FOUR_FOUR, TEMPO, 0.0, 0.0, 4, 6)
+    assert [tag[0] for tag in tags] == [0.0]
+
+
+def test_encode_notes_reports_length_loss():
+    onsets, durations, pitches, counts = notes(np.arange(6) * 0.5)
+    subsequences, _, _, length_loss = encode_notes(onsets, durations, pitches, counts, FOUR_FOUR, TEMPO,
+                                                   0.0, 0.0, 4, 6)
+    assert subsequences.shape == (1, 5, 6)
+    assert length_loss == 6
+
+
+def test_encode_notes_empty():
+    subsequences, tags, _, _ = encode_notes([], [], np.zeros((0, 1)), [], FOUR_FOUR, TEMPO, 0.0, 0.0, 4, 6)
+    assert subsequences.shape == (0, 5, 6) and tags == []
+
+
+def test_encode_notes_ragged_matches_padded():
+    onsets, durations, pitches, counts = notes([0.0, 0.5, 1.0, 1.5, 2.0, 8.0, 9.5])
+    padded, tags, _, _ = encode_notes(onsets, durations, pitches, counts, FOUR_FOUR, TEMPO, 0.0, 0.0, 8, 6)
+    lines, row_splits, ragged_tags, width_loss = encode_notes_ragged(onsets, durations, pitches, counts,
+                                                                     FOUR_FOUR, TEMPO, 0.0, 0.0, 6)
+    assert ragged_tags == tags
+    assert np.array_equal(row_splits, [0, 6, 9])
+    for measure in range(len(tags)):
+        measure_lines = lines[row_splits[measure]:row_splits[measure + 1]]
+        assert np.array_equal(measure_lines, padded[measure, :len(measure_lines)])
+    assert width_loss == 0
+
+
+@pytest.mark.parametrize("time_signatures", [[(0.0, 3, 4)], [(0.0, 4, 4), (4.0, 3, 4)]])
+def test_notes_per_measure_matches_encoding(time_signatures):
+    onsets, durations, pitches, counts = notes([0.0, 0.5, 1.0, 3.0, 3.5, 4.0, 6.0, 7.0, 7.5, 10.0])
+    subsequences, _, _, _ = encode_notes(onsets, durations, pitches, counts, time_signatures, TEMPO,
+                                         0.0, 0.0, 16, 6)
+    counts_per_measure = (subsequences[:, 1:, 2] != 0).sum(axis=1)
+    assert np.array_equal(notes_per_measure(onsets, time_signatures), counts_per_measure)
+
+
+def test_quantize_notes_snaps_to_grid():
+    onsets, durations = quantize_notes([0.02, 0.32, 1.0], [0.52, 0.66, 1.01])
+    assert np.allclose(onsets, [0.0, 1 / 3, 1.0])
+    assert np.allclose(durations, [0.5, 1 / 3, 0.25])
+
+
+def test_quantize_notes_keeps_notes_shorter_than_grid():
+    _, durations = quantize_notes([0.0], [0.01], divisors=(4,))
+    assert np.allclose(durations, [0.25])
+
+
+def nearest_boundary_tempo(offset, measure_start, measure_end, change_offsets, change_tempi):
+    # tempo boundaries of the measure, the way music21 metronomeMarkBoundaries() of a measure listed them
+    metronomes = {0.0: change_tempi[np.searchsorted(change_offsets, measure_start, side="right") - 1]}
+    for change_offset, tempo in zip(change_offsets, change_tempi):
+        if measure_start < change_offset < measure_end:
+            metronomes[change_offset - measure_start] = tempo
+    key = min(metronomes.keys(), key=lambda x: abs(x - (offset - measure_start)))
+    return metronomes[key]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_lookup_tempi_matches_nearest_boundary(seed):
+    rng = np.random.default_rng(seed)
+    # offsets on a grid of eighths make ties between boundaries frequent
+    change_offsets = np.unique(np.concatenate(([0.0], rng.integers(1, 64, rng.integers(1, 8)) * 0.5)))
+    change_tempi = rng.integers(40, 200, len(change_offsets)).astype(np.float64)
+    offsets = np.sort(rng.integers(0, 72, 100) * 0.5)
+    starts = np.floor(offsets / 4.0) * 4.0
+
+    tempi = lookup_tempi(offsets, starts, starts + 4.0, change_offsets, change_tempi)
+    expected = [nearest_boundary_tempo(offset, start, start + 4.0, change_offsets, change_tempi)
+                for offset, start in zip(offsets, starts)]
+    assert np.array_equal(tempi, expected)
+
+    in_effect = lookup_tempi(offsets, None, None, change_offsets, change_tempi, nearest=False)
+    assert np.array_equal(in_effect, change_tempi[np.searchsorted(change_offsets, offsets, side="right") - 1])
@@ -0,0 +1,18 @@
+import importlib.util
+from os.path import abspath, dirname
+
+import pytest
+
+import check_imports
+from check_imports import IMPORT_BUDGET, LIGHT_MODULES, measure_import
+
+
+@pytest.mark.parametrize("module", LIGHT_MODULES)
+def test_import_budget(module, monkeypatch):
+    if importlib.util.find_spec("numpy") is None:
+        pytest.skip("numpy is not installed")
+    # modules are imported by a fresh interpreter started in src, the same way check_imports runs them
+    monkeypatch.chdir(dirname(abspath(check_imports.__file__)))
+    result = measure_import(module)
+    assert result["heavy"] == []
+    assert result["time"] <= IMPORT_BUDGET
@@ -0,0 +1,40 @@
+import numpy as np
+
+from RaggedMeasures import RaggedMeasures, bucket_batches
+
+
+def ragged():
+    lines = np.arange(12, dtype=np.float32).reshape(6, 2) + 1.0
+    return RaggedMeasures(lines, [0, 1, 4, 6])
+
+
+def test_pad_to_longest_measure():
+    measures = ragged()
+    padded = measures.pad([2, 0])
+    assert padded.shape == (2, 2, 2)
+    assert np.array_equal(padded[0], measures[2])
+    assert np.array_equal(padded[1, 0], measures[0][0])
+    assert np.all(padded[1, 1] == 0.0)
+
+
+def test_pad_keeps_index_shape_and_truncates():
+    measures = ragged()
+    padded = measures.pad([[1, 2], [0, 1]], length=2)
+    assert padded.shape == (2, 2, 2, 2)
+    assert np.array_equal(padded[0, 0], measures[1][:2])
+    assert np.array_equal(padded[1, 1], measures[1][:2])
+
+
+def test_bucket_batches_cover_all_items_once():
+    lengths = np.random.default_rng(0).integers(1, 30, 1000)
+    batches = bucket_batches(lengths, batch_size=32, pool_batches=4, seed=1)
+    assert np.array_equal(np.sort(np.concatenate(batches)), np.arange(1000))
+    assert all(len(batch) <= 32 for batch in batches)
+
+
+def test_bucket_batches_group_similar_lengths():
+    lengths = np.random.default_rng(0).integers(1, 30, 1000)
+    batches = bucket_batches(lengths, batch_size=32, pool_batches=100, seed=1)
+    spreads = [lengths[batch].max() - lengths[batch].min() for batch in batches]
+    assert max(spreads) <= 2
+    assert bucket_batches(lengths, seed=1)[0].tolist() == bucket_batches(lengths, seed=1)[0].tolist()
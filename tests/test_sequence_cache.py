@@ -0,0 +1,43 @@
+from os import listdir
+
+from SequenceCache import SequenceCache
+
+ENTRY = [("part", b"0" * 1000)]
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache_path = str(tmp_path) + "/"
+    cache = SequenceCache(cache_path, max_size=2500)
+    for key in ("a", "b"):
+        cache.put(key, ENTRY)
+    assert cache.get("a") == ENTRY
+    cache.put("c", ENTRY)
+
+    assert sorted(listdir(cache_path)) == ["a.pkl", "c.pkl"]
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"], stats["hits"], stats["misses"]) == (2, 1, 1, 1)
+    assert stats["size"] <= 2500
+
+
+def test_index_is_restored_from_directory(tmp_path):
+    cache_path = str(tmp_path) + "/"
+    cache = SequenceCache(cache_path, max_size=2500)
+    for key in ("a", "b"):
+        cache.put(key, ENTRY)
+
+    reopened = SequenceCache(cache_path, max_size=2500)
+    assert reopened.stats()["entries"] == 2
+    assert reopened.stats()["size"] == cache.stats()["size"]
+    reopened.clear()
+    assert reopened.stats()["entries"] == 0 and listdir(cache_path) == []
+
+
+def test_key_depends_on_content_and_settings(tmp_path):
+    path = tmp_path / "input.mid"
+    path.write_bytes(b"first")
+    key = SequenceCache.make_key(str(path), {"compact": False})
+    assert SequenceCache.make_key(str(path), {"compact": False}) == key
+    assert SequenceCache.make_key(str(path), {"compact": True}) != key
+    path.write_bytes(b"second")
+    assert SequenceCache.make_key(str(path), {"compact": False}) != key
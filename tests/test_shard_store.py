@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from ShardStore import ShardStore
+
+INDEXING = [3, -1, slice(2, 8), slice(None, None, 3), slice(8, 1, -2), slice(5, 2), [9, 0, 4],
+            np.array([[1, 5], [7, 2]]), np.arange(10) % 3 == 0, (slice(1, 5), 0), (2, 1, 1),
+            ([1, 8], slice(None), 0), (np.array([1, 8]), 2), (Ellipsis, 0), (slice(None), Ellipsis, 1), ()]
+UNSUPPORTED = [([1, 9], [0, 2]), (np.array([[1, 2], [8, 9]]), 0), (slice(None), [0, 1]), ([1, 2], None)]
+
+
+@pytest.fixture
+def stored(tmp_path):
+    data = np.arange(10 * 3 * 2, dtype=np.float32).reshape(10, 3, 2)
+    store = ShardStore(str(tmp_path) + "/")
+    store.write(data, data, 2, 2, shard_size=3)
+    inputs, _ = store.open()
+    return data, inputs
+
+
+@pytest.mark.parametrize("item", INDEXING)
+def test_indexing_matches_numpy(stored, item):
+    data, inputs = stored
+    assert np.array_equal(inputs[item], data[item])
+    assert np.asarray(inputs[item]).shape == data[item].shape
+
+
+@pytest.mark.parametrize("item", UNSUPPORTED)
+def test_unsupported_indexing_raises(stored, item):
+    _, inputs = stored
+    with pytest.raises(IndexError):
+        inputs[item]
+
+
+def test_out_of_bounds(stored):
+    _, inputs = stored
+    with pytest.raises(IndexError):
+        inputs[10]
+    with pytest.raises(IndexError):
+        inputs[[0, 10]]
+
+
+def test_write_rejects_unprepared_data(tmp_path):
+    with pytest.raises(ValueError):
+        ShardStore(str(tmp_path) + "/").write(np.zeros((0, 0, 0)), None, -1, 0)
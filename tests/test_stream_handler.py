@@ -0,0 +1,21 @@
+import numpy as np
+
+from StreamHandler import context_windows
+
+
+def test_context_windows_follow_consecutive_measures():
+    # measures 0-1-2-3 follow each other, measure 5 starts a new part
+    pairs = np.array([[0, 1], [1, 2], [2, 3], [5, 6]])
+    windows = context_windows(pairs, 3)
+    assert windows.tolist() == [[0, 1, 2, 3]]
+
+
+def test_context_windows_of_one_measure_are_pairs():
+    pairs = np.array([[0, 1], [1, 2]])
+    assert np.array_equal(context_windows(pairs, 1), pairs)
+
+
+def test_context_windows_empty():
+    windows = context_windows(np.zeros((0, 2), dtype=np.int64), 3)
+    assert windows.shape == (0, 4)
+    assert windows.dtype == np.int64
@@ -0,0 +1,21 @@
+import pytest
+
+from workers import ordered_map
+
+
+def invert(value):
+    return 1 / value
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_results_keep_task_order(workers):
+    results = list(ordered_map(invert, [(value,) for value in [1, 2, 4, 8]], workers))
+    assert results == [(1.0, None), (0.5, None), (0.25, None), (0.125, None)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failed_task_is_reported_in_place(workers):
+    results = list(ordered_map(invert, [(2,), (0,), (4,)], workers))
+    assert results[0] == (0.5, None)
+    assert results[1][0] is None and "ZeroDivisionError" in results[1][1]
+    assert results[2] == (0.25, None)